@@ -0,0 +1,330 @@
+import http.client
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from cancellation import DownloadCancelled
+
+# Statuses worth another attempt; 429 and 503 also mean the server is throttling us
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+
+_STATUS_RE = re.compile(r'HTTP Error (\d{3})')
+
+INCREASE = 'increase'
+DECREASE = 'decrease'
+
+
+def _errors(error: BaseException):
+    """error and everything it wraps, including yt-dlp's DownloadError.exc_info"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        wrapped = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        error = wrapped or error.__cause__ or error.__context__
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """HTTP status behind an error raised by urllib, the connection pool or yt-dlp"""
+    for e in _errors(error):
+        status = getattr(e, 'status', None) or getattr(e, 'code', None)
+        if isinstance(status, int) and 100 <= status < 600:
+            return status
+    match = _STATUS_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the response behind error, if any"""
+    for e in _errors(error):
+        headers = getattr(e, 'headers', None) or getattr(getattr(e, 'response', None), 'headers', None)
+        value = headers.get('Retry-After') if headers is not None else None
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None  # an HTTP date; fall back to our own backoff
+    return None
+
+
+def is_throttle(error: BaseException) -> bool:
+    return http_status(error) in THROTTLE_STATUSES
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether error is transient: a throttle, a 5xx or a dropped/timed-out connection"""
+    if any(isinstance(e, DownloadCancelled) for e in _errors(error)):
+        return False
+    status = http_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return any(isinstance(e, (ConnectionError, TimeoutError, http.client.IncompleteRead))
+               or type(e).__name__ in ('TransportError', 'IncompleteRead')
+               for e in _errors(error))
+
+
+class Backoff:
+    """Jittered exponential backoff ("full jitter")
+
+    Attempt n waits a uniformly random time up to min(cap, base * 2**n), so
+    many jobs throttled at once don't come back in lockstep. A server's
+    Retry-After wins when it asks for longer.
+    """
+
+    def __init__(self, retries: int = 5, base: float = 1.0, cap: float = 30.0,
+                 rng: Optional[random.Random] = None):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self._random = rng or random.Random()
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        ceiling = min(self.cap, self.base * 2 ** attempt)
+        delay = self._random.uniform(0, ceiling)
+        if error is not None:
+            requested = retry_after(error)
+            if requested is not None:
+                delay = max(delay, min(requested, self.cap))
+        return delay
+
+    def sleep_for(self, n: int) -> float:
+        """yt-dlp retry_sleep_functions signature"""
+        return self.delay(n)
+
+    def ydl_options(self) -> Dict:
+        """yt-dlp options that give its own download retries the same backoff"""
+        # A bound method, so pooled sessions with these options still share a key
+        return {
+            'retries': self.retries,
+            'fragment_retries': self.retries,
+            # Extraction is retried around the whole job, see retry_call
+            'extractor_retries': 0,
+            'retry_sleep_functions': {'http': self.sleep_for, 'fragment': self.sleep_for},
+        }
+
+
+def retry_call(function: Callable, backoff: Backoff, cancel_event: Optional[threading.Event] = None,
+               on_retry: Optional[Callable[[BaseException, int, float], None]] = None):
+    """Call function, retrying transient errors with backoff
+
+    on_retry(error, attempt, delay) runs before each wait. A cancel during
+    the wait raises DownloadCancelled right away.
+    """
+    for attempt in range(backoff.retries + 1):
+        try:
+            return function()
+        except Exception as e:
+            if attempt == backoff.retries or not is_retryable(e):
+                raise
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled() from e
+            delay = backoff.delay(attempt, e)
+            if on_retry is not None:
+                on_retry(e, attempt, delay)
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise DownloadCancelled() from e
+            else:
+                time.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on how many downloads run at once, driven by throughput and throttling
+
+    Downloads hold a slot() while they run and report what happens to them.
+    Every interval seconds the window's outcome decides the limit:
+
+    - any throttle (429/503), or an error rate above error_threshold,
+      multiplies it by decrease and holds it there for a few intervals
+      (a throttle does so at once, at most once per interval);
+    - while every slot is busy it grows by one per interval, as long as the
+      last increase raised aggregate throughput by at least min_gain, and
+      otherwise steps back, since the link (or a rate limit) is saturated.
+
+    Each change is kept in decisions, and passed to on_decision.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16, interval: float = 2.0,
+                 decrease: float = 0.7, min_gain: float = 0.05, error_threshold: float = 0.2,
+                 cooldown: int = 3, on_decision: Optional[Callable[[Dict], None]] = None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.interval = interval
+        self.decrease = decrease
+        self.min_gain = min_gain
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.on_decision = on_decision
+        self.active = 0
+        self.decisions: deque = deque(maxlen=100)
+        self.totals = {'bytes': 0, 'successes': 0, 'errors': 0, 'throttles': 0, 'increases': 0, 'decreases': 0}
+        self.throughput = 0.0
+        self._window = self._new_window()
+        self._last_action: Optional[str] = None
+        self._hold = 0
+        self._decreased = 0.0
+        # When the calling thread's current slot was acquired
+        self._local = threading.local()
+        # Reentrant so on_decision may read the controller from inside a decision
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+
+    @staticmethod
+    def _new_window() -> Dict:
+        return {'start': time.monotonic(), 'bytes': 0, 'successes': 0, 'errors': 0, 'throttles': 0,
+                'saturated': False}
+
+    @contextmanager
+    def slot(self, cancel_event: Optional[threading.Event] = None):
+        """Hold one of the limit slots for the duration of a download"""
+        self.acquire(cancel_event)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def acquire(self, cancel_event: Optional[threading.Event] = None):
+        with self._changed:
+            while self.active >= self.limit:
+                self._window['saturated'] = True
+                self._decide()
+                if cancel_event is not None and cancel_event.is_set():
+                    raise DownloadCancelled()
+                self._changed.wait(0.1)
+            self.active += 1
+            self._local.acquired = time.monotonic()
+            if self.active >= self.limit:
+                self._window['saturated'] = True
+
+    def release(self):
+        with self._changed:
+            self.active -= 1
+            self._changed.notify()
+
+    def byte_counter(self) -> Callable:
+        """Progress hook feeding one download's received bytes into the throughput window"""
+        seen: Dict[str, int] = {}
+
+        def hook(d):
+            if d.get('status') not in ('downloading', 'finished'):
+                return
+            filename = d.get('filename') or ''
+            total = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+            delta = total - seen.get(filename, 0)
+            seen[filename] = total
+            if delta > 0:
+                self.record_bytes(delta)
+        return hook
+
+    def record_bytes(self, nbytes: int):
+        with self._lock:
+            self._window['bytes'] += nbytes
+            self.totals['bytes'] += nbytes
+            self._decide()
+
+    def record_success(self):
+        with self._lock:
+            self._window['successes'] += 1
+            self.totals['successes'] += 1
+            self._decide()
+
+    def record_error(self, error: BaseException):
+        """Count a failed attempt of the calling thread's download"""
+        throttled = is_throttle(error)
+        key = 'throttles' if throttled else 'errors'
+        acquired = getattr(self._local, 'acquired', None)
+        with self._lock:
+            self.totals[key] += 1
+            if acquired is not None and acquired < self._decreased:
+                return  # sent before the last decrease, which already answered it
+            self._window[key] += 1
+            if throttled and time.monotonic() - self._decreased >= self.interval:
+                # Back off at the first throttle instead of at the end of the window,
+                # but only once per interval, like TCP halving once per round trip
+                self._decrease(f"throttled {self._window['throttles']}x", self._window)
+            self._decide()
+
+    def _decrease(self, reason: str, window: Dict):
+        # Caller holds self._lock
+        self._change(max(self.minimum, int(self.limit * self.decrease)), reason, window)
+
+    def _change(self, limit: int, reason: str, window: Dict):
+        # Caller holds self._lock
+        previous, self.limit = self.limit, limit
+        if limit < previous:
+            self._last_action = DECREASE
+            self._decreased = time.monotonic()
+            self._hold = self.cooldown
+            self.totals['decreases'] += 1
+        elif limit > previous:
+            self._last_action = INCREASE
+            self.totals['increases'] += 1
+        else:
+            return
+        decision = {
+            'time': time.time(),
+            'from': previous,
+            'to': limit,
+            'reason': reason,
+            'throughput': round(self.throughput, 1),
+            'errors': window['errors'],
+            'throttles': window['throttles'],
+        }
+        self.decisions.append(decision)
+        self._changed.notify_all()
+        if self.on_decision is not None:
+            self.on_decision(decision)
+
+    def _decide(self):
+        # Caller holds self._lock
+        window = self._window
+        now = time.monotonic()
+        elapsed = now - window['start']
+        if elapsed < self.interval:
+            return
+        self._window = self._new_window()
+        previous_throughput, self.throughput = self.throughput, window['bytes'] / elapsed
+        attempts = window['successes'] + window['errors']
+        error_rate = window['errors'] / attempts if attempts else 0.0
+
+        if window['throttles']:
+            # Throttles right after a decrease are answered by it already
+            if now - self._decreased >= self.interval:
+                self._decrease(f"throttled {window['throttles']}x", window)
+        elif error_rate > self.error_threshold and window['errors'] > 1:
+            self._decrease(f"error rate {error_rate:.0%}", window)
+        elif self._hold:
+            self._hold -= 1
+        elif not window['saturated'] or not window['bytes']:
+            pass  # free slots left, so more of them would change nothing
+        elif (self._last_action == INCREASE
+              and self.throughput < previous_throughput * (1 + self.min_gain)):
+            self._change(max(self.minimum, self.limit - 1), "no throughput gain", window)
+        elif self.limit < self.maximum:
+            self._change(self.limit + 1, "probing for throughput", window)
+        else:
+            # Steady at the maximum - judge the next increase against this window
+            self._last_action = None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'active': self.active,
+                'minimum': self.minimum,
+                'maximum': self.maximum,
+                'throughput': round(self.throughput, 1),
+                'totals': dict(self.totals),
+                'decisions': list(self.decisions),
+            }
+
+    def history(self) -> List[Dict]:
+        with self._lock:
+            return list(self.decisions)
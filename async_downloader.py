@@ -0,0 +1,223 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from cancellation import CancelToken, DownloadCancelled, KEEP_PARTIAL
+from job_queue import QUEUED, RUNNING, DONE, FAILED, CANCELLED, FINISHED_STATES
+from main import YouTubeDownloader
+from probe import ProbeRecord, probe_url
+
+
+class AsyncDownload:
+    """Handle of a download scheduled on an AsyncYouTubeDownloader
+
+    Await it for the result, iterate it (once) for progress events and call
+    cancel() to stop it. Progress from the worker thread is coalesced so a
+    slow consumer sees the latest state instead of an ever-growing backlog.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, kind: str, url: str,
+                 partial_policy: str = KEEP_PARTIAL):
+        self.kind = kind
+        self.url = url
+        self.state = QUEUED
+        self.cancel_event = CancelToken(partial_policy)
+        self.cancel_requested = False
+        self.task: Optional[asyncio.Task] = None
+        self._loop = loop
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._latest: Optional[Dict] = None
+        self._flush_pending = False
+        self._lock = threading.Lock()
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook; runs on the worker thread"""
+        event = {
+            'status': d.get('status'),
+            'filename': d.get('filename'),
+            'downloaded_bytes': d.get('downloaded_bytes') or 0,
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate') or 0,
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+        }
+        if event['status'] == 'downloading':
+            with self._lock:
+                self._latest = event
+                if self._flush_pending:
+                    return
+                self._flush_pending = True
+            self._loop.call_soon_threadsafe(self._flush)
+        else:
+            self._loop.call_soon_threadsafe(self._emit, event)
+
+    def _flush(self):
+        with self._lock:
+            event, self._latest = self._latest, None
+            self._flush_pending = False
+        if event is not None:
+            self._events.put_nowait(event)
+
+    def _emit(self, event: Dict):
+        # Deliver any pending 'downloading' event first to keep events in order
+        self._flush()
+        self._events.put_nowait(event)
+
+    async def progress(self) -> AsyncIterator[Dict]:
+        """Progress events until the final 'done', 'failed' or 'cancelled' event"""
+        while True:
+            event = await self._events.get()
+            yield event
+            if event['status'] in FINISHED_STATES:
+                return
+
+    def __aiter__(self) -> AsyncIterator[Dict]:
+        return self.progress()
+
+    def __await__(self):
+        return self._outcome().__await__()
+
+    async def _outcome(self) -> str:
+        try:
+            return await self.task
+        except asyncio.CancelledError:
+            # A queued download stopped by cancel() ends as a cancelled task
+            if self.cancel_requested and self.task.cancelled():
+                raise DownloadCancelled() from None
+            raise
+
+    def cancel(self):
+        """Stop the download; awaiting it then raises DownloadCancelled
+
+        A running download is interrupted in whatever stage it is in. Safe to
+        call from any thread.
+        """
+        self.cancel_requested = True
+        self.cancel_event.set()
+        self._loop.call_soon_threadsafe(self._cancel_queued)
+
+    def _cancel_queued(self):
+        # Not started yet - don't wait for a concurrency slot just to give up
+        if self.state == QUEUED and self.task is not None:
+            self.task.cancel()
+
+    @property
+    def cancel_latency(self) -> Optional[float]:
+        """Seconds from cancel() until the worker thread had stopped"""
+        return self.cancel_event.latency
+
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+    def result(self) -> str:
+        if self.cancel_requested and self.task.cancelled():
+            raise DownloadCancelled()
+        return self.task.result()
+
+
+class AsyncYouTubeDownloader:
+    """Awaitable wrapper around YouTubeDownloader for asyncio services
+
+    At most max_concurrent downloads run at once, each on a worker thread;
+    any number of further downloads wait on the limiter as plain coroutines.
+    """
+
+    def __init__(self, download_path: str = "./downloads", max_concurrent: int = 4,
+                 downloader: Optional[YouTubeDownloader] = None, max_probes: int = 4, **kwargs):
+        self.downloader = downloader or YouTubeDownloader(download_path, quiet=True, **kwargs)
+        self.max_concurrent = max(1, max_concurrent)
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='nm-tube-download')
+        # Format lookups shouldn't queue behind long downloads
+        self._probes = ThreadPoolExecutor(max_workers=max(1, max_probes), thread_name_prefix='nm-tube-probe')
+
+    @property
+    def limiter(self) -> asyncio.Semaphore:
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_concurrent)
+        return self._limiter
+
+    async def get_available_formats(self, url: str) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._probes, self.downloader.get_available_formats, url)
+
+    async def probe(self, urls: Iterable[str]) -> List[ProbeRecord]:
+        """Compact records for many URLs, probed concurrently on the format lookup threads"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            loop.run_in_executor(self._probes, probe_url, url, self.downloader.info_cache,
+                                 self.downloader.sessions) for url in urls))
+
+    def submit_video(self, url: str, **kwargs) -> AsyncDownload:
+        """Schedule download_video and return its handle right away"""
+        return self._submit('video', self.downloader.download_video, url, kwargs)
+
+    def submit_audio(self, url: str, **kwargs) -> AsyncDownload:
+        return self._submit('audio', self.downloader.download_audio, url, kwargs)
+
+    def submit_playlist(self, url: str, **kwargs) -> AsyncDownload:
+        return self._submit('playlist', self.downloader.download_playlist, url, kwargs)
+
+    async def download_video(self, url: str, **kwargs) -> str:
+        return await self.submit_video(url, **kwargs)
+
+    async def download_audio(self, url: str, **kwargs) -> str:
+        return await self.submit_audio(url, **kwargs)
+
+    async def download_playlist(self, url: str, **kwargs) -> str:
+        return await self.submit_playlist(url, **kwargs)
+
+    def _submit(self, kind: str, method: Callable, url: str, kwargs: Dict) -> AsyncDownload:
+        loop = asyncio.get_running_loop()
+        handle = AsyncDownload(loop, kind, url, kwargs.pop('partial_policy', KEEP_PARTIAL))
+        call = functools.partial(method, url, progress_hooks=[handle.progress_hook],
+                                 cancel_event=handle.cancel_event, **kwargs)
+        handle.task = loop.create_task(self._run(handle, call))
+        return handle
+
+    async def _run(self, handle: AsyncDownload, call: Callable) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.limiter:
+                handle.state = RUNNING
+                future = loop.run_in_executor(self._executor, call)
+                try:
+                    # Shielded so the slot is held until the thread has really stopped
+                    result = await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    handle.cancel_event.set()
+                    # Let the thread notice; the DownloadCancelled it raises is expected
+                    await asyncio.gather(future, return_exceptions=True)
+                    raise
+        except asyncio.CancelledError:
+            # Awaiting the handle reports a cancel() like one seen by the thread (see _outcome)
+            self._finish(handle, CANCELLED, error=str(DownloadCancelled()))
+            raise
+        except DownloadCancelled as e:
+            self._finish(handle, CANCELLED, error=str(e))
+            raise
+        except Exception as e:
+            self._finish(handle, FAILED, error=str(e))
+            raise
+        self._finish(handle, DONE, result=result)
+        return result
+
+    @staticmethod
+    def _finish(handle: AsyncDownload, state: str, result: Optional[str] = None, error: Optional[str] = None):
+        if state == CANCELLED:
+            handle.cancel_event.release()
+        handle.state = state
+        handle._emit({'status': state, 'result': result, 'error': error})
+
+    async def close(self):
+        """Wait for running downloads and release the worker threads"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        self._probes.shutdown(wait=False)
+
+    async def __aenter__(self) -> 'AsyncYouTubeDownloader':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
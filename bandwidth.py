@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Optional
+
+from cancellation import CancelToken, DownloadCancelled
+
+PRIORITIES = {'low': -1, 'normal': 0, 'high': 1}
+
+
+class _JobState:
+    def __init__(self, weight: float, priority: int):
+        self.weight = max(weight, 0.001)
+        self.priority = priority
+        self.finish_tag = 0.0
+        self.total_bytes = 0
+        self.samples: deque = deque()
+        self.aborted = False
+
+
+class BandwidthScheduler:
+    """Process-wide token bucket shared by all active downloads
+
+    Jobs waiting for bandwidth are served strictly by priority and, within
+    a priority, by weighted fair queueing, so a job with weight 2 gets twice
+    the bytes of a job with weight 1 while both are busy. rate=None means
+    unlimited; it can be changed at any time with set_rate().
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 rate_window: float = 3.0):
+        self._cond = threading.Condition()
+        self._jobs: Dict[Hashable, _JobState] = {}
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self.rate_window = rate_window
+        self.rate: Optional[float] = None
+        self.burst = 0.0
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: Optional[float], burst: Optional[float] = None):
+        """Change the global cap in bytes per second; None or 0 removes it"""
+        with self._cond:
+            self._refill()
+            self.rate = rate if rate and rate > 0 else None
+            # Default burst of a quarter second keeps the limiter smooth
+            self.burst = burst if burst is not None else (self.rate or 0) / 4
+            self._tokens = min(self._tokens, self.burst)
+            self._cond.notify_all()
+
+    def register(self, job_id: Hashable, weight: float = 1.0, priority: int = 0):
+        with self._cond:
+            state = self._jobs.get(job_id)
+            if state is None:
+                self._jobs[job_id] = _JobState(weight, priority)
+            else:
+                state.weight = max(weight, 0.001)
+                state.priority = priority
+            self._cond.notify_all()
+
+    def abort(self, job_id: Hashable):
+        """Wake job_id if it is waiting for bandwidth and make it raise DownloadCancelled"""
+        with self._cond:
+            state = self._jobs.get(job_id)
+            if state is not None:
+                state.aborted = True
+                self._cond.notify_all()
+
+    def unregister(self, job_id: Hashable):
+        with self._cond:
+            self._jobs.pop(job_id, None)
+
+    def _refill(self):
+        # Caller holds self._cond
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def consume(self, job_id: Hashable, nbytes: int):
+        """Account nbytes for job_id, blocking until the bucket allows it"""
+        if nbytes <= 0:
+            return
+        with self._cond:
+            state = self._jobs.get(job_id)
+            if state is None:
+                state = self._jobs[job_id] = _JobState(1.0, 0)
+
+            if self.rate is not None:
+                state.finish_tag = max(state.finish_tag, self._virtual_time) + nbytes / state.weight
+                waiter = [-state.priority, state.finish_tag, next(self._seq)]
+                heapq.heappush(self._waiters, waiter)
+                while True:
+                    self._refill()
+                    if state.aborted:
+                        self._waiters.remove(waiter)
+                        heapq.heapify(self._waiters)
+                        self._cond.notify_all()
+                        raise DownloadCancelled()
+                    if self.rate is None:
+                        break
+                    head = self._waiters[0]
+                    if head is waiter and self._tokens > 0:
+                        break
+                    # Only the head knows how long it must wait; others sleep until woken
+                    self._cond.wait(-self._tokens / self.rate if head is waiter else None)
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                # Tokens may go negative for large reads; later callers repay the debt
+                if self.rate is not None:
+                    self._tokens -= nbytes
+                self._virtual_time = waiter[1]
+                self._cond.notify_all()
+
+            now = time.monotonic()
+            state.total_bytes += nbytes
+            state.samples.append((now, nbytes))
+            while state.samples and now - state.samples[0][0] > self.rate_window:
+                state.samples.popleft()
+
+    def job_rate(self, job_id: Hashable) -> float:
+        """Achieved bytes per second for job_id over the recent window"""
+        with self._cond:
+            state = self._jobs.get(job_id)
+            if state is None:
+                return 0.0
+            now = time.monotonic()
+            recent = sum(n for t, n in state.samples if now - t <= self.rate_window)
+        return recent / self.rate_window
+
+    def rates(self) -> Dict[Hashable, float]:
+        with self._cond:
+            job_ids = list(self._jobs)
+        return {job_id: self.job_rate(job_id) for job_id in job_ids}
+
+    def progress_hook(self, job_id: Hashable) -> Callable:
+        """yt-dlp progress hook that draws each received chunk from the bucket"""
+        received: Dict[str, int] = {}
+        lock = threading.Lock()
+
+        def hook(d):
+            if d.get('status') == 'finished':
+                # Forget finished files so a long playlist's job doesn't keep one each
+                with lock:
+                    received.pop(d.get('filename') or '', None)
+            if d.get('status') != 'downloading':
+                return
+            # Keyed by the final name, which the finished report carries too
+            filename = d.get('filename') or ''
+            downloaded = d.get('downloaded_bytes') or 0
+            with lock:
+                delta = downloaded - received.get(filename, 0)
+                # Parallel segments can report out of order; skip stale totals
+                if delta <= 0:
+                    return
+                received[filename] = downloaded
+            self.consume(job_id, delta)
+
+        return hook
+
+    @contextmanager
+    def track(self, job_id: Hashable, weight: float = 1.0, priority: int = 0,
+              cancel_event: Optional[threading.Event] = None):
+        """Register job_id for the duration of the block and yield its progress hook
+
+        The scheduler is shared by the whole process, so callers key their
+        jobs by (source, id), e.g. ('gui', job.id), to keep them apart.
+        Cancelling a CancelToken cancel_event releases a job stuck waiting for tokens.
+        """
+        self.register(job_id, weight, priority)
+        unregister = (cancel_event.on_cancel(lambda: self.abort(job_id))
+                      if isinstance(cancel_event, CancelToken) else None)
+        try:
+            yield self.progress_hook(job_id)
+        finally:
+            if unregister is not None:
+                unregister()
+            self.unregister(job_id)
+
+
+_scheduler: Optional[BandwidthScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> BandwidthScheduler:
+    """Scheduler shared by every download in the process"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BandwidthScheduler()
+        return _scheduler
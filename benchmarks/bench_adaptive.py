@@ -0,0 +1,100 @@
+"""Adaptive concurrency and retries against a local server that throttles and slows down.
+
+Downloads a playlist from a MediaServer that answers 429 above a number of
+concurrent streams, fails some requests with 500 and shares a fixed link
+rate between responses, with fixed parallelism (with and without retries)
+and with the adaptive controller. Prints failures, throughput and every
+decision the controller made.
+
+    python benchmarks/bench_adaptive.py [--entries 24] [--size-kb 512] 2>/dev/null
+
+yt-dlp reports every failed attempt on stderr, hence the redirect.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from info_cache import InfoCache
+from session_pool import YoutubeDLPool
+
+from bench_downloads import BenchDownloader
+from local_media import MediaServer, stub_factory
+
+KB = 1024
+MB = 1024 * KB
+
+
+def run(server: MediaServer, playlist_url: str, **options) -> Dict:
+    folder = tempfile.mkdtemp(prefix='nm-tube-adaptive-')
+    sessions = YoutubeDLPool(factory=stub_factory)
+    try:
+        downloader = BenchDownloader(folder, info_cache=InfoCache(':memory:'), sessions=sessions, quiet=True,
+                                     **options)
+        # Short windows and retry waits so a run takes seconds, not minutes
+        downloader.backoff.base, downloader.backoff.cap = 0.2, 2.0
+        if downloader.concurrency is not None:
+            downloader.concurrency.interval = 0.5
+        server.reset()
+        start = time.perf_counter()
+        summary = downloader.download_playlist(playlist_url, stream=False)
+        elapsed = time.perf_counter() - start
+        downloader.archive.close()
+        return {
+            'summary': summary.split(': ', 1)[1],
+            'elapsed': elapsed,
+            'throughput': server.bytes_sent / elapsed,
+            'throttled': server.throttled,
+            'failed_requests': server.failed,
+            'peak_streams': server.peak_streams,
+            'retries': downloader.get_metrics()['totals']['retries'],
+            'decisions': downloader.concurrency.history() if downloader.concurrency is not None else [],
+        }
+    finally:
+        sessions.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def report(name: str, result: Dict):
+    print(f"\n{name}")
+    print(f"  {result['summary']}")
+    print(f"  {result['throughput'] / MB:.2f} MB/s, peak {result['peak_streams']} streams, "
+          f"{result['throttled']} x 429, {result['failed_requests']} x 500, {result['retries']} retries")
+    for decision in result['decisions']:
+        print(f"  limit {decision['from']:>2} -> {decision['to']:<2} {decision['reason']} "
+              f"({decision['throughput'] / MB:.2f} MB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=24)
+    parser.add_argument('--size-kb', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=8, help="fixed parallelism, and the adaptive maximum")
+    args = parser.parse_args()
+
+    def playlist(server: MediaServer, playlist_id: str) -> str:
+        return server.playlist_url(playlist_id, args.entries, args.size_kb * KB)
+
+    with MediaServer(max_streams=3, error_rate=0.05, link_rate=6 * MB, rate=1 * MB) as server:
+        print(f"Throttling server: 429 above 3 streams, 5% 500s, {args.entries} x {args.size_kb} KB")
+        report(f"fixed {args.workers}, no retries",
+               run(server, playlist(server, 'nr'), max_workers=args.workers, adaptive=False, retries=0))
+        report(f"fixed {args.workers}, jittered retries",
+               run(server, playlist(server, 'fr'), max_workers=args.workers, adaptive=False))
+        report(f"adaptive, 1..{args.workers}",
+               run(server, playlist(server, 'ad'), max_workers=args.workers, max_parallel=args.workers))
+
+    with MediaServer(link_rate=4 * MB, rate=1 * MB) as server:
+        print("\nSaturated link: 1 MB/s per stream, 4 MB/s in total")
+        report("fixed 1", run(server, playlist(server, 'f1'), max_workers=1, adaptive=False))
+        report(f"adaptive, starting at 1, up to {args.workers * 2}",
+               run(server, playlist(server, 'a1'), max_workers=1, max_parallel=args.workers * 2))
+
+
+if __name__ == "__main__":
+    main()
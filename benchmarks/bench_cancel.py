@@ -0,0 +1,157 @@
+"""Cancellation latency benchmarks against a local media server.
+
+Cancels downloads while they sit in each stage (metadata extraction,
+playlist listing, a slow transfer, a bandwidth-limited wait) and reports
+how long the worker takes to stop, once with a CancelToken and once with
+a plain threading.Event, which only takes effect at the next progress
+update. Also reports the partial files a cancelled download leaves behind
+under each partial-file policy.
+
+    python benchmarks/bench_cancel.py [--runs 3] [--max-latency-ms 500]   # exit 1 above the bound
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bandwidth import get_scheduler
+from cancellation import CancelToken, DELETE_PARTIAL, DownloadCancelled, KEEP_PARTIAL
+from info_cache import InfoCache
+from main import YouTubeDownloader
+from session_pool import YoutubeDLPool
+
+from bench_downloads import BenchDownloader
+from local_media import MediaServer, stub_factory
+
+KB = 1024
+MB = 1024 * KB
+
+
+def partial_files(folder: str) -> List[str]:
+    return [name for _, _, files in os.walk(folder) for name in files
+            if name.endswith(('.part', '.segments', '.ytdl'))]
+
+
+class CancelBench:
+    def __init__(self, server: MediaServer, runs: int, wait: float):
+        self.server = server
+        self.runs = runs
+        self.wait = wait
+        self.sessions = YoutubeDLPool(factory=stub_factory)
+        self._ids = 0
+
+    def new_id(self, prefix: str) -> str:
+        self._ids += 1
+        return f'{prefix}{self._ids}'
+
+    def cancel_once(self, call: Callable[[YouTubeDownloader, threading.Event], object], token: bool,
+                    policy: str = KEEP_PARTIAL, started: Callable[[], bool] = lambda: True) -> Dict:
+        """Start call, cancel it self.wait seconds after started() and time the stop"""
+        folder = tempfile.mkdtemp(prefix='nm-tube-cancel-')
+        try:
+            downloader = BenchDownloader(folder, info_cache=InfoCache(':memory:'), sessions=self.sessions,
+                                         quiet=True)
+            cancel_event = CancelToken(policy) if token else threading.Event()
+            outcome = {}
+
+            def run():
+                try:
+                    call(downloader, cancel_event)
+                    outcome['status'] = 'finished'
+                except DownloadCancelled:
+                    outcome['status'] = 'cancelled'
+                except Exception as e:
+                    outcome['status'] = f'error: {e}'
+
+            self.server.reset()
+            worker = threading.Thread(target=run, daemon=True)
+            worker.start()
+            while not started() and worker.is_alive():
+                time.sleep(0.001)
+            time.sleep(self.wait)
+            cancelled = time.perf_counter()
+            cancel_event.set()
+            worker.join()
+            latency = time.perf_counter() - cancelled
+            if token:
+                cancel_event.release()
+            downloader.archive.close()
+            return {'latency_ms': latency * 1e3, 'status': outcome.get('status'),
+                    'partials': len(partial_files(folder))}
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def measure(self, call: Callable, token: bool, **kwargs) -> Dict:
+        samples = [self.cancel_once(call, token, **kwargs) for _ in range(self.runs)]
+        return {'latency_ms': statistics.median(s['latency_ms'] for s in samples),
+                'status': samples[-1]['status'], 'partials': samples[-1]['partials']}
+
+    def scenarios(self) -> Dict[str, Dict]:
+        transferring = lambda: self.server.first_byte is not None  # noqa: E731
+        return {
+            'extraction (2 s)': dict(call=lambda d, c: d.download_video(
+                self.server.video_url(self.new_id('slow'), 64 * KB, delay=2), cancel_event=c)),
+            'playlist listing (2 s page)': dict(call=lambda d, c: d.download_playlist(
+                self.server.playlist_url(self.new_id('list'), 10, 64 * KB, page_delay=2), cancel_event=c)),
+            'segmented transfer, 4 x 128 KB/s': dict(call=lambda d, c: self.throttled(
+                lambda: d.download_video(self.server.video_url(self.new_id('seg'), 16 * MB),
+                                         connections=4, cancel_event=c)), started=transferring),
+            'yt-dlp transfer, 128 KB/s': dict(call=lambda d, c: self.throttled(
+                lambda: d.download_video(self.server.video_url(self.new_id('ytdl'), 16 * MB),
+                                         connections=1, cancel_event=c)), started=transferring),
+            'bandwidth limit, 32 KB/s': dict(call=lambda d, c: self.rate_limited(
+                lambda: d.download_video(self.server.video_url(self.new_id('limit'), 16 * MB),
+                                         connections=4, cancel_event=c)), started=transferring),
+        }
+
+    def throttled(self, call: Callable):
+        self.server.rate = 128 * KB
+        try:
+            return call()
+        finally:
+            self.server.rate = None
+
+    @staticmethod
+    def rate_limited(call: Callable):
+        get_scheduler().set_rate(32 * KB)
+        try:
+            return call()
+        finally:
+            get_scheduler().set_rate(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--wait', type=float, default=0.3, help="seconds into the stage before cancelling")
+    parser.add_argument('--max-latency-ms', type=float, help="fail if a CancelToken takes longer")
+    args = parser.parse_args()
+
+    slow = []
+    with MediaServer() as server:
+        bench = CancelBench(server, args.runs, args.wait)
+        print(f"{'stage':<36}{'token ms':>10}{'event ms':>10}{'kept':>6}{'deleted':>9}")
+        for name, scenario in bench.scenarios().items():
+            token = bench.measure(token=True, **scenario)
+            event = bench.measure(token=False, **scenario)
+            deleted = bench.measure(token=True, policy=DELETE_PARTIAL, **scenario)
+            print(f"{name:<36}{token['latency_ms']:>10.1f}{event['latency_ms']:>10.1f}"
+                  f"{token['partials']:>6}{deleted['partials']:>9}")
+            if args.max_latency_ms and token['latency_ms'] > args.max_latency_ms:
+                slow.append(f"{name}: {token['latency_ms']:.1f} ms")
+        bench.sessions.close()
+    print("\nkept/deleted: partial files left with the keep and delete policies")
+    for line in slow:
+        print(f"TOO SLOW: {line}")
+    sys.exit(1 if slow else 0)
+
+
+if __name__ == "__main__":
+    main()
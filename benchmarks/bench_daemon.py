@@ -0,0 +1,107 @@
+"""Per-job latency of a warm daemon against a fresh process per download.
+
+Downloads the same small video from the local media server three ways:
+in a new interpreter that imports everything and downloads (what one CLI
+run costs), by a `main.py submit --wait` client process talking to a warm
+DownloadDaemon, and by a DaemonClient that is already running.
+
+    python benchmarks/bench_daemon.py [--jobs 5] [--size-kb 256]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from daemon import DaemonClient, DownloadDaemon
+from info_cache import InfoCache
+from session_pool import YoutubeDLPool
+
+from bench_downloads import BenchDownloader
+from local_media import MediaServer, stub_factory
+
+KB = 1024
+
+COLD_RUN = """
+import sys
+sys.path[:0] = [{root!r}, {bench!r}]
+from info_cache import InfoCache
+from session_pool import YoutubeDLPool
+from bench_downloads import BenchDownloader
+from local_media import stub_factory
+downloader = BenchDownloader({folder!r}, info_cache=InfoCache(':memory:'),
+                             sessions=YoutubeDLPool(factory=stub_factory), quiet=True)
+downloader.download_video({url!r})
+"""
+
+
+def timed(call: Callable[[], object], jobs: int) -> List[float]:
+    samples = []
+    for _ in range(jobs):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=5)
+    parser.add_argument('--size-kb', type=int, default=256)
+    parser.add_argument('--port', type=int, default=18765)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='nm-tube-daemon-')
+    ids = iter(range(1, 1 << 20))
+    try:
+        with MediaServer() as server:
+            def url() -> str:
+                return server.video_url(f'job{next(ids)}', args.size_kb * KB)
+
+            def cold():
+                subprocess.run([sys.executable, '-c', COLD_RUN.format(root=ROOT, bench=BENCH, folder=folder,
+                                                                      url=url())], check=True)
+
+            sessions = YoutubeDLPool(factory=stub_factory)
+            downloader = BenchDownloader(folder, info_cache=InfoCache(':memory:'), sessions=sessions, quiet=True)
+            daemon = DownloadDaemon(downloader, max_concurrent=4)
+            daemon.serve(args.port)
+            daemon.warmup.wait()
+            client = DaemonClient(args.port)
+
+            def client_process():
+                subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), 'submit', '--wait',
+                                '--port', str(args.port), url()], check=True, stdout=subprocess.DEVNULL)
+
+            def warm_client():
+                record = client.wait(client.submit(url())['id'])
+                if record['state'] != 'done':
+                    raise RuntimeError(record['error'])
+
+            results = {
+                'fresh process per download': timed(cold, args.jobs),
+                'main.py submit --wait': timed(client_process, args.jobs),
+                'DaemonClient (in process)': timed(warm_client, args.jobs),
+            }
+            client.close()
+            daemon.shutdown()
+            sessions.close()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print(f"{args.jobs} downloads of {args.size_kb} KB each")
+    print(f"{'path':<30}{'median ms':>12}{'min ms':>10}")
+    for name, samples in results.items():
+        print(f"{name:<30}{statistics.median(samples) * 1e3:>12.1f}{min(samples) * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Disk footprint, write I/O and hashing cost of the content store.
+
+Mirrors two playlists into one download folder, with and without
+deduplication: one pair shares the same videos (the second playlist is
+linked from the archive), the other has different IDs serving identical
+bytes, like re-uploads (found by hashing the finished files). Then times a
+segmented download with and without the streaming hash, against hashing
+the finished file in a second read pass.
+
+    python benchmarks/bench_dedupe.py [--entries 8] [--size-mb 8]
+
+Write I/O is the wchar counter of /proc/self/io (Linux), which counts
+every byte handed to write(), including SQLite's.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_store import hash_file
+from info_cache import InfoCache
+from session_pool import YoutubeDLPool
+
+from bench_downloads import BenchDownloader
+from local_media import MediaServer, stub_factory
+
+MB = 1024 * 1024
+
+
+def written_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/io', encoding='ascii') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('wchar:'))
+    except (OSError, StopIteration):
+        return None
+
+
+def disk_usage(folder: str) -> Dict:
+    """Media files, their apparent size and the blocks they take, counting shared inodes once"""
+    files, apparent, inodes = 0, 0, {}
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in filenames:
+            stat = os.stat(os.path.join(dirpath, filename))
+            files += 1
+            apparent += stat.st_size
+            inodes[(stat.st_dev, stat.st_ino)] = stat.st_blocks * 512
+    return {'files': files, 'apparent': apparent, 'on_disk': sum(inodes.values())}
+
+
+def mirror(server: MediaServer, first: str, second: str, dedupe: bool) -> Dict:
+    folder = tempfile.mkdtemp(prefix='nm-tube-dedupe-')
+    sessions = YoutubeDLPool(factory=stub_factory)
+    try:
+        downloader = BenchDownloader(folder, info_cache=InfoCache(':memory:'), sessions=sessions, quiet=True,
+                                     dedupe=dedupe)
+        server.reset()
+        written = written_bytes()
+        start = time.perf_counter()
+        downloader.download_playlist(first)
+        summary = downloader.download_playlist(second)
+        elapsed = time.perf_counter() - start
+        written = written_bytes() - written if written is not None else None
+        downloader.archive.close()
+        if downloader.store is not None:
+            downloader.store.close()
+        return {'summary': summary.split(': ', 1)[1], 'elapsed': elapsed, 'sent': server.bytes_sent,
+                'written': written, **disk_usage(folder)}
+    finally:
+        sessions.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def report(name: str, result: Dict):
+    written = f"{result['written'] / MB:.1f}" if result['written'] is not None else "n/a"
+    print(f"{name:<34}{result['files']:>6}{result['apparent'] / MB:>13.1f}{result['on_disk'] / MB:>9.1f}"
+          f"{result['sent'] / MB:>9.1f}{written:>12}{result['elapsed']:>8.2f}")
+    print(f"{'':<34}second playlist: {result['summary']}")
+
+
+def hashing_cost(server: MediaServer, size: int, runs: int):
+    print(f"\nOne {size // MB} MB video over 4 connections, best of {runs}")
+    for name, dedupe in (('no hashing', False), ('hashed while written', True)):
+        best, read_pass = None, None
+        for run in range(runs):
+            folder = tempfile.mkdtemp(prefix='nm-tube-hash-')
+            sessions = YoutubeDLPool(factory=stub_factory)
+            try:
+                downloader = BenchDownloader(folder, info_cache=InfoCache(':memory:'), sessions=sessions,
+                                             quiet=True, dedupe=dedupe, adaptive=False)
+                start = time.perf_counter()
+                downloader.download_video(server.video_url(f'hash{dedupe:d}{run}', size))
+                elapsed = time.perf_counter() - start
+                best = min(best or elapsed, elapsed)
+                if not dedupe:
+                    path = next(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.mp4'))
+                    start = time.perf_counter()
+                    hash_file(path)
+                    elapsed = time.perf_counter() - start
+                    read_pass = min(read_pass or elapsed, elapsed)
+                downloader.archive.close()
+            finally:
+                sessions.close()
+                shutil.rmtree(folder, ignore_errors=True)
+        print(f"  {name:<24}{best * 1e3:8.1f} ms  ({size / best / MB:.0f} MB/s)")
+        if read_pass is not None:
+            print(f"  {'+ hashing after, cached':<24}{read_pass * 1e3:8.1f} ms  "
+                  f"(a read pass of the whole file; from disk it costs a full re-read)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=8)
+    parser.add_argument('--size-mb', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    size = args.size_mb * MB
+
+    with MediaServer() as server:
+        print(f"Two playlists of {args.entries} x {args.size_mb} MB into one folder")
+        print(f"{'':<34}{'files':>6}{'apparent MB':>13}{'disk MB':>9}{'sent MB':>9}{'written MB':>12}"
+              f"{'s':>8}")
+        for dedupe in (False, True):
+            shared = mirror(server, server.playlist_url('mirror-a', args.entries, size, videos='shared'),
+                            server.playlist_url('mirror-b', args.entries, size, videos='shared'), dedupe)
+            report(f"same videos, dedupe {'on' if dedupe else 'off'}", shared)
+        for dedupe in (False, True):
+            reuploads = mirror(server, server.playlist_url('orig', args.entries, size, content='same'),
+                               server.playlist_url('reup', args.entries, size, content='same'), dedupe)
+            report(f"re-uploads, dedupe {'on' if dedupe else 'off'}", reuploads)
+
+        hashing_cost(server, 64 * MB, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""End-to-end download benchmarks against a local media server.
+
+Runs YouTubeDownloader.download_video, download_audio and download_playlist
+through the real yt-dlp, segmented and archive code paths, with a stub
+extractor injected through the session pool factory, so no network is
+used and results are reproducible. Also times the per-chunk progress hooks.
+
+    python benchmarks/bench_downloads.py [--size-mb 32] [--runs 3] [--json out.json]
+    python benchmarks/bench_downloads.py --baseline out.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bandwidth import BandwidthScheduler
+from info_cache import InfoCache
+from job_queue import DownloadCancelled, DownloadJob
+from main import YouTubeDownloader
+from session_pool import YoutubeDLPool
+
+from local_media import MediaServer, stub_factory
+
+MB = 1024 * 1024
+
+
+class BenchDownloader(YouTubeDownloader):
+    """Downloader that keeps audio as downloaded
+
+    The synthetic bytes are not decodable, so the mp3 conversion stage is
+    left out here and audio measures the download path only.
+    """
+
+    @property
+    def transcoder(self) -> None:
+        return None
+
+
+class Bench:
+    def __init__(self, server: MediaServer, runs: int):
+        self.server = server
+        self.runs = runs
+        self.sessions = YoutubeDLPool(factory=stub_factory)
+        self._ids = 0
+
+    def new_id(self, prefix: str) -> str:
+        # Fresh IDs so neither the archive nor the info cache short-circuits a run
+        self._ids += 1
+        return f'{prefix}{self._ids}'
+
+    def downloader(self, folder: str) -> BenchDownloader:
+        return BenchDownloader(folder, info_cache=InfoCache(':memory:'), sessions=self.sessions,
+                               quiet=True)
+
+    def measure(self, call: Callable[[BenchDownloader], object], calls: int = 1) -> Dict:
+        """Median over runs of one timed call against a fresh download folder"""
+        samples = []
+        for _ in range(self.runs):
+            folder = tempfile.mkdtemp(prefix='nm-tube-bench-')
+            try:
+                downloader = self.downloader(folder)
+                self.server.reset()
+                start = time.perf_counter()
+                call(downloader)
+                elapsed = time.perf_counter() - start
+                first_byte = self.server.first_byte
+                transfer = (self.server.last_byte - first_byte) if first_byte else 0.0
+                samples.append({
+                    'elapsed': elapsed,
+                    'bytes': self.server.bytes_sent,
+                    'requests': self.server.requests,
+                    'connections': self.server.connections,
+                    'throughput_mbs': self.server.bytes_sent / elapsed / MB,
+                    'ttfb_ms': (first_byte - start) * 1e3 if first_byte else None,
+                    # Time spent outside the transfer itself: extraction, setup, renames.
+                    # Transfers of many tiny calls are negligible, so those use the mean call time
+                    'overhead_ms': (elapsed if calls > 1 else elapsed - transfer) * 1e3 / calls,
+                })
+                downloader.archive.close()
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+        return {key: statistics.median(s[key] for s in samples) if samples[0][key] is not None else None
+                for key in samples[0]}
+
+    def single_video(self, size: int, connections: int) -> Dict:
+        return self.measure(lambda d: d.download_video(
+            self.server.video_url(self.new_id('video'), size), connections=connections))
+
+    def single_audio(self, size: int) -> Dict:
+        return self.measure(lambda d: d.download_audio(
+            self.server.video_url(self.new_id('audio'), size)))
+
+    def playlist(self, entries: int, size: int, workers: int) -> Dict:
+        return self.measure(lambda d: d.download_playlist(
+            self.server.playlist_url(self.new_id('list'), entries, size), max_workers=workers))
+
+    def concurrent(self, downloads: int, size: int, connections: int) -> Dict:
+        def run(d):
+            urls = [self.server.video_url(self.new_id('conc'), size) for _ in range(downloads)]
+            with ThreadPoolExecutor(max_workers=downloads) as pool:
+                list(pool.map(lambda url: d.download_video(url, connections=connections), urls))
+        return self.measure(run)
+
+    def playlist_first_byte(self, entries: int, page_delay: float, stream: bool) -> Dict:
+        """Time until the first media byte of a long paged playlist, then cancel"""
+        def run(d):
+            cancel = threading.Event()
+            url = self.server.playlist_url(self.new_id('long'), entries, 64 * 1024, page_delay=page_delay)
+
+            def download():
+                try:
+                    d.download_playlist(url, max_workers=2, cancel_event=cancel, stream=stream)
+                except DownloadCancelled:
+                    pass
+
+            worker = threading.Thread(target=download)
+            worker.start()
+            while self.server.first_byte is None and worker.is_alive():
+                time.sleep(0.001)
+            cancel.set()
+            worker.join()
+        return self.measure(run)
+
+    def call_overhead(self, calls: int, handshake: float = 0.0) -> Dict:
+        """Mean time per tiny download; handshake delays every new connection"""
+        def run(d):
+            for _ in range(calls):
+                d.download_video(self.server.video_url(self.new_id('tiny'), 1024), connections=1)
+        self.server.connect_latency = handshake
+        try:
+            return self.measure(run, calls)
+        finally:
+            self.server.connect_latency = 0.0
+
+
+def hook_cost(calls: int) -> Dict:
+    """Nanoseconds per progress callback for the hooks attached to every download"""
+    progress = [{'status': 'downloading', 'filename': 'bench.mp4', 'tmpfilename': 'bench.mp4.part',
+                 'downloaded_bytes': (i + 1) * 65536, 'total_bytes': calls * 65536,
+                 'speed': 8 * MB, 'eta': 1} for i in range(calls)]
+
+    def per_call(hook: Callable) -> float:
+        start = time.perf_counter()
+        for d in progress:
+            hook(d)
+        return (time.perf_counter() - start) / calls * 1e9
+
+    hooks = {'bandwidth throttle (unlimited)': BandwidthScheduler().progress_hook('bench')}
+    try:
+        from gui_app import YouTubeDownloaderGUI
+        job = DownloadJob('bench')
+        hooks['GUI progress_hook'] = lambda d: YouTubeDownloaderGUI.progress_hook(None, job, d)
+    except ImportError:
+        pass  # no tkinter in this environment
+    return {name: per_call(hook) for name, hook in hooks.items()}
+
+
+def run_all(args) -> Dict[str, Dict]:
+    size = int(args.size_mb * MB)
+    results = {}
+    with MediaServer(latency=args.latency_ms / 1e3) as server:
+        bench = Bench(server, args.runs)
+        # Prime the pool and yt-dlp's lazy imports so the first scenario isn't penalised
+        bench.single_video(64 * 1024, 1)
+        results['video, 1 connection'] = bench.single_video(size, 1)
+        results[f'video, {args.connections} connections'] = bench.single_video(size, args.connections)
+        # The audio-only format is an eighth of the video size
+        results['audio'] = bench.single_audio(size * 8)
+        results[f'playlist, {args.entries} x {args.entries_mb:g} MB, {args.workers} workers'] = \
+            bench.playlist(args.entries, int(args.entries_mb * MB), args.workers)
+        results[f'concurrent, {args.concurrent} videos'] = \
+            bench.concurrent(args.concurrent, size // args.concurrent, args.connections)
+        results[f'call overhead, {args.calls} tiny videos'] = bench.call_overhead(args.calls)
+        results[f'call overhead, {args.calls} tiny videos, {args.handshake_ms:g} ms handshakes'] = \
+            bench.call_overhead(args.calls, args.handshake_ms / 1e3)
+        # Only TTFB is meaningful here: the run is cancelled once the first byte arrives
+        pages = (args.long_entries + 99) // 100
+        for stream in (True, False):
+            name = f"long playlist TTFB, {args.long_entries} entries/{pages} pages, {'streamed' if stream else 'resolved'}"
+            results[name] = bench.playlist_first_byte(args.long_entries, args.page_delay_ms / 1e3, stream)
+        results['http pool'] = bench.sessions.http.stats()
+        bench.sessions.close()
+    return results
+
+
+def report(results: Dict[str, Dict], hooks: Dict[str, float]):
+    print(f"{'scenario':<62}{'MB/s':>9}{'TTFB ms':>10}{'overhead ms':>13}{'requests':>10}{'conns':>7}")
+    for name, r in results.items():
+        if name == 'http pool':
+            continue
+        ttfb = f"{r['ttfb_ms']:.1f}" if r['ttfb_ms'] is not None else '-'
+        print(f"{name:<62}{r['throughput_mbs']:>9.1f}{ttfb:>10}{r['overhead_ms']:>13.1f}{r['requests']:>10.0f}"
+              f"{r['connections']:>7.0f}")
+    pool = results['http pool']
+    print(f"\nhttp pool: {pool['requests']} requests over {pool['connections_opened']} connections "
+          f"({pool['reuse_ratio']:.0%} reused, ~{pool['saved_seconds'] * 1e3:.0f} ms of connecting saved)")
+    print()
+    for name, ns in hooks.items():
+        print(f"{name:<62}{ns:>9.0f} ns/call")
+
+
+def compare(results: Dict[str, Dict], hooks: Dict[str, float], baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of throughput, overhead or hook cost beyond tolerance"""
+    regressions = []
+    for name, r in results.items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old or name == 'http pool':
+            continue
+        if r['throughput_mbs'] < old['throughput_mbs'] * (1 - tolerance):
+            regressions.append(f"{name}: {r['throughput_mbs']:.1f} MB/s, was {old['throughput_mbs']:.1f}")
+        if r['overhead_ms'] > old['overhead_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: overhead {r['overhead_ms']:.1f} ms, was {old['overhead_ms']:.1f}")
+    for name, ns in hooks.items():
+        old = baseline.get('hooks', {}).get(name)
+        if old and ns > old * (1 + tolerance):
+            regressions.append(f"{name}: {ns:.0f} ns/call, was {old:.0f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=32, help="size of the single-video file")
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--entries', type=int, default=8)
+    parser.add_argument('--entries-mb', type=float, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrent', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--handshake-ms', type=float, default=30, help="connection setup delay for the handshake run")
+    parser.add_argument('--long-entries', type=int, default=2000, help="entries of the long paged playlist")
+    parser.add_argument('--page-delay-ms', type=float, default=50, help="listing delay per 100-entry page")
+    parser.add_argument('--hook-calls', type=int, default=100000)
+    parser.add_argument('--latency-ms', type=float, default=0, help="added delay per HTTP response")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare against a previous --json file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    results = run_all(args)
+    hooks = hook_cost(args.hook_calls)
+    report(results, hooks)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'scenarios': results, 'hooks': hooks}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, hooks, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
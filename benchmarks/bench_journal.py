@@ -0,0 +1,192 @@
+"""Cost of journaling, and a playlist resumed after its process is killed.
+
+First times journal writes for entry state changes made by many threads:
+the batched JobJournal against committing each change as it happens.
+Then runs a daemon in a child process on a long local playlist, kills it
+with SIGKILL partway through, and starts another one on the same folder,
+which resumes the job from the journal. Reports what the second process
+had to download and checks that every entry ends up on disk exactly once.
+This is done twice: killed while the playlist is still being listed (it
+is listed again, and finished entries are skipped by the archive) and
+after it was listed to the end (only unfinished entries are read back).
+
+    python benchmarks/bench_journal.py [--entries 40] [--size-kb 512] 2>/dev/null
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import download_archive
+from download_archive import ARCHIVE_FILENAME, folder_state_path
+from journal import JOURNAL_FILENAME, JobJournal
+
+from local_media import MediaServer
+
+KB = 1024
+
+DAEMON_RUN = """
+import json, sys, time
+sys.path[:0] = [{root!r}, {bench!r}]
+from daemon import DownloadDaemon
+from info_cache import InfoCache
+from journal import get_journal
+from session_pool import YoutubeDLPool
+from bench_downloads import BenchDownloader
+from local_media import stub_factory
+import download_archive
+download_archive.FOLDER_STATE_DIR = {state!r}
+downloader = BenchDownloader({folder!r}, info_cache=InfoCache(':memory:'), max_workers=2,
+                             sessions=YoutubeDLPool(factory=stub_factory), quiet=True, adaptive=False)
+daemon = DownloadDaemon(downloader, max_concurrent=1, journal=get_journal({folder!r}))
+resumed = daemon.resume()
+jobs = resumed or [daemon.submit({url!r}, 'playlist')]
+start = time.perf_counter()
+daemon.queue.wait()
+print(json.dumps({{'resumed': bool(resumed), 'state': jobs[0].state, 'result': jobs[0].result, 'error': jobs[0].error,
+                   'elapsed': time.perf_counter() - start}}))
+"""
+
+
+def write_cost(changes: int, threads: int):
+    folder = tempfile.mkdtemp(prefix='nm-tube-journal-')
+    try:
+        journal = JobJournal(os.path.join(folder, 'batched.sqlite'))
+        key = journal.add('http://example.invalid/list', 'playlist', {}, 'bench')
+        entries = journal.playlist(key)
+        conn = sqlite3.connect(os.path.join(folder, 'direct.sqlite'), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE entries (idx INTEGER PRIMARY KEY, state TEXT, partial TEXT, updated REAL)")
+        lock = threading.Lock()
+
+        def direct(index: int, state: str):
+            with lock:
+                conn.execute("INSERT INTO entries (idx, state, partial, updated) VALUES (?, ?, ?, ?)"
+                             " ON CONFLICT (idx) DO UPDATE SET state = excluded.state, updated = excluded.updated",
+                             (index, state, f'/tmp/{index}.part', time.time()))
+                conn.commit()
+
+        def batched(index: int, state: str):
+            if state == 'downloading':
+                entries.downloading(index, f'/tmp/{index}.part')
+            else:
+                entries.finished(index, True)
+
+        print(f"{changes} entry state changes from {threads} threads")
+        for name, change, finish in (('commit per change', direct, lambda: None),
+                                     ('JobJournal (batched)', batched, journal.flush)):
+            def work(first: int):
+                for i in range(first, changes // 2, threads):
+                    change(i, 'downloading')
+                    change(i, 'done')
+
+            start = time.perf_counter()
+            workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            calls = time.perf_counter() - start
+            finish()
+            total = time.perf_counter() - start
+            print(f"  {name:<22}{calls / changes * 1e6:8.1f} us per change in the caller, "
+                  f"{total * 1e3:7.1f} ms until committed")
+        journal.close()
+        conn.close()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def archived(folder: str) -> int:
+    try:
+        conn = sqlite3.connect(folder_state_path(folder, ARCHIVE_FILENAME), timeout=5)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+def listed(folder: str) -> bool:
+    """Whether the journal holds the playlist's whole listing"""
+    conn = sqlite3.connect(folder_state_path(folder, JOURNAL_FILENAME), timeout=5)
+    try:
+        return conn.execute("SELECT n_listed FROM jobs").fetchone()[0] is not None
+    finally:
+        conn.close()
+
+
+def run_daemon(folder: str, url: str) -> subprocess.Popen:
+    code = DAEMON_RUN.format(root=ROOT, bench=BENCH, folder=folder, url=url,
+                             state=download_archive.FOLDER_STATE_DIR)
+    return subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True)
+
+
+def crash_and_resume(entries: int, size: int, kill_after: int):
+    folder = tempfile.mkdtemp(prefix='nm-tube-resume-')
+    # Each entry takes a moment, so the kill lands mid-playlist and mid-file
+    with MediaServer(rate=size * 4) as server:
+        url = server.playlist_url('resume', entries, size, page_size=10, page_delay=0.2)
+        try:
+            print(f"\nPlaylist of {entries} x {size // KB} KB, 10 entries per page listed in 0.2 s each")
+            first = run_daemon(folder, url)
+            while archived(folder) < kill_after and first.poll() is None:
+                time.sleep(0.05)
+            first.send_signal(signal.SIGKILL)
+            first.wait()
+            done_before = archived(folder)
+            sent_before = server.bytes_sent
+            partials = [f for _, _, files in os.walk(folder) for f in files if f.endswith('.part')]
+            print(f"  killed after {done_before} entries ({sent_before / size:.1f} entries' worth sent), "
+                  f"{len(partials)} .part file(s) left, listing "
+                  f"{'complete' if listed(folder) else 'incomplete'} in the journal")
+
+            server.reset()
+            second = run_daemon(folder, url)
+            out, _ = second.communicate(timeout=600)
+            report = json.loads(out.strip().splitlines()[-1])
+            media = sorted(f for _, _, files in os.walk(folder) for f in files if f.endswith('.mp4'))
+            print(f"  restarted: {'job resumed' if report['resumed'] else 'job NOT resumed'}, "
+                  f"{report['state']} in {report['elapsed']:.2f} s, {server.bytes_sent / size:.1f} entries' worth sent")
+            print(f"  {report['result'] or report['error']}")
+            print(f"  {len(media)} files on disk, {archived(folder)} archived")
+            ok = (report['resumed'] and report['state'] == 'done' and len(media) == entries
+                  and archived(folder) == entries)
+            print("  OK: every entry saved once" if ok else "  FAIL: entries missing or repeated")
+            return 0 if ok else 1
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--changes', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--entries', type=int, default=40)
+    parser.add_argument('--size-kb', type=int, default=512)
+    args = parser.parse_args()
+
+    write_cost(args.changes, args.threads)
+    # Entries are listed only a few ahead of the downloads, so the listing ends near the last ones
+    failed = 0
+    for kill_after in (args.entries // 4, args.entries - 3):
+        failed += crash_and_resume(args.entries, args.size_kb * KB, kill_after)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
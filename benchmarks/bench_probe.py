@@ -0,0 +1,90 @@
+"""Memory per probed video: full info dicts against compact ProbeRecords.
+
+Probes videos whose info is the size of a real YouTube extraction (dozens
+of formats with signed URLs and headers, storyboard fragments, thumbnails
+and automatic captions) and measures, with tracemalloc, what keeping the
+results costs per video: the info dicts extract_info returns, the raw
+format lists get_available_formats used to return, and probe records.
+Then times probe_many with one and several workers.
+
+    python benchmarks/bench_probe.py [--videos 500] [--formats 30]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from info_cache import extract_info
+from probe import probe_many
+from session_pool import YoutubeDLPool
+
+from local_media import MediaServer, stub_factory
+
+KB = 1024
+
+
+def retained(build: Callable[[], List]) -> tuple:
+    """(bytes kept per item, peak bytes while building) of what build returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (current - before) / len(kept), peak - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=500)
+    parser.add_argument('--formats', type=int, default=30, help="formats per video besides storyboards")
+    parser.add_argument('--delay', type=float, default=0.02, help="seconds each extraction takes, for timing")
+    args = parser.parse_args()
+
+    sessions = YoutubeDLPool(factory=stub_factory)
+    with MediaServer() as server:
+        urls = [server.video_url(f'probe{i}', 1 << 20, formats=args.formats) for i in range(args.videos)]
+        # Load the extractors and the session before measuring
+        list(probe_many(urls[:8], sessions=sessions))
+
+        def full_info():
+            return [extract_info(url, None, sessions) for url in urls]
+
+        def format_lists():
+            kept = []
+            for url in urls:
+                info = extract_info(url, None, sessions)
+                kept.append({'title': info.get('title'), 'duration': info.get('duration'),
+                             'formats': info.get('formats', [])})
+            return kept
+
+        def records():
+            return list(probe_many(urls, 8, None, sessions))
+
+        print(f"{args.videos} videos, {args.formats + 6} formats each")
+        print(f"{'kept per video':<42}{'KB':>10}{'peak MB':>10}")
+        for name, build in (('full info dict (extract_info)', full_info),
+                            ("raw format list (old get_available_formats)", format_lists),
+                            ('ProbeRecord (probe_many)', records)):
+            per_item, peak = retained(build)
+            print(f"{name:<42}{per_item / KB:>10.1f}{peak / KB / KB:>10.1f}")
+
+        delayed = [server.video_url(f'timed{i}', 1 << 20, delay=args.delay, formats=args.formats)
+                   for i in range(min(args.videos, 200))]
+        print(f"\nprobe_many, {len(delayed)} videos taking {args.delay * 1e3:.0f} ms each to extract")
+        for workers in (1, 8, 32):
+            start = time.perf_counter()
+            count = sum(1 for _ in probe_many(delayed, workers, None, sessions))
+            elapsed = time.perf_counter() - start
+            print(f"  {workers:>2} workers  {elapsed:6.2f} s  ({count / elapsed:.0f} videos/s)")
+    sessions.close()
+
+
+if __name__ == "__main__":
+    main()
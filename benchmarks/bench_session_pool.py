@@ -0,0 +1,51 @@
+"""Per-call overhead of a fresh YoutubeDL versus a warm pooled session.
+
+Run from the repository root:
+
+    python benchmarks/bench_session_pool.py [calls]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+from session_pool import YoutubeDLPool
+
+OPTS = {'quiet': True, 'format': 'best[ext=mp4]/best', 'outtmpl': '%(title)s.%(ext)s'}
+
+
+def fresh(calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        with yt_dlp.YoutubeDL(dict(OPTS)) as ydl:
+            ydl.prepare_filename({'title': 'x', 'ext': 'mp4'})
+    return (time.perf_counter() - start) / calls
+
+
+def pooled(calls: int) -> float:
+    pool = YoutubeDLPool()
+    with pool.session(dict(OPTS)):
+        pass  # warm-up, as a long-lived process would have done already
+    start = time.perf_counter()
+    for _ in range(calls):
+        with pool.session(dict(OPTS, progress_hooks=[lambda d: None])) as ydl:
+            ydl.prepare_filename({'title': 'x', 'ext': 'mp4'})
+    elapsed = (time.perf_counter() - start) / calls
+    pool.close()
+    return elapsed
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    before = fresh(calls)
+    after = pooled(calls)
+    print(f"fresh YoutubeDL per call: {before * 1e3:8.3f} ms")
+    print(f"pooled session per call:  {after * 1e3:8.3f} ms")
+    print(f"speedup: {before / after:.1f}x over {calls} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Startup time of the GUI with yt-dlp kept off the critical path.
+
+Each measurement runs in a fresh interpreter. The script fails (exit code 1)
+if importing gui_app pulls in yt_dlp, or if the median import time exceeds
+--max-import-ms, so it can guard against startup regressions in CI.
+
+    python benchmarks/bench_startup.py [--runs 5] [--max-import-ms 400]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_GUI = """
+import sys, time
+start = time.perf_counter()
+import gui_app
+print(time.perf_counter() - start, 'yt_dlp' in sys.modules)
+"""
+
+IMPORT_YT_DLP = """
+import time
+start = time.perf_counter()
+import yt_dlp
+print(time.perf_counter() - start, True)
+"""
+
+# Time until the first frame is painted and until warm-up lets START through
+FIRST_WINDOW = """
+import time
+start = time.perf_counter()
+import tkinter as tk
+import gui_app
+root = tk.Tk()
+app = gui_app.YouTubeDownloaderGUI(root)
+root.update()
+painted = time.perf_counter() - start
+app.warmup.wait()
+print(painted, time.perf_counter() - start)
+root.destroy()
+"""
+
+
+def measure(code: str, runs: int):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.split()
+        samples.append((float(output[0]), output[1]))
+    return samples
+
+
+def has_display() -> bool:
+    try:
+        subprocess.run([sys.executable, '-c', 'import tkinter; tkinter.Tk().destroy()'],
+                       capture_output=True, check=True, timeout=10)
+        return True
+    except (subprocess.SubprocessError, OSError):
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=400)
+    args = parser.parse_args()
+
+    gui = measure(IMPORT_GUI, args.runs)
+    yt_dlp = measure(IMPORT_YT_DLP, args.runs)
+    gui_ms = statistics.median(t for t, _ in gui) * 1e3
+    yt_dlp_ms = statistics.median(t for t, _ in yt_dlp) * 1e3
+    leaked = any(loaded == 'True' for _, loaded in gui)
+
+    print(f"import gui_app:  {gui_ms:8.1f} ms (median of {args.runs})")
+    print(f"import yt_dlp:   {yt_dlp_ms:8.1f} ms (deferred to warm-up)")
+
+    if has_display():
+        window = measure(FIRST_WINDOW, args.runs)
+        painted_ms = statistics.median(t for t, _ in window) * 1e3
+        ready_ms = statistics.median(float(r) for _, r in window) * 1e3
+        print(f"first window:    {painted_ms:8.1f} ms")
+        print(f"ready to start:  {ready_ms:8.1f} ms")
+    else:
+        print("first window:    skipped (no display)")
+
+    failures = []
+    if leaked:
+        failures.append("importing gui_app loaded yt_dlp")
+    if gui_ms > args.max_import_ms:
+        failures.append(f"gui_app import took {gui_ms:.1f} ms > {args.max_import_ms:.0f} ms")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Check that memory stays flat over a long playlist download.
+
+Downloads a playlist of small entries whose info carries a full format
+list, samples tracemalloc's traced memory after a collection each time an
+entry finishes, and fits the growth per entry over the second half of the
+run, after warm-up. Exits non-zero when memory grows by more than
+--max-growth bytes per entry, which a playlist that kept every entry's
+info, its result record or a progress counter per file would exceed.
+
+    python benchmarks/check_playlist_memory.py [--entries 1000] [--type video|audio] 2>/dev/null
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from info_cache import InfoCache
+from session_pool import YoutubeDLPool
+
+from bench_downloads import BenchDownloader
+from local_media import MediaServer, stub_factory
+
+KB = 1024
+
+
+def slope(samples: List[Tuple[int, int]]) -> float:
+    """Least-squares bytes per entry of (entries done, traced bytes) samples"""
+    n = len(samples)
+    mean_x = sum(x for x, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in samples)
+    return sum((x - mean_x) * (y - mean_y) for x, y in samples) / spread if spread else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--formats', type=int, default=5, help="formats per entry besides storyboards")
+    parser.add_argument('--type', choices=['video', 'audio'], default='video')
+    parser.add_argument('--workers', type=int, default=1,
+                        help="more add noise: every entry in flight holds its info")
+    parser.add_argument('--max-growth', type=float, default=64.0, help="allowed bytes per entry")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='nm-tube-memory-')
+    sessions = YoutubeDLPool(factory=stub_factory)
+    samples: List[Tuple[int, int]] = []
+    done = 0
+    low = None
+
+    def sample(d):
+        # Traced memory swings by the infos of entries in flight, so each
+        # sample is the lowest reading over a window of 25 entries
+        nonlocal done, low
+        if d.get('status') == 'finished':
+            done += 1
+            gc.collect()
+            traced = tracemalloc.get_traced_memory()[0]
+            low = traced if low is None else min(low, traced)
+            if done % 25 == 0:
+                samples.append((done, low))
+                low = None
+
+    try:
+        with MediaServer() as server:
+            downloader = BenchDownloader(folder, info_cache=InfoCache(os.path.join(folder, 'info.sqlite')),
+                                         sessions=sessions, quiet=True, max_workers=args.workers,
+                                         adaptive=False)
+            # Warm up the extractors, sessions and connection pool
+            downloader.download_playlist(server.playlist_url('warmup', 20, 2 * KB, formats=args.formats),
+                                         args.type)
+            gc.collect()
+            tracemalloc.start()
+            summary = downloader.download_playlist(
+                server.playlist_url('long', args.entries, 2 * KB, formats=args.formats), args.type,
+                progress_hooks=[sample])
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        sessions.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    growth = slope(samples[len(samples) // 2:])
+    print(summary.split(': ', 1)[1])
+    print(f"traced after {args.entries} entries: {current / KB:.0f} KB, peak {peak / KB:.0f} KB")
+    print(f"growth over the second half: {growth:.1f} bytes per entry (limit {args.max_growth:g})")
+    for entries, traced in samples[::max(1, len(samples) // 8)]:
+        print(f"  {entries:>6} entries  {traced / KB:8.0f} KB")
+    if growth > args.max_growth:
+        print("FAIL: memory grows with the number of entries")
+        return 1
+    print("OK: memory stays flat")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
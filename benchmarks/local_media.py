@@ -0,0 +1,407 @@
+"""Offline stand-ins for YouTube used by the benchmarks.
+
+MediaServer serves deterministic synthetic media over HTTP with Range
+support, and the Bench* extractors turn URLs on that server into yt-dlp
+info dicts, so the real download paths run end to end with no network:
+
+    with MediaServer() as server:
+        downloader = YouTubeDownloader(tmp, sessions=YoutubeDLPool(factory=stub_factory),
+                                       info_cache=InfoCache(':memory:'))
+        downloader.download_video(server.video_url('abc', size=8 << 20))
+"""
+import atexit
+import hashlib
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import download_archive
+
+# The benchmarks' throwaway folders keep their databases in a throwaway directory too
+download_archive.FOLDER_STATE_DIR = tempfile.mkdtemp(prefix='nm-tube-state-')
+atexit.register(shutil.rmtree, download_archive.FOLDER_STATE_DIR, ignore_errors=True)
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def payload_block(name: str) -> bytes:
+    """64 KiB block the body of media file name repeats"""
+    return hashlib.sha256(name.encode()).digest() * (CHUNK_SIZE // 32)
+
+
+def payload(name: str, start: int, end: int) -> bytes:
+    """Bytes start..end (inclusive) of media file name"""
+    block = payload_block(name)
+    offset = start % CHUNK_SIZE
+    length = end - start + 1
+    repeats = (offset + length + CHUNK_SIZE - 1) // CHUNK_SIZE
+    return (block * repeats)[offset:offset + length]
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Runs once per TCP connection, like a TCP/TLS handshake would
+        self.server.count_connection()
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+
+    def do_HEAD(self):
+        self.do_GET(body=False)
+
+    def do_GET(self, body: bool = True):
+        url = urlparse(self.path)
+        if not url.path.startswith('/media/'):
+            self.send_error(404)
+            return
+        name = url.path[len('/media/'):]
+        size = int(parse_qs(url.query).get('size', ['0'])[0])
+        rejection = self.server.admit()
+        if rejection:
+            self.send_response(rejection)
+            if self.server.retry_after is not None:
+                self.send_header('Retry-After', str(self.server.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            self.send_media(name, size, body)
+        finally:
+            self.server.stream_finished()
+
+    def send_media(self, name: str, size: int, body: bool):
+        start, end, status = 0, size - 1, 200
+        match = _RANGE_RE.fullmatch(self.headers.get('Range', ''))
+        if match and self.server.ranges:
+            first, last = match.groups()
+            start = int(first) if first else max(0, size - int(last))
+            end = min(int(last), size - 1) if first and last else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes' if self.server.ranges else 'none')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        self.server.count_request()
+        if not body:
+            return
+
+        block = payload_block(name)
+        position = start
+        while position <= end:
+            offset = position % CHUNK_SIZE
+            chunk = block[offset:offset + min(CHUNK_SIZE - offset, end + 1 - position)]
+            # Paced before writing, so the response ends with its last byte
+            self.server.pace(len(chunk))
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            self.server.count_bytes(len(chunk))
+            position += len(chunk)
+
+
+class MediaServer(ThreadingHTTPServer):
+    """Local HTTP server for synthetic media, recording when bytes go out
+
+    latency delays every response to imitate a round trip; ranges=False
+    makes the server ignore Range headers like some CDNs do. rate caps
+    each response at that many bytes per second, and connect_latency
+    delays each new connection to imitate a handshake.
+
+    To exercise retries and the concurrency controller, link_rate shares
+    that many bytes per second between all responses (a saturated link),
+    max_streams answers 429 while that many media responses are already
+    running, and error_rate fails that fraction of media requests with a
+    500. retry_after is sent with both.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, ranges: bool = True, rate: Optional[float] = None,
+                 connect_latency: float = 0.0, link_rate: Optional[float] = None,
+                 max_streams: Optional[int] = None, error_rate: float = 0.0,
+                 retry_after: Optional[float] = None, seed: int = 0):
+        super().__init__(('127.0.0.1', 0), _MediaHandler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.ranges = ranges
+        self.rate = rate
+        self.link_rate = link_rate
+        self.max_streams = max_streams
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._link_free = 0.0
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def reset(self):
+        """Forget the counters, e.g. between benchmark runs"""
+        with self._lock:
+            self.requests = 0
+            self.connections = 0
+            self.bytes_sent = 0
+            self.first_byte: Optional[float] = None
+            self.last_byte: Optional[float] = None
+            self.streams = 0
+            self.peak_streams = 0
+            self.throttled = 0
+            self.failed = 0
+
+    def handle_error(self, request, client_address):
+        # Clients dropping kept-alive connections is normal here, not worth a traceback
+        pass
+
+    def admit(self) -> Optional[int]:
+        """Status to fail a media request with, or None once it counts as a running stream"""
+        with self._lock:
+            if self.max_streams is not None and self.streams >= self.max_streams:
+                self.throttled += 1
+                return 429
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.failed += 1
+                return 500
+            self.streams += 1
+            self.peak_streams = max(self.peak_streams, self.streams)
+        return None
+
+    def stream_finished(self):
+        with self._lock:
+            self.streams -= 1
+
+    def pace(self, nbytes: int):
+        """Sleep as long as sending nbytes takes under rate and the shared link_rate"""
+        delay = nbytes / self.rate if self.rate else 0.0
+        if self.link_rate:
+            with self._lock:
+                now = time.perf_counter()
+                # Chunks of all responses queue for the link one after another
+                start = max(now, self._link_free)
+                self._link_free = start + nbytes / self.link_rate
+            delay = max(delay, self._link_free - now)
+        if delay > 0:
+            time.sleep(delay)
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_bytes(self, nbytes: int):
+        now = time.perf_counter()
+        with self._lock:
+            self.bytes_sent += nbytes
+            if self.first_byte is None:
+                self.first_byte = now
+            self.last_byte = now
+
+    def media_url(self, name: str, size: int) -> str:
+        return f'{self.base_url}/media/{name}?size={size}'
+
+    def video_url(self, video_id: str, size: int, delay: float = 0.0, formats: int = 0) -> str:
+        """Watch URL of a video; extracting it takes delay seconds, formats adds YouTube-sized info"""
+        query = {'size': size, 'delay': delay} if delay else {'size': size}
+        if formats:
+            query['formats'] = formats
+        return f'{self.base_url}/watch/{video_id}?{urlencode(query)}'
+
+    def playlist_url(self, playlist_id: str, entries: int, size: int, page_size: int = 100,
+                     page_delay: float = 0.0, videos: Optional[str] = None, content: Optional[str] = None,
+                     formats: int = 0) -> str:
+        """videos names the entries (default playlist_id), so playlists can share them;
+        content gives differently named entries the same bytes, like re-uploads;
+        formats gives every entry YouTube-sized info"""
+        query = {'entries': entries, 'size': size, 'page_size': page_size, 'page_delay': page_delay}
+        if formats:
+            query['formats'] = formats
+        if videos:
+            query['videos'] = videos
+        if content:
+            query['content'] = content
+        return f'{self.base_url}/playlist/{playlist_id}?{urlencode(query)}'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+_HEIGHTS = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+_VCODECS = (('avc1.4d401e', 'mp4'), ('vp09.00.40.08', 'webm'), ('av01.0.08M.08', 'mp4'))
+
+
+def youtube_like_fields(base: str, video_id: str, count: int) -> Dict:
+    """Info fields the size of a real YouTube extraction: count formats with long signed
+    URLs and headers, storyboard fragments, thumbnails and automatic captions"""
+    signature = hashlib.sha256(video_id.encode()).hexdigest() * 12
+    headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)',
+               'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+               'Accept-Language': 'en-us,en;q=0.5', 'Sec-Fetch-Mode': 'navigate'}
+    formats = []
+    for i in range(count):
+        height = _HEIGHTS[i % len(_HEIGHTS)]
+        vcodec, ext = _VCODECS[(i // len(_HEIGHTS)) % len(_VCODECS)]
+        size = height * 40000 + i
+        formats.append({
+            'format_id': str(100 + i), 'format_note': f'{height}p', 'ext': ext, 'container': f'{ext}_dash',
+            'url': f'{base}/media/{video_id}.{ext}?size={size}&itag={100 + i}&sig={signature}',
+            'protocol': 'https', 'vcodec': vcodec, 'acodec': 'none', 'height': height,
+            'width': height * 16 // 9, 'fps': 30, 'tbr': height * 3.1, 'vbr': height * 3.1, 'filesize': size,
+            'resolution': f'{height * 16 // 9}x{height}', 'aspect_ratio': 1.78, 'dynamic_range': 'SDR',
+            'quality': i, 'has_drm': False, 'source_preference': -1, 'video_ext': ext, 'audio_ext': 'none',
+            'format': f'{100 + i} - {height * 16 // 9}x{height} ({height}p)', 'http_headers': dict(headers),
+            'downloader_options': {'http_chunk_size': 10485760},
+        })
+    for i in range(4):
+        formats.append({
+            'format_id': f'sb{i}', 'format_note': 'storyboard', 'ext': 'mhtml', 'protocol': 'mhtml',
+            'vcodec': 'none', 'acodec': 'none', 'columns': 10, 'rows': 10,
+            'fragments': [{'url': f'{base}/sb/{video_id}/{i}/M{n}.jpg?sigh={signature[:80]}', 'duration': 2.0}
+                          for n in range(100)],
+        })
+    return {
+        'formats': formats,
+        'thumbnails': [{'url': f'{base}/vi/{video_id}/{n}.jpg', 'preference': -n, 'id': str(n)}
+                       for n in range(40)],
+        'automatic_captions': {
+            f'l{n:02d}': [{'ext': ext, 'url': f'{base}/api/timedtext?v={video_id}&lang=l{n:02d}&fmt={ext}'
+                                              f'&sig={signature[:200]}', 'name': f'Language {n}'}
+                          for ext in ('json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt')]
+            for n in range(100)},
+        'description': f'Description of {video_id}. ' * 80,
+        'tags': [f'tag{n}' for n in range(20)],
+    }
+
+
+class BenchVideoIE(InfoExtractor):
+    """A video on MediaServer with one muxed and one audio-only format
+
+    ?formats=N adds N more formats and the rest of the bulk of a real
+    YouTube extraction (see youtube_like_fields).
+    """
+
+    _VALID_URL = r'https?://127\.0\.0\.1:\d+/watch/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        parsed = urlparse(url)
+        base = f'{parsed.scheme}://{parsed.netloc}'
+        query = parse_qs(parsed.query)
+        size = int(query.get('size', [1 << 20])[0])
+        # Media is named after the content, so two IDs can serve identical files
+        content = query.get('content', [video_id])[0]
+        time.sleep(float(query.get('delay', ['0'])[0]))
+        audio_size = max(1, size // 8)
+        extra = int(query.get('formats', ['0'])[0])
+        bulk = youtube_like_fields(base, content, extra) if extra else {'formats': []}
+        return {
+            **bulk,
+            'id': video_id,
+            'title': f'Bench {video_id}',
+            'duration': 60,
+            'webpage_url': url,
+            'formats': [{
+                'format_id': '140',
+                'url': f'{base}/media/{content}.m4a?size={audio_size}',
+                'ext': 'm4a',
+                'vcodec': 'none',
+                'acodec': 'mp4a.40.2',
+                'abr': 128,
+                'filesize': audio_size,
+                'protocol': parsed.scheme,
+            }, {
+                'format_id': '18',
+                'url': f'{base}/media/{content}.mp4?size={size}',
+                'ext': 'mp4',
+                'vcodec': 'avc1.42001E',
+                'acodec': 'mp4a.40.2',
+                'height': 360,
+                'width': 640,
+                'filesize': size,
+                'protocol': parsed.scheme,
+            }] + bulk['formats'],
+        }
+
+
+class BenchPlaylistIE(InfoExtractor):
+    """A playlist of BenchVideoIE entries on MediaServer, listed lazily page by page
+
+    page_delay (seconds) imitates the request behind each page of a long channel.
+    """
+
+    _VALID_URL = r'https?://127\.0\.0\.1:\d+/playlist/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        playlist_id = self._match_id(url)
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        entries = int(query.get('entries', ['5'])[0])
+        size = query.get('size', [str(1 << 20)])[0]
+        page_size = int(query.get('page_size', ['100'])[0])
+        page_delay = float(query.get('page_delay', ['0'])[0])
+        videos = query.get('videos', [playlist_id])[0]
+        content = query.get('content', [None])[0]
+        formats = query.get('formats', [None])[0]
+        base = f'{parsed.scheme}://{parsed.netloc}'
+
+        def pages():
+            for first in range(1, entries + 1, page_size):
+                time.sleep(page_delay)
+                for i in range(first, min(first + page_size, entries + 1)):
+                    video_query = {'size': size, 'content': f'{content}-{i}'} if content else {'size': size}
+                    if formats:
+                        video_query['formats'] = formats
+                    yield self.url_result(f'{base}/watch/{videos}-{i}?{urlencode(video_query)}', BenchVideoIE,
+                                          f'{videos}-{i}', f'Bench {videos}-{i}')
+
+        return self.playlist_result(pages(), playlist_id, f'Bench playlist {playlist_id}')
+
+
+def stub_factory(params: Dict) -> yt_dlp.YoutubeDL:
+    """YoutubeDLPool factory whose sessions only know the Bench extractors"""
+    ydl = yt_dlp.YoutubeDL(params, auto_init=False)
+    for ie in (BenchVideoIE, BenchPlaylistIE):
+        ydl.add_info_extractor(ie())
+    return ydl
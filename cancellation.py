@@ -0,0 +1,244 @@
+import os
+import queue
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set
+
+# What happens to the partial files of a cancelled download
+KEEP_PARTIAL = 'keep'      # leave .part files (and segment sidecars) so a retry resumes
+DELETE_PARTIAL = 'delete'  # remove them once the download has stopped
+
+
+class DownloadCancelled(Exception):
+    """Raised inside a job when its cancel token has been set"""
+
+    def __init__(self, message: str = "Download cancelled by user"):
+        super().__init__(message)
+
+
+class CancelToken(threading.Event):
+    """Cancel flag that also interrupts the stage a download is blocked in
+
+    A drop-in for the threading.Event passed as cancel_event everywhere;
+    setting it additionally runs the callbacks registered by the current
+    stage (closing an HTTP response, killing an ffmpeg process) so a
+    cancelled job stops within a bounded time instead of at its next
+    progress update. The runner calls release() once the job has stopped,
+    which applies the partial-file policy and fixes the measured latency.
+    """
+
+    def __init__(self, partial_policy: str = KEEP_PARTIAL):
+        super().__init__()
+        if partial_policy not in (KEEP_PARTIAL, DELETE_PARTIAL):
+            raise ValueError(f"partial_policy must be '{KEEP_PARTIAL}' or '{DELETE_PARTIAL}'")
+        self.partial_policy = partial_policy
+        self.cancelled_at: Optional[float] = None
+        self.released_at: Optional[float] = None
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+        self._partials: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def set(self):
+        with self._lock:
+            if self.cancelled_at is None:
+                self.cancelled_at = time.perf_counter()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        super().set()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # the stage is being torn down anyway
+
+    cancel = set
+
+    def check(self):
+        """Raise DownloadCancelled if the token was cancelled"""
+        if self.is_set():
+            raise DownloadCancelled()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run callback when the token is cancelled (now, if it already is)
+
+        Returns a function that unregisters it again.
+        """
+        with self._lock:
+            if not self.is_set():
+                key = self._next_id
+                self._next_id += 1
+                self._callbacks[key] = callback
+
+                def unregister():
+                    with self._lock:
+                        self._callbacks.pop(key, None)
+                return unregister
+        callback()
+        return lambda: None
+
+    @contextmanager
+    def interrupting(self, callback: Callable[[], None]):
+        """Register callback for the duration of a blocking stage"""
+        unregister = self.on_cancel(callback)
+        try:
+            yield
+        finally:
+            unregister()
+
+    def add_partial(self, path: str):
+        """Remember a temporary file the download is writing"""
+        with self._lock:
+            self._partials.add(path)
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook that records partial files and aborts once cancelled"""
+        if d.get('tmpfilename'):
+            self.add_partial(d['tmpfilename'])
+        self.check()
+
+    def release(self) -> Optional[float]:
+        """Mark the cancelled download as stopped; returns the cancel latency
+
+        Partial files are deleted here under DELETE_PARTIAL, after every
+        writer has stopped. Does nothing for a token that was never set.
+        """
+        if not self.is_set():
+            return None
+        with self._lock:
+            if self.released_at is not None:
+                return self.latency
+            self.released_at = time.perf_counter()
+            partials, self._partials = self._partials, set()
+        if self.partial_policy == DELETE_PARTIAL:
+            for path in partials:
+                for leftover in (path, path + '.segments', path + '.ytdl'):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+        return self.latency
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Seconds from cancel() until release(), None until both happened"""
+        if self.cancelled_at is None or self.released_at is None:
+            return None
+        return self.released_at - self.cancelled_at
+
+
+def cancellation_hook(cancel_event: threading.Event) -> Callable:
+    """Progress hook that aborts the download once cancel_event is set"""
+    if isinstance(cancel_event, CancelToken):
+        return cancel_event.progress_hook
+
+    def hook(d):
+        if cancel_event.is_set():
+            raise DownloadCancelled()
+    return hook
+
+
+def abort_response(response):
+    """Make a read blocked on an urllib response return right away
+
+    Closing the file object alone doesn't wake a thread sitting in recv(),
+    so the socket underneath is shut down first.
+    """
+    sock = getattr(getattr(response.fp, 'raw', None), '_sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def call_cancellable(cancel_event: Optional[threading.Event], function: Callable, *args, **kwargs):
+    """Run a blocking call that can't be interrupted, giving up on it when cancelled
+
+    Used for metadata extraction: the call finishes on a helper thread and
+    its result is dropped, while the caller raises DownloadCancelled at once.
+    """
+    if cancel_event is None:
+        return function(*args, **kwargs)
+    if cancel_event.is_set():
+        raise DownloadCancelled()
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome['result'] = function(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, daemon=True, name='nm-tube-cancellable').start()
+    wake = cancel_event.on_cancel(done.set) if isinstance(cancel_event, CancelToken) else None
+    while not done.wait(None if wake else 0.05):
+        if cancel_event.is_set():
+            break
+    if wake is not None:
+        wake()
+    if 'error' in outcome:
+        raise outcome['error']
+    if 'result' not in outcome:
+        raise DownloadCancelled()
+    return outcome['result']
+
+
+_END = object()
+
+
+def iterate_cancellable(items: Iterable, cancel_event: Optional[threading.Event],
+                        poll: float = 0.05) -> Iterator:
+    """Iterate a slow lazy iterable, raising DownloadCancelled within poll seconds of a cancel
+
+    Items are fetched one ahead on a helper thread, which also closes the
+    iterable, so a cancel doesn't wait for e.g. the next playlist page.
+    """
+    if cancel_event is None or isinstance(items, (list, tuple)):
+        yield from items
+        return
+    fetched: queue.Queue = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def offer(item, error=None) -> bool:
+        while not stop.is_set():
+            try:
+                fetched.put((item, error), timeout=poll)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not offer(item):
+                    return
+            offer(_END)
+        except BaseException as e:
+            offer(_END, e)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    threading.Thread(target=produce, daemon=True, name='nm-tube-prefetch').start()
+    try:
+        while True:
+            try:
+                item, error = fetched.get(timeout=poll)
+            except queue.Empty:
+                if cancel_event.is_set():
+                    raise DownloadCancelled()
+                continue
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,348 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from download_archive import folder_state_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: hard links only
+    fcntl = None
+
+STORE_FILENAME = ".nm_tube_content.sqlite"
+
+# Content hashes are computed per block, so out-of-order segments can be hashed as they arrive
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Linux ioctl sharing one file's extents with another (btrfs, XFS, bcachefs)
+_FICLONE = 0x40049409
+
+STORED = 'stored'
+LINKED = 'linked'
+REFLINKED = 'reflinked'
+UNCHANGED = 'unchanged'
+
+
+def combine(block_digests: List[bytes]) -> str:
+    """Content hash from the SHA-256 of each block, in file order"""
+    return hashlib.sha256(b''.join(block_digests)).hexdigest()
+
+
+class ContentHasher:
+    """Dropbox-style content hash: SHA-256 over the SHA-256 of each 4 MiB block
+
+    update() takes bytes at any offset, as long as every block is written
+    front to back, so a file downloaded over several ranged connections can
+    be hashed while it is written. Writing to a block's first byte starts
+    that block over, as a retried segment does; any other out-of-order
+    write leaves the hash unknown.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._digests: Dict[int, bytes] = {}
+        self._partial: Dict[int, Tuple['hashlib._Hash', int]] = {}
+        self._broken = False
+        self._lock = threading.Lock()
+
+    def _block_length(self, block: int) -> int:
+        return min(BLOCK_SIZE, self.size - block * BLOCK_SIZE)
+
+    def update(self, offset: int, data: bytes):
+        view = memoryview(data)
+        while view:
+            block, position = divmod(offset, BLOCK_SIZE)
+            piece = view[:BLOCK_SIZE - position]
+            with self._lock:
+                if position == 0:
+                    self._digests.pop(block, None)
+                    hasher = hashlib.sha256()
+                else:
+                    hasher, expected = self._partial.pop(block, (None, -1))
+                    if hasher is None or expected != position:
+                        self._broken = True
+                        return
+            # hashlib releases the GIL for large updates, so segments hash in parallel
+            hasher.update(piece)
+            position += len(piece)
+            with self._lock:
+                if position >= self._block_length(block):
+                    self._digests[block] = hasher.digest()
+                else:
+                    self._partial[block] = (hasher, position)
+            offset += len(piece)
+            view = view[len(piece):]
+
+    def block_digests(self) -> Dict[int, str]:
+        """Finished blocks, for a resume sidecar"""
+        with self._lock:
+            return {block: digest.hex() for block, digest in self._digests.items()}
+
+    def restore(self, digests: Dict) -> bool:
+        """Take finished blocks back from block_digests() of an interrupted run"""
+        try:
+            restored = {int(block): bytes.fromhex(digest) for block, digest in digests.items()}
+        except (TypeError, ValueError, AttributeError):
+            return False
+        with self._lock:
+            self._digests.update(restored)
+        return True
+
+    def hexdigest(self) -> Optional[str]:
+        """The content hash, or None unless every block was hashed"""
+        count = (self.size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        with self._lock:
+            if self._broken or len(self._digests) < count:
+                return None
+            return combine([self._digests[block] for block in range(count)])
+
+
+def hash_file(path: str) -> str:
+    """Content hash of a file on disk, for files that weren't hashed while downloading"""
+    digests = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            digests.append(hashlib.sha256(block).digest())
+    return combine(digests)
+
+
+def _reflink(source: str, target: str) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+
+
+class ContentStore:
+    """Content-addressed index of the files in a download folder
+
+    Every finished file is recorded under its content hash. When the same
+    content is already on disk under another path, the new file is replaced
+    by a hard link to it (or a reflink where hard links aren't possible), so
+    a video kept in several playlist folders takes the space of one copy.
+    The recorded hashes double as checksums for verify().
+    """
+
+    def __init__(self, download_path: str, link: bool = True):
+        self.download_path = download_path
+        self.path = folder_state_path(download_path, STORE_FILENAME)
+        self.link = link
+        self.counters = {'streamed_bytes': 0, 'read_bytes': 0, 'linked': 0, 'reflinked': 0, 'saved_bytes': 0}
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+
+        os.makedirs(download_path, exist_ok=True)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # WAL and a busy timeout let the CLI and GUI write at the same time
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " hash TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " device INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            " added REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+        self._conn.commit()
+
+    @staticmethod
+    def _unchanged(path: str, size: int, mtime_ns: int) -> Optional[os.stat_result]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat if stat.st_size == size and stat.st_mtime_ns == mtime_ns else None
+
+    def _record(self, path: str, content_hash: str, stat: os.stat_result):
+        # Caller holds self._lock
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, hash, size, mtime_ns, device, inode, added)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, content_hash, stat.st_size, stat.st_mtime_ns, stat.st_dev, stat.st_ino, time.time())
+        )
+        self._conn.commit()
+
+    def lookup(self, content_hash: str, exclude: Optional[str] = None) -> Optional[str]:
+        """A recorded path that still holds content_hash, unmodified since it was recorded"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE hash = ? AND path != ?",
+                (content_hash, exclude or '')).fetchall()
+        for path, size, mtime_ns in rows:
+            if self._unchanged(path, size, mtime_ns):
+                return path
+        return None
+
+    def recorded_hash(self, path: str) -> Optional[str]:
+        """The hash recorded for path, if the file hasn't changed since"""
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self._conn.execute("SELECT hash, size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        return row[0] if row and self._unchanged(path, row[1], row[2]) else None
+
+    def ingest(self, path: str, content_hash: Optional[str] = None) -> str:
+        """Record a finished file, linking it to an existing copy of the same content
+
+        content_hash is the hash computed while the file was written; without
+        it the file is read once to hash it. Returns STORED, LINKED,
+        REFLINKED or UNCHANGED (already recorded as it is).
+        """
+        path = os.path.abspath(path)
+        if content_hash is None:
+            content_hash = self.recorded_hash(path)
+            if content_hash is not None:
+                return UNCHANGED
+            content_hash = hash_file(path)
+            with self._lock:
+                self.counters['read_bytes'] += os.path.getsize(path)
+        else:
+            with self._lock:
+                self.counters['streamed_bytes'] += os.path.getsize(path)
+
+        # One ingest at a time, so two copies finishing together still end up linked
+        with self._ingest_lock:
+            outcome = None
+            existing = self.lookup(content_hash, exclude=path) if self.link else None
+            if existing is not None and not os.path.samefile(existing, path):
+                outcome = self._link(existing, path)
+            with self._lock:
+                if outcome is not None:
+                    self.counters[outcome] += 1
+                    self.counters['saved_bytes'] += os.path.getsize(path)
+                self._record(path, content_hash, os.stat(path))
+        return outcome or STORED
+
+    @staticmethod
+    def _link(source: str, path: str) -> Optional[str]:
+        """Point path at source's data, atomically; None if neither kind of link works"""
+        temporary = path + '.nm-link'
+        if os.path.lexists(temporary):
+            os.remove(temporary)  # left by an interrupted run
+        try:
+            os.link(source, temporary)
+            outcome = LINKED
+        except OSError:
+            # Another filesystem, or one without hard links
+            if not _reflink(source, temporary):
+                return None
+            outcome = REFLINKED
+        try:
+            os.replace(temporary, path)
+        except OSError:
+            os.remove(temporary)
+            return None
+        return outcome
+
+    def place(self, source: str, path: str) -> Optional[str]:
+        """Link a recorded, unmodified file to a new path instead of downloading it again
+
+        Returns LINKED or REFLINKED, or None when source isn't a known copy
+        or can't be linked; an existing file at path is left alone.
+        """
+        source, path = os.path.abspath(source), os.path.abspath(path)
+        content_hash = self.recorded_hash(source)
+        if content_hash is None or os.path.exists(path):
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._ingest_lock:
+            outcome = self._link(source, path)
+            if outcome is None:
+                return None
+            with self._lock:
+                self.counters[outcome] += 1
+                self.counters['saved_bytes'] += os.path.getsize(path)
+                self._record(path, content_hash, os.stat(path))
+        return outcome
+
+    def ingest_info(self, info: Dict) -> Optional[str]:
+        """ingest() the file a processed info dict was downloaded to
+
+        Deduplication is best effort: a file that can't be read or linked is
+        left as it is, and None is returned.
+        """
+        downloads = (info or {}).get('requested_downloads') or [{}]
+        path = downloads[-1].get('filepath') or (info or {}).get('filepath')
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return self.ingest(path, downloads[-1].get('content_hash'))
+        except OSError:
+            return None
+
+    def verify(self) -> Iterator[Tuple[str, str]]:
+        """Re-hash every recorded file, yielding (path, 'ok' | 'corrupt' | 'missing')
+
+        Hard-linked copies share their data, so each one is read only once.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT path, hash FROM files ORDER BY hash, path").fetchall()
+        checked: Dict[Tuple[int, int], str] = {}
+        for path, content_hash in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                yield path, 'missing'
+                continue
+            key = (stat.st_dev, stat.st_ino)
+            if key not in checked:
+                checked[key] = hash_file(path)
+            yield path, 'ok' if checked[key] == content_hash else 'corrupt'
+
+    def forget_missing(self) -> int:
+        """Drop records of files that no longer exist"""
+        with self._lock:
+            paths = [row[0] for row in self._conn.execute("SELECT path FROM files")]
+            missing = [(path,) for path in paths if not os.path.exists(path)]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", missing)
+            self._conn.commit()
+        return len(missing)
+
+    def stats(self) -> Dict:
+        """Recorded files and the space sharing content saves, plus this session's counters"""
+        with self._lock:
+            files, logical = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+            unique = self._conn.execute("SELECT COUNT(DISTINCT hash) FROM files").fetchone()[0]
+            stored = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM"
+                " (SELECT MAX(size) AS size FROM files GROUP BY device, inode)").fetchone()[0]
+            return {
+                'files': files,
+                'unique_contents': unique,
+                'logical_bytes': logical,
+                'stored_bytes': stored,
+                **self.counters,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores: Dict[str, ContentStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(download_path: str) -> ContentStore:
+    """Shared content store for a download folder"""
+    key = os.path.abspath(download_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ContentStore(key)
+        return store
@@ -0,0 +1,400 @@
+import http.client
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from cancellation import KEEP_PARTIAL, DELETE_PARTIAL
+from format_selector import FormatTarget
+from job_queue import DownloadJob, JobQueue, FINISHED_STATES
+from journal import JobJournal
+from warmup import Warmup
+
+if TYPE_CHECKING:
+    from main import YouTubeDownloader
+
+DEFAULT_PORT = 8765
+# Longest a status request may block waiting for a job to finish
+MAX_WAIT = 300.0
+
+DOWNLOAD_TYPES = ('video', 'audio', 'playlist')
+# Host names a request may be addressed to; others are DNS rebinding attempts
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '[::1]')
+_JOB_PATH = re.compile(r'^/jobs/(\d+)(/cancel)?$')
+
+
+class DaemonError(Exception):
+    """The daemon rejected a request or could not be reached"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def job_options(request: Dict) -> Dict:
+    """Validate a submitted job description into DownloadJob options
+
+    Raises ValueError with a message for the client on bad input.
+    """
+    download_type = request.get('type', 'video')
+    if download_type not in DOWNLOAD_TYPES:
+        raise ValueError(f"type must be one of {', '.join(DOWNLOAD_TYPES)}")
+    options = {
+        'quality': str(request.get('quality', 'best')),
+        'audio_quality': str(request.get('audio_quality', '5')),
+        'format_id': request.get('format_id'),
+        'target': request.get('target'),
+        'playlist_type': request.get('playlist_type', 'video'),
+        'connections': request.get('connections'),
+        'priority': int(request.get('priority', 0)),
+        'stream': bool(request.get('stream', True)),
+        'partial_policy': request.get('partial_policy', KEEP_PARTIAL),
+    }
+    if options['target']:
+        FormatTarget.parse(options['target'])
+    if options['playlist_type'] not in ('video', 'audio'):
+        raise ValueError("playlist_type must be video or audio")
+    if options['partial_policy'] not in (KEEP_PARTIAL, DELETE_PARTIAL):
+        raise ValueError(f"partial_policy must be {KEEP_PARTIAL} or {DELETE_PARTIAL}")
+    if options['connections'] is not None:
+        options['connections'] = max(1, int(options['connections']))
+    return options
+
+
+def job_record(job: DownloadJob) -> Dict:
+    """A job's state as plain data for the API"""
+    record = {
+        'id': job.id,
+        'url': job.url,
+        'type': job.download_type,
+        'state': job.state,
+        'title': job.title,
+        'progress': round(job.progress, 1),
+        'status': job.status_text,
+        'result': job.result,
+        'error': job.error,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+        'cancel_latency': job.cancel_latency,
+    }
+    if job.snapshot is not None:
+        status, downloaded, total, speed, eta = job.snapshot
+        record.update(downloaded_bytes=downloaded, total_bytes=total, speed=speed, eta=eta)
+    return record
+
+
+class DownloadDaemon:
+    """Keeps a YouTubeDownloader warm and runs jobs submitted over a local HTTP API
+
+    Every job shares the downloader's pooled yt-dlp sessions, info cache,
+    connection pool and bandwidth scheduler, so a submitted job starts
+    without paying interpreter startup, the yt-dlp import or extractor
+    initialization. Routes, all JSON:
+
+        POST /jobs                  submit {"url": ..., "type": "video", ...}
+        GET  /jobs                  list every job
+        GET  /jobs/<id>[?wait=30]   status, optionally blocking until it finishes
+        POST /jobs/<id>/cancel      cancel (DELETE /jobs/<id> does the same)
+        GET  /health                warm-up state and queue size
+        GET  /metrics, /metrics.json
+
+    The server binds to localhost only, and answers only requests whose
+    Host header names it by a loopback name and its port, so a page whose
+    domain is rebound to 127.0.0.1 can't read it. POSTs must be sent as
+    application/json, which a web page can't do cross-origin without a
+    preflight this server never answers.
+
+    With a journal, jobs that were queued or running when the daemon
+    stopped, or crashed, are picked up again by resume().
+    """
+
+    def __init__(self, downloader: 'YouTubeDownloader', max_concurrent: int = 2, history: int = 200,
+                 journal: Optional[JobJournal] = None):
+        self.downloader = downloader
+        self.history = history
+        self.journal = journal
+        self.queue = JobQueue(self.run_job, max_concurrent=max_concurrent, on_change=self._changed,
+                              journal=journal, journal_source='daemon')
+        self.warmup = Warmup(downloader.sessions)
+        self.started = time.time()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._changes = threading.Condition()
+
+    def submit(self, url: str, download_type: str = 'video', **options) -> DownloadJob:
+        options = job_options(dict(options, type=download_type))
+        # Forget the oldest finished jobs so a long-lived daemon stays small
+        self.queue.remove_finished(keep=self.history)
+        return self.queue.submit(DownloadJob(url, download_type, options))
+
+    def resume(self) -> List[DownloadJob]:
+        """Resubmit the journaled jobs a previous daemon left unfinished"""
+        if self.journal is None:
+            return []
+        jobs = []
+        for record in self.journal.unfinished('daemon'):
+            job = DownloadJob(record['url'], record['type'], record['options'])
+            job.journal_key = record['key']
+            job.title = record['title']
+            jobs.append(self.queue.submit(job))
+        return jobs
+
+    def wait_job(self, job: DownloadJob, timeout: float) -> DownloadJob:
+        """Block until job finishes or timeout passes"""
+        with self._changes:
+            self._changes.wait_for(lambda: job.is_finished, timeout)
+        return job
+
+    def _changed(self, job: DownloadJob):
+        with self._changes:
+            self._changes.notify_all()
+
+    def progress_hook(self, job: DownloadJob, d):
+        job.snapshot = (
+            d['status'],
+            d.get('downloaded_bytes') or 0,
+            d.get('total_bytes') or d.get('total_bytes_estimate') or 0,
+            d.get('speed') or 0,
+            d.get('eta') or 0,
+        )
+        if d['status'] == 'downloading' and job.snapshot[2]:
+            job.progress = job.snapshot[1] * 100.0 / job.snapshot[2]
+            job.status_text = "Downloading"
+        elif d['status'] == 'finished':
+            job.status_text = "Processing"
+        if job.title is None and job.download_type != 'playlist':
+            job.title = (d.get('info_dict') or {}).get('title')
+
+    def run_job(self, job: DownloadJob) -> str:
+        options = job.options
+        hooks = [lambda d: self.progress_hook(job, d)]
+        target = FormatTarget.parse(options['target']) if options['target'] else None
+        job.status_text = "Running"
+        if job.download_type == 'video':
+            return self.downloader.download_video(job.url, options['quality'], options['format_id'],
+                                                  connections=options['connections'],
+                                                  priority=options['priority'], target=target,
+                                                  progress_hooks=hooks, cancel_event=job.cancel_event)
+        if job.download_type == 'audio':
+            return self.downloader.download_audio(job.url, options['audio_quality'],
+                                                  priority=options['priority'],
+                                                  progress_hooks=hooks, cancel_event=job.cancel_event)
+        quality = options['audio_quality'] if options['playlist_type'] == 'audio' else options['quality']
+        journal = self.journal.playlist(job.journal_key) if self.journal is not None else None
+        return self.downloader.download_playlist(job.url, options['playlist_type'], quality,
+                                                 priority=options['priority'], target=target,
+                                                 progress_hooks=hooks, cancel_event=job.cancel_event,
+                                                 stream=options['stream'], journal=journal)
+
+    def health(self) -> Dict:
+        return {
+            'warm': self.warmup.is_done,
+            'warmup_seconds': round(self.warmup.elapsed, 3) if self.warmup.is_done else None,
+            'active': self.queue.active_count,
+            'max_concurrent': self.queue.max_concurrent,
+            'uptime': round(time.time() - self.started, 1),
+        }
+
+    def serve(self, port: int = DEFAULT_PORT, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Warm up and serve the API from a background thread"""
+        self.warmup.start()
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name='nm-tube-daemon').start()
+        return self.server
+
+    def shutdown(self, timeout: Optional[float] = 10.0):
+        """Stop accepting requests, cancel running jobs and wait for them to stop
+
+        The journal keeps them unfinished, for the next daemon to resume.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.queue.shutdown(timeout)
+        if self.journal is not None:
+            self.journal.flush()
+
+
+def _handler(daemon: DownloadDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status: int, body: str, content_type: str):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_json(self, status: int, data):
+            self.send_body(status, json.dumps(data), 'application/json')
+
+        def foreign_host(self) -> bool:
+            """Reject (and answer) a request not addressed to this server by a loopback name"""
+            port = self.server.server_address[1]
+            allowed = {f'{host}:{port}' for host in LOCAL_HOSTS}
+            if port == 80:
+                allowed.update(LOCAL_HOSTS)
+            if (self.headers.get('Host') or '').strip().lower() in allowed:
+                return False
+            self.close_connection = True
+            self.send_json(403, {'error': "Host must be a loopback address with the daemon's port"})
+            return True
+
+        def find_job(self, job_id: str) -> Optional[DownloadJob]:
+            job = daemon.queue.get(int(job_id))
+            if job is None:
+                self.send_json(404, {'error': f"No job {job_id}"})
+            return job
+
+        def do_GET(self):
+            if self.foreign_host():
+                return
+            url = urlparse(self.path)
+            match = _JOB_PATH.match(url.path)
+            if url.path == '/jobs':
+                self.send_json(200, [job_record(job) for job in daemon.queue.jobs()])
+            elif match and not match.group(2):
+                job = self.find_job(match.group(1))
+                if job is None:
+                    return
+                wait = parse_qs(url.query).get('wait')
+                if wait:
+                    try:
+                        timeout = float(wait[0])
+                        if not math.isfinite(timeout) or timeout < 0:
+                            raise ValueError
+                    except ValueError:
+                        self.send_json(400, {'error': f"wait must be a number of seconds, not {wait[0]!r}"})
+                        return
+                    daemon.wait_job(job, min(timeout, MAX_WAIT))
+                self.send_json(200, job_record(job))
+            elif url.path == '/health':
+                self.send_json(200, daemon.health())
+            elif url.path == '/metrics':
+                self.send_body(200, daemon.downloader.metrics_text(), 'text/plain; version=0.0.4')
+            elif url.path == '/metrics.json':
+                self.send_body(200, daemon.downloader.metrics.to_json(), 'application/json')
+            else:
+                self.send_json(404, {'error': f"Unknown path {url.path}"})
+
+        def do_POST(self):
+            if self.foreign_host():
+                return
+            url = urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if self.headers.get_content_type() != 'application/json':
+                self.send_json(415, {'error': "Requests must be application/json"})
+                return
+            match = _JOB_PATH.match(url.path)
+            if url.path == '/jobs':
+                try:
+                    request = json.loads(body or b'{}')
+                    if not isinstance(request, dict) or not request.get('url'):
+                        raise ValueError("url is required")
+                    job = daemon.submit(request.pop('url'), request.pop('type', 'video'), **request)
+                except (ValueError, TypeError) as e:
+                    self.send_json(400, {'error': str(e)})
+                    return
+                self.send_json(201, job_record(job))
+            elif match and match.group(2):
+                self.cancel(match.group(1))
+            else:
+                self.send_json(404, {'error': f"Unknown path {url.path}"})
+
+        def do_DELETE(self):
+            if self.foreign_host():
+                return
+            url = urlparse(self.path)
+            match = _JOB_PATH.match(url.path)
+            if match and not match.group(2):
+                self.cancel(match.group(1))
+            else:
+                self.send_json(404, {'error': f"Unknown path {url.path}"})
+
+        def cancel(self, job_id: str):
+            job = self.find_job(job_id)
+            if job is not None:
+                daemon.queue.cancel(job.id)
+                self.send_json(200, job_record(job))
+
+    return Handler
+
+
+class DaemonClient:
+    """Thin client for a running DownloadDaemon over one kept-alive connection"""
+
+    def __init__(self, port: int = DEFAULT_PORT, host: str = '127.0.0.1', timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def _request(self, method: str, path: str, data: Optional[Dict] = None, timeout: Optional[float] = None):
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        # Reconnect once if the daemon closed the idle connection meanwhile
+        for attempt in (1, 2):
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._connection.timeout = timeout or self.timeout
+            try:
+                if self._connection.sock is not None:
+                    self._connection.sock.settimeout(self._connection.timeout)
+                self._connection.request(method, path, body=body, headers=headers)
+                response = self._connection.getresponse()
+                payload = json.loads(response.read() or b'null')
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                self.close()
+                if attempt == 2:
+                    raise DaemonError(f"Daemon closed the connection: {e}") from e
+            except OSError as e:
+                self.close()
+                raise DaemonError(f"No daemon at {self.host}:{self.port} ({e})") from e
+        if response.status >= 400:
+            raise DaemonError(payload.get('error') if isinstance(payload, dict) else response.reason,
+                              response.status)
+        return payload
+
+    def submit(self, url: str, download_type: str = 'video', **options) -> Dict:
+        return self._request('POST', '/jobs', dict(options, url=url, type=download_type))
+
+    def status(self, job_id: int, wait: Optional[float] = None) -> Dict:
+        """A job's state; with wait, block up to that many seconds for it to finish"""
+        if wait:
+            return self._request('GET', f'/jobs/{job_id}?wait={wait:g}', timeout=wait + self.timeout)
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> Dict:
+        """Block until the job has finished, long-polling instead of spinning"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = MAX_WAIT if deadline is None else min(MAX_WAIT, deadline - time.monotonic())
+            record = self.status(job_id, wait=max(left, 0.001))
+            if record['state'] in FINISHED_STATES or left <= 0:
+                return record
+
+    def cancel(self, job_id: int) -> Dict:
+        return self._request('POST', f'/jobs/{job_id}/cancel', {})
+
+    def jobs(self) -> List[Dict]:
+        return self._request('GET', '/jobs')
+
+    def health(self) -> Dict:
+        return self._request('GET', '/health')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+ARCHIVE_FILENAME = ".nm_tube_archive.sqlite"
+# A download folder's databases are kept per user, not among its files
+FOLDER_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nm-tube", "folders")
+
+AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.opus', '.ogg', '.wav', '.aac', '.flac'}
+MEDIA_EXTENSIONS = AUDIO_EXTENSIONS | {'.mp4', '.webm', '.mkv', '.mov', '.flv', '.3gp', '.avi'}
+
+# yt-dlp's default template ends in " [<id>]"
+_BRACKETED_ID_RE = re.compile(r'\[([0-9A-Za-z_-]{11})\]$')
+# Playlist downloads are named "<playlist_index> - <title>"
+_PLAYLIST_PREFIX_RE = re.compile(r'^\d+ - ')
+
+
+def folder_state_path(download_path: str, filename: str) -> str:
+    """Where the database filename of a download folder is kept
+
+    A folder that already holds it, from an older version, keeps using it;
+    otherwise it goes under FOLDER_STATE_DIR, in a directory named by a
+    hash of the folder's absolute path.
+    """
+    in_folder = os.path.join(download_path, filename)
+    if os.path.exists(in_folder):
+        return in_folder
+    folder = os.path.abspath(download_path).encode('utf-8', 'surrogateescape')
+    return os.path.join(FOLDER_STATE_DIR, hashlib.sha256(folder).hexdigest()[:16], filename.lstrip('.'))
+
+
+def kind_for_extension(ext: str) -> str:
+    return 'audio' if ext.lower() in AUDIO_EXTENSIONS else 'video'
+
+
+class DownloadArchive:
+    """Persistent index of completed downloads in a download folder, kept per user (see folder_state_path)"""
+
+    def __init__(self, download_path: str):
+        self.download_path = download_path
+        self.path = folder_state_path(download_path, ARCHIVE_FILENAME)
+        # Recorded IDs stay in SQLite (an indexed lookup each) rather than a set
+        # that would grow with every video of a long playlist or channel
+        self._titles: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(download_path, exist_ok=True)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # WAL and a busy timeout let the CLI and GUI write at the same time
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            " video_id TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " title TEXT,"
+            " filepath TEXT,"
+            " added REAL NOT NULL,"
+            " PRIMARY KEY (video_id, kind))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " name TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " PRIMARY KEY (name, kind))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        self._load()
+
+    def _load(self):
+        with self._lock:
+            imported = self._conn.execute("SELECT value FROM meta WHERE key = 'imported'").fetchone()
+            if imported is None:
+                self._import_existing_files()
+            self._titles = set(self._conn.execute("SELECT name, kind FROM files"))
+
+    def _import_existing_files(self):
+        """Index media already in the download folder - runs once per archive"""
+        ids = []
+        names = []
+        for dirpath, _, filenames in os.walk(self.download_path):
+            for filename in filenames:
+                stem, ext = os.path.splitext(filename)
+                filepath = os.path.join(dirpath, filename)
+                if ext == '.json' and stem.endswith('.info'):
+                    video_id = self._id_from_info_json(filepath)
+                    if video_id:
+                        ids.append((video_id, 'video', stem[:-5], None))
+                    continue
+                if ext.lower() not in MEDIA_EXTENSIONS:
+                    continue
+                kind = kind_for_extension(ext)
+                match = _BRACKETED_ID_RE.search(stem)
+                if match:
+                    ids.append((match.group(1), kind, stem, filepath))
+                names.append((stem, kind))
+                if _PLAYLIST_PREFIX_RE.match(stem):
+                    names.append((_PLAYLIST_PREFIX_RE.sub('', stem), kind))
+
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO downloads (video_id, kind, title, filepath, added) VALUES (?, ?, ?, ?, ?)",
+            [(video_id, kind, title, filepath, now) for video_id, kind, title, filepath in ids]
+        )
+        self._conn.executemany("INSERT OR IGNORE INTO files (name, kind) VALUES (?, ?)", names)
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported', ?)", (str(now),))
+        self._conn.commit()
+
+    @staticmethod
+    def _id_from_info_json(filepath: str) -> Optional[str]:
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                return json.load(f).get('id')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def contains(self, video_id: Optional[str], kind: str = 'video') -> bool:
+        """Whether video_id was already downloaded as kind"""
+        if not video_id:
+            return False
+        # Also sees what another process recorded since we opened the archive
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM downloads WHERE video_id = ? AND kind = ?", (video_id, kind)).fetchone()
+        return row is not None
+
+    def contains_title(self, title: Optional[str], kind: str = 'video') -> bool:
+        """Whether a file named after title exists from before the archive was created"""
+        if not title or not self._titles:
+            return False
+        from yt_dlp.utils import sanitize_filename
+        return (sanitize_filename(title), kind) in self._titles
+
+    def is_downloaded(self, video_id: Optional[str], title: Optional[str] = None, kind: str = 'video') -> bool:
+        return self.contains(video_id, kind) or self.contains_title(title, kind)
+
+    def filepath(self, video_id: Optional[str], kind: str = 'video') -> Optional[str]:
+        """Where video_id was saved as kind, if that was recorded"""
+        if not video_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filepath FROM downloads WHERE video_id = ? AND kind = ?", (video_id, kind)).fetchone()
+        return row[0] if row else None
+
+    def add(self, video_id: str, kind: str = 'video', title: Optional[str] = None,
+            filepath: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (video_id, kind, title, filepath, added) VALUES (?, ?, ?, ?, ?)",
+                (video_id, kind, title, filepath, time.time())
+            )
+            self._conn.commit()
+
+    def add_info(self, info: Dict, kind: str = 'video'):
+        """Record a finished download from its processed info dict"""
+        if not info or not info.get('id'):
+            return
+        downloads = info.get('requested_downloads') or [{}]
+        self.add(info['id'], kind, info.get('title'), downloads[-1].get('filepath'))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_archives: Dict[str, DownloadArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(download_path: str) -> DownloadArchive:
+    """Shared archive instance for a download folder"""
+    key = os.path.abspath(download_path)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = _archives[key] = DownloadArchive(key)
+        return archive
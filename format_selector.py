@@ -0,0 +1,258 @@
+import bisect
+import re
+import shutil
+from typing import Dict, Iterator, List, Optional
+
+# Format string used on info whose formats were narrowed to a FormatChoice:
+# merges a video-only + audio-only pair, otherwise takes the single file
+SELECTED_FORMAT = 'bv*+ba/b'
+
+PREFER_BEST = 'best'
+PREFER_SMALLEST = 'smallest'
+
+_CODEC_FAMILIES = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'hev1': 'h265', 'hvc1': 'h265', 'h265': 'h265',
+    'vp8': 'vp8', 'vp9': 'vp9', 'vp09': 'vp9',
+    'av01': 'av1', 'av1': 'av1',
+    'mp4a': 'aac', 'aac': 'aac', 'opus': 'opus', 'vorbis': 'vorbis',
+}
+_VIDEO_CODECS = ('h264', 'h265', 'vp8', 'vp9', 'av1')
+
+_SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+_SIZE_RE = re.compile(r'(<=?)?\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB)', re.IGNORECASE)
+_FPS_RE = re.compile(r'(<=?)?\s*(\d+)\s*fps', re.IGNORECASE)
+_HEIGHT_RE = re.compile(r'(>=|<=)?\s*(\d+)p?\s*([+-])?', re.IGNORECASE)
+
+
+class NoMatchingFormat(ValueError):
+    """No format of the video satisfies the target"""
+
+
+def codec_family(codec: Optional[str]) -> Optional[str]:
+    """'avc1.64001F' -> 'h264', 'none' -> None"""
+    if not codec or codec == 'none':
+        return None
+    prefix = codec.split('.')[0].lower()
+    return _CODEC_FAMILIES.get(prefix, prefix)
+
+
+def estimate_size(fmt: Dict, duration: Optional[float]) -> Optional[int]:
+    """Bytes a format will transfer, from its size or else its bitrate and the duration"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    tbr = fmt.get('tbr') or (fmt.get('vbr') or 0) + (fmt.get('abr') or 0)
+    if tbr and duration:
+        # tbr is in kbit/s
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+def format_size(size: Optional[int], exact: bool = True) -> str:
+    if not size:
+        return "Unknown"
+    return f"{'' if exact else '~'}{size / 1024 / 1024:.1f}MB"
+
+
+class FormatRecord:
+    """The fields of one format that selection looks at"""
+
+    def __init__(self, fmt: Dict, duration: Optional[float]):
+        self.format_id = str(fmt.get('format_id'))
+        self.ext = fmt.get('ext')
+        self.height = fmt.get('height') or 0
+        self.fps = fmt.get('fps') or 0
+        self.vcodec = codec_family(fmt.get('vcodec'))
+        self.acodec = codec_family(fmt.get('acodec'))
+        self.tbr = fmt.get('tbr') or 0
+        self.abr = fmt.get('abr') or 0
+        self.size = estimate_size(fmt, duration)
+        self.size_exact = bool(fmt.get('filesize'))
+        vcodec, acodec = fmt.get('vcodec'), fmt.get('acodec')
+        # Extractors that omit both codecs usually serve muxed files
+        self.has_video = vcodec != 'none' and (vcodec is not None or bool(self.height) or acodec is None)
+        self.has_audio = acodec != 'none'
+
+
+class FormatChoice:
+    """One format, or a video-only + audio-only pair to merge"""
+
+    def __init__(self, records: List[FormatRecord]):
+        self.records = records
+        self.video = records[0]
+        self.format_spec = '+'.join(r.format_id for r in records)
+        sizes = [r.size for r in records]
+        self.size: Optional[int] = sum(sizes) if None not in sizes else None
+        self.size_exact = all(r.size_exact for r in records)
+
+    @property
+    def height(self) -> int:
+        return self.video.height
+
+    @property
+    def needs_merge(self) -> bool:
+        return len(self.records) > 1
+
+    def apply(self, info: Dict) -> Dict:
+        """Copy of unprocessed info narrowed to the chosen formats, for SELECTED_FORMAT"""
+        wanted = {r.format_id for r in self.records}
+        return dict(info, formats=[dict(f) for f in info.get('formats') or []
+                                   if str(f.get('format_id')) in wanted])
+
+    def describe(self) -> str:
+        video = self.video
+        parts = [self.format_spec, f"{video.height}p" if video.height else "audio only"]
+        if video.vcodec:
+            parts.append(video.vcodec)
+        parts.append(format_size(self.size, self.size_exact))
+        return ' '.join(parts)
+
+
+class FormatTarget:
+    """Constraints on the format to pick and whether to favour quality or fewer bytes"""
+
+    def __init__(self, min_height: Optional[int] = None, max_height: Optional[int] = None,
+                 max_bytes: Optional[int] = None, prefer: str = PREFER_BEST,
+                 codec: Optional[str] = None, ext: Optional[str] = None, max_fps: Optional[int] = None):
+        if prefer not in (PREFER_BEST, PREFER_SMALLEST):
+            raise ValueError(f"prefer must be '{PREFER_BEST}' or '{PREFER_SMALLEST}'")
+        self.min_height = min_height
+        self.max_height = max_height
+        self.max_bytes = max_bytes
+        self.prefer = prefer
+        self.codec = codec_family(codec) if codec else None
+        self.ext = ext
+        self.max_fps = max_fps
+
+    @classmethod
+    def parse(cls, spec: str) -> 'FormatTarget':
+        """Build a target from comma separated terms
+
+        720+ or >=720 (at least 720p), 1080- or <=1080 (at most 1080p),
+        <100MB or <104857600B (size cap), 30fps or <=30fps, smallest or best, a codec
+        (h264, vp9, av1) and a container (mp4, webm). For example
+        "720+,smallest" or "best,<250MB,h264".
+        """
+        target = cls()
+        for term in (t.strip() for t in spec.split(',')):
+            lower = term.lower()
+            if not term:
+                continue
+            if lower in (PREFER_BEST, PREFER_SMALLEST):
+                target.prefer = lower
+            elif lower in ('mp4', 'webm', 'mkv', '3gp', 'flv'):
+                target.ext = lower
+            elif _CODEC_FAMILIES.get(lower) in _VIDEO_CODECS:
+                target.codec = _CODEC_FAMILIES[lower]
+            elif _SIZE_RE.fullmatch(term):
+                _, number, unit = _SIZE_RE.fullmatch(term).groups()
+                target.max_bytes = int(float(number) * _SIZE_UNITS[unit.upper()])
+            elif _FPS_RE.fullmatch(term):
+                target.max_fps = int(_FPS_RE.fullmatch(term).group(2))
+            elif _HEIGHT_RE.fullmatch(term):
+                prefix, number, suffix = _HEIGHT_RE.fullmatch(term).groups()
+                if prefix == '>=' or suffix == '+':
+                    target.min_height = int(number)
+                elif prefix == '<=' or suffix == '-':
+                    target.max_height = int(number)
+                else:
+                    target.min_height = target.max_height = int(number)
+            else:
+                raise ValueError(f"Unknown format target term: {term!r}")
+        return target
+
+    def __str__(self) -> str:
+        terms = [self.prefer]
+        if self.min_height and self.min_height == self.max_height:
+            terms.append(f"{self.min_height}p")
+        else:
+            if self.min_height:
+                terms.append(f"{self.min_height}+")
+            if self.max_height:
+                terms.append(f"<={self.max_height}")
+        if self.max_bytes:
+            # Whole megabytes read better; anything else keeps the exact byte count
+            mb, rest = divmod(self.max_bytes, _SIZE_UNITS['MB'])
+            terms.append(f"<{mb}MB" if mb and not rest else f"<{self.max_bytes}B")
+        terms.extend(t for t in (self.codec, self.ext) if t)
+        if self.max_fps:
+            terms.append(f"<={self.max_fps}fps")
+        return ','.join(terms)
+
+
+class FormatIndex:
+    """Formats of one video indexed by height, with estimated transfer sizes"""
+
+    def __init__(self, info: Dict):
+        self.title = info.get('title')
+        self.duration = info.get('duration')
+        self.records = [FormatRecord(f, self.duration) for f in info.get('formats') or []
+                        if f.get('format_id') and f.get('ext') != 'mhtml']  # skip storyboards
+        self.by_height: Dict[int, List[FormatRecord]] = {}
+        for record in self.records:
+            if record.has_video:
+                self.by_height.setdefault(record.height, []).append(record)
+        for records in self.by_height.values():
+            records.sort(key=self._size_key)
+        self.heights = sorted(self.by_height)
+        self.audio = sorted((r for r in self.records if r.has_audio and not r.has_video), key=self._size_key)
+
+    @staticmethod
+    def _size_key(record: FormatRecord):
+        # Unknown sizes sort after every known one
+        return (record.size is None, record.size or 0)
+
+    def video_formats(self) -> List[FormatRecord]:
+        """Video formats from the highest resolution down, smallest first within one"""
+        return [r for height in reversed(self.heights) for r in self.by_height[height]]
+
+    def candidates(self, target: FormatTarget, allow_merge: bool) -> Iterator[FormatChoice]:
+        low = bisect.bisect_left(self.heights, target.min_height or 0)
+        high = bisect.bisect_right(self.heights, target.max_height) if target.max_height else len(self.heights)
+        audio = [a for a in self.audio if not target.ext or a.ext == target.ext
+                 or (target.ext == 'mp4' and a.ext == 'm4a')]
+        for height in self.heights[low:high]:
+            for record in self.by_height[height]:
+                if target.codec and record.vcodec != target.codec:
+                    continue
+                if target.ext and record.ext != target.ext:
+                    continue
+                if target.max_fps and record.fps > target.max_fps:
+                    continue
+                if record.has_audio:
+                    yield FormatChoice([record])
+                elif allow_merge:
+                    for audio_record in audio:
+                        yield FormatChoice([record, audio_record])
+
+    def select(self, target: FormatTarget, allow_merge: Optional[bool] = None) -> Optional[FormatChoice]:
+        """Cheapest format meeting the target, or the best one that fits its size cap"""
+        if allow_merge is None:
+            allow_merge = ffmpeg_available()
+        choices = [c for c in self.candidates(target, allow_merge)
+                   if target.max_bytes is None or (c.size is not None and c.size <= target.max_bytes)]
+        if not choices:
+            return None
+        if target.prefer == PREFER_SMALLEST:
+            # Fewest bytes; ties go to the higher resolution
+            return min(choices, key=lambda c: (c.size is None, c.size or 0, -c.height))
+
+        def quality(choice: FormatChoice):
+            audio = choice.records[-1]
+            audio_rate = (audio.abr or audio.tbr) if choice.needs_merge else 0
+            return (choice.height, choice.video.fps, choice.video.tbr, audio_rate, -(choice.size or 0))
+
+        return max(choices, key=quality)
+
+
+def select_format(info: Dict, target: FormatTarget, allow_merge: Optional[bool] = None) -> FormatChoice:
+    """Pick the format of info for target, raising NoMatchingFormat if none qualifies"""
+    choice = FormatIndex(info).select(target, allow_merge)
+    if choice is None:
+        raise NoMatchingFormat(f"No format of '{info.get('title')}' matches {target}")
+    return choice
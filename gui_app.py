@@ -1,15 +1,96 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
-import yt_dlp
 import os
-from typing import Optional
+import logging
+import logging.handlers
+from typing import List, Optional
 import sys
 import re
+from collections import deque
+from playlist import stream_playlist, download_playlist_entries
+from info_cache import InfoCache, extract_info, download_from_info, extract_video_id
+from session_pool import get_default_pool
+from download_archive import get_archive
+from content_store import ContentStore, get_store
+from journal import get_journal
+from segmented import download_info_segmented
+from bandwidth import get_scheduler, PRIORITIES
+from warmup import Warmup
+from cancellation import DELETE_PARTIAL, KEEP_PARTIAL, call_cancellable
+from job_queue import DownloadJob, DownloadCancelled, JobQueue, CANCELLED, DONE, RUNNING
+from format_selector import FormatTarget, PREFER_SMALLEST, SELECTED_FORMAT, select_format
+from transcode import TranscodePipeline, downloaded_path
+from adaptive import Backoff
+
+PICK_BEST = "Best ≤ quality"
+PICK_SMALLEST = "Smallest ≥ quality"
+
+class RingLog:
+    """Log view backed by a fixed-capacity ring buffer of lines"""
+    
+    def __init__(self, widget, capacity: int = 1000, trim_batch: Optional[int] = None,
+                 log_file: Optional[str] = None, max_file_bytes: int = 5 * 1024 * 1024,
+                 backup_count: int = 3):
+        self.widget = widget
+        self.capacity = max(1, capacity)
+        # Trimming a handful of lines per insert is as slow as trimming many,
+        # so let the widget overshoot and cut it back in one delete
+        self.trim_batch = trim_batch or max(1, self.capacity // 10)
+        self.lines = deque(maxlen=self.capacity)
+        self._widget_lines = 0
+        
+        self.file_logger = None
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_file_bytes, backupCount=backup_count, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.file_logger = logging.getLogger(f"nm_tube.log.{id(self)}")
+            self.file_logger.propagate = False
+            self.file_logger.setLevel(logging.INFO)
+            self.file_logger.addHandler(handler)
+    
+    def append(self, lines: List[str]):
+        """Add lines to the view - call on the Tk main loop"""
+        if not lines:
+            return
+        if self.file_logger:
+            for line in lines:
+                self.file_logger.info(line)
+        
+        lines = "\n".join(lines).split("\n")
+        self.lines.extend(lines)
+        # Only the tail that survives in the buffer is worth inserting
+        visible = lines[-self.capacity:]
+        self.widget.insert(tk.END, "\n".join(visible) + "\n")
+        self._widget_lines += len(visible)
+        
+        excess = self._widget_lines - self.capacity
+        if excess >= self.trim_batch:
+            self.widget.delete("1.0", f"{excess + 1}.0")
+            self._widget_lines -= excess
+        self.widget.see(tk.END)
+    
+    def clear(self):
+        self.lines.clear()
+        self.widget.delete("1.0", tk.END)
+        self._widget_lines = 0
+    
+    def close(self):
+        if self.file_logger:
+            for handler in list(self.file_logger.handlers):
+                handler.close()
+                self.file_logger.removeHandler(handler)
 
 class YouTubeDownloaderGUI:
-    def __init__(self, root):
+    # Progress, status and log updates are rendered at this fixed rate
+    UI_TICK_MS = 100
+    
+    def __init__(self, root, log_lines: int = 1000, log_file: Optional[str] = None):
         self.root = root
+        self.log_lines = log_lines
+        self.log_file = log_file
         self.root.title("NM Tube")
         self.root.geometry("600x550")
         self.root.resizable(True, True)
@@ -34,13 +115,34 @@ class YouTubeDownloaderGUI:
         self.download_path = os.path.join(os.getcwd(), "downloads")
         os.makedirs(self.download_path, exist_ok=True)
         
-        # Download state
-        self.is_downloading = False
-        self.cancel_download = False
-        self.current_download = None
+        # Shared metadata cache, also used by the CLI
+        self.info_cache = InfoCache()
+        self.sessions = get_default_pool()
+        self.bandwidth = get_scheduler()
+        
+        # Download queue - each job carries its own state and cancel token, and is
+        # journaled so downloads cut short by a crash or closing the app can resume
+        self.journal = get_journal()
+        self.job_queue = JobQueue(self.run_job, max_concurrent=2, journal=self.journal, journal_source='gui')
+        # Playlist entries hit by a 429 or a dropped connection are retried with jittered backoff
+        self.backoff = Backoff()
+        
+        # State handed from worker threads to the UI tick
+        self._pending_logs = deque()
+        self._pending_status = None
+        self._job_views = {}
+        self._queue_active = False
         
         self.setup_ui()
         
+        # Paint the window first; yt-dlp loads and ffmpeg is probed in the background
+        self._ready = False
+        self.download_btn.config(state="disabled", text="⏳ LOADING...", bg="#555555")
+        self.warmup = Warmup(self.sessions).start()
+        self._transcoder: Optional[TranscodePipeline] = None
+        self._transcoder_lock = threading.Lock()
+        self.root.after(self.UI_TICK_MS, self.ui_tick)
+        
     def setup_ui(self):
         # Configure style
         style = ttk.Style()
@@ -225,6 +327,40 @@ class YouTubeDownloaderGUI:
         )
         self.quality_combo.pack(side="left")
         
+        # Pick by transfer cost: the best format up to the quality or the smallest at least that good
+        self.pick_var = tk.StringVar(value=PICK_BEST)
+        self.pick_combo = ttk.Combobox(
+            self.video_quality_container,
+            textvariable=self.pick_var,
+            values=[PICK_BEST, PICK_SMALLEST],
+            state="readonly",
+            width=14,
+            font=("Segoe UI", 9),
+            style='Quality.TCombobox'
+        )
+        self.pick_combo.pack(side="left", padx=(5, 0))
+        
+        tk.Label(
+            self.video_quality_container,
+            text="Max MB:",
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary']
+        ).pack(side="left", padx=(8, 5))
+        
+        self.max_size_var = tk.StringVar(value="")
+        tk.Entry(
+            self.video_quality_container,
+            textvariable=self.max_size_var,
+            width=6,
+            font=("Segoe UI", 9),
+            bg=self.colors['text_bg'],
+            fg='#ffffff',
+            insertbackground=self.colors['accent'],
+            relief="flat",
+            borderwidth=0
+        ).pack(side="left", ipady=3)
+        
         # Audio quality section
         self.audio_quality_container = tk.Frame(quality_inner, bg=self.colors['secondary'])
         
@@ -250,6 +386,61 @@ class YouTubeDownloaderGUI:
         )
         self.audio_quality_entry.pack(side="left", ipady=3)
         
+        # Parallel playlist downloads section
+        self.workers_container = tk.Frame(quality_inner, bg=self.colors['secondary'])
+        
+        tk.Label(
+            self.workers_container,
+            text="⇉ Parallel:",
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary']
+        ).pack(side="left", padx=(0, 5))
+        
+        self.workers_var = tk.StringVar(value="4")
+        self.workers_spinbox = tk.Spinbox(
+            self.workers_container,
+            from_=1,
+            to=16,
+            textvariable=self.workers_var,
+            width=4,
+            font=("Segoe UI", 9),
+            bg=self.colors['text_bg'],
+            fg='#ffffff',
+            buttonbackground=self.colors['text_bg'],
+            insertbackground=self.colors['accent'],
+            relief="flat",
+            borderwidth=0
+        )
+        self.workers_spinbox.pack(side="left", ipady=3)
+        
+        # Connections per video section
+        self.connections_container = tk.Frame(quality_inner, bg=self.colors['secondary'])
+        
+        tk.Label(
+            self.connections_container,
+            text="⇶ Connections:",
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary']
+        ).pack(side="left", padx=(0, 5))
+        
+        self.connections_var = tk.StringVar(value="4")
+        tk.Spinbox(
+            self.connections_container,
+            from_=1,
+            to=16,
+            textvariable=self.connections_var,
+            width=4,
+            font=("Segoe UI", 9),
+            bg=self.colors['text_bg'],
+            fg='#ffffff',
+            buttonbackground=self.colors['text_bg'],
+            insertbackground=self.colors['accent'],
+            relief="flat",
+            borderwidth=0
+        ).pack(side="left", ipady=3)
+        
         # Download Path - Very Compact
         path_frame = tk.LabelFrame(
             main_container,
@@ -294,6 +485,38 @@ class YouTubeDownloaderGUI:
         browse_btn.bind("<Enter>", lambda e: browse_btn.config(bg="#00e676"))
         browse_btn.bind("<Leave>", lambda e: browse_btn.config(bg=self.colors['success']))
         
+        # Cancelled jobs keep their .part files by default so a retry resumes
+        self.keep_partial_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            path_inner,
+            text="Keep partial files",
+            variable=self.keep_partial_var,
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary'],
+            selectcolor=self.colors['text_bg'],
+            activebackground=self.colors['secondary'],
+            activeforeground="#ffffff",
+            relief="flat",
+            borderwidth=0
+        ).pack(side="left", padx=(8, 0))
+        
+        # Identical files are hard-linked to one copy unless this is unticked
+        self.dedupe_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            path_inner,
+            text="Deduplicate files",
+            variable=self.dedupe_var,
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary'],
+            selectcolor=self.colors['text_bg'],
+            activebackground=self.colors['secondary'],
+            activeforeground="#ffffff",
+            relief="flat",
+            borderwidth=0
+        ).pack(side="left", padx=(8, 0))
+        
         # Button container for download and cancel buttons
         button_frame = tk.Frame(main_container, bg=self.colors['bg'])
         button_frame.pack(pady=8, fill="x")
@@ -312,8 +535,8 @@ class YouTubeDownloaderGUI:
             pady=8
         )
         self.download_btn.pack(side="left", fill="x", expand=True, padx=(0, 4))
-        self.download_btn.bind("<Enter>", lambda e: self.download_btn.config(bg=self.colors['button_hover']) if not self.is_downloading else None)
-        self.download_btn.bind("<Leave>", lambda e: self.download_btn.config(bg=self.colors['button']) if not self.is_downloading else None)
+        self.download_btn.bind("<Enter>", lambda e: self.download_btn.config(bg=self.colors['button_hover']))
+        self.download_btn.bind("<Leave>", lambda e: self.download_btn.config(bg=self.colors['button']))
         
         # Cancel Button (hidden by default)
         self.cancel_btn = tk.Button(
@@ -328,10 +551,137 @@ class YouTubeDownloaderGUI:
             cursor="hand2",
             pady=8
         )
-        # Don't pack cancel button initially - show it during download
+        # Don't pack cancel button initially - show it while jobs are active
         self.cancel_btn.bind("<Enter>", lambda e: self.cancel_btn.config(bg="#cc5200"))
         self.cancel_btn.bind("<Leave>", lambda e: self.cancel_btn.config(bg="#ff6600"))
         
+        # Download Queue
+        queue_frame = tk.LabelFrame(
+            main_container,
+            text=" 🗂 Queue ",
+            font=("Segoe UI", 9, "bold"),
+            fg="#cccccc",
+            bg=self.colors['secondary'],
+            borderwidth=1,
+            relief="solid"
+        )
+        queue_frame.pack(pady=5, fill="x")
+        
+        queue_inner = tk.Frame(queue_frame, bg=self.colors['secondary'])
+        queue_inner.pack(padx=8, pady=5, fill="x")
+        
+        queue_controls = tk.Frame(queue_inner, bg=self.colors['secondary'])
+        queue_controls.pack(fill="x", pady=(0, 4))
+        
+        tk.Label(
+            queue_controls,
+            text="Concurrent downloads:",
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary']
+        ).pack(side="left", padx=(0, 5))
+        
+        self.concurrent_var = tk.StringVar(value=str(self.job_queue.max_concurrent))
+        tk.Spinbox(
+            queue_controls,
+            from_=1,
+            to=8,
+            textvariable=self.concurrent_var,
+            command=self.on_concurrency_change,
+            width=4,
+            font=("Segoe UI", 9),
+            bg=self.colors['text_bg'],
+            fg='#ffffff',
+            buttonbackground=self.colors['text_bg'],
+            insertbackground=self.colors['accent'],
+            relief="flat",
+            borderwidth=0
+        ).pack(side="left", ipady=3)
+        
+        clear_btn = tk.Button(
+            queue_controls,
+            text="🧹 Clear finished",
+            command=self.clear_finished_jobs,
+            bg=self.colors['text_bg'],
+            fg="white",
+            font=("Segoe UI", 8),
+            relief="flat",
+            borderwidth=0,
+            cursor="hand2",
+            padx=8
+        )
+        clear_btn.pack(side="right")
+        
+        tk.Label(
+            queue_controls,
+            text="Limit MB/s:",
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary']
+        ).pack(side="left", padx=(12, 5))
+        
+        self.rate_limit_var = tk.StringVar(value="0")
+        rate_limit_entry = tk.Entry(
+            queue_controls,
+            textvariable=self.rate_limit_var,
+            width=5,
+            font=("Segoe UI", 9),
+            bg=self.colors['text_bg'],
+            fg='#ffffff',
+            insertbackground=self.colors['accent'],
+            relief="flat",
+            borderwidth=0
+        )
+        rate_limit_entry.pack(side="left", ipady=3)
+        rate_limit_entry.bind("<Return>", lambda e: self.on_rate_limit_change())
+        rate_limit_entry.bind("<FocusOut>", lambda e: self.on_rate_limit_change())
+        
+        tk.Label(
+            queue_controls,
+            text="Priority:",
+            font=("Segoe UI", 9),
+            fg="#ffffff",
+            bg=self.colors['secondary']
+        ).pack(side="left", padx=(12, 5))
+        
+        self.priority_var = tk.StringVar(value="normal")
+        ttk.Combobox(
+            queue_controls,
+            textvariable=self.priority_var,
+            values=list(PRIORITIES),
+            state="readonly",
+            width=7,
+            font=("Segoe UI", 9),
+            style='Quality.TCombobox'
+        ).pack(side="left")
+        
+        style.configure("Queue.Treeview",
+                       background=self.colors['text_bg'],
+                       fieldbackground=self.colors['text_bg'],
+                       foreground='#ffffff',
+                       borderwidth=0,
+                       font=("Segoe UI", 8))
+        style.configure("Queue.Treeview.Heading",
+                       background=self.colors['secondary'],
+                       foreground='#cccccc',
+                       font=("Segoe UI", 8, "bold"))
+        
+        self.jobs_tree = ttk.Treeview(
+            queue_inner,
+            columns=("id", "type", "name", "status", "rate", "progress"),
+            show="headings",
+            height=4,
+            style="Queue.Treeview"
+        )
+        for column, heading, width, stretch in [("id", "#", 30, False), ("type", "Type", 60, False),
+                                                ("name", "Title / URL", 200, True),
+                                                ("status", "Status", 140, True),
+                                                ("rate", "MB/s", 50, False),
+                                                ("progress", "%", 45, False)]:
+            self.jobs_tree.heading(column, text=heading)
+            self.jobs_tree.column(column, width=width, stretch=stretch)
+        self.jobs_tree.pack(fill="x")
+        
         # Compact Progress Section
         progress_frame = tk.LabelFrame(
             main_container,
@@ -385,6 +735,7 @@ class YouTubeDownloaderGUI:
             insertbackground=self.colors['accent']
         )
         self.progress_text.pack(fill="both", expand=True)
+        self.log_view = RingLog(self.progress_text, capacity=self.log_lines, log_file=self.log_file)
         
         # Initialize quality visibility
         self.on_download_type_change()
@@ -396,15 +747,21 @@ class YouTubeDownloaderGUI:
         if download_type == "audio":
             # Hide video quality, show audio quality
             self.video_quality_container.pack_forget()
+            self.workers_container.pack_forget()
+            self.connections_container.pack_forget()
             self.audio_quality_container.pack(side="left", padx=(0, 20))
         elif download_type == "video":
             # Show video quality, hide audio quality
             self.video_quality_container.pack(side="left", padx=(0, 20))
             self.audio_quality_container.pack_forget()
+            self.workers_container.pack_forget()
+            self.connections_container.pack(side="left", padx=(0, 20))
         else:  # playlist
-            # Show both
+            # Show video quality and parallel download count
             self.video_quality_container.pack(side="left", padx=(0, 20))
             self.audio_quality_container.pack_forget()
+            self.connections_container.pack_forget()
+            self.workers_container.pack(side="left", padx=(0, 20))
     
     def browse_folder(self):
         folder = filedialog.askdirectory()
@@ -414,266 +771,435 @@ class YouTubeDownloaderGUI:
             self.path_entry.insert(0, folder)
     
     def cancel_download_action(self):
-        """Cancel the current download"""
-        if self.is_downloading:
-            self.cancel_download = True
-            self.log_message("\n⚠️ Cancelling download...")
+        """Cancel the selected jobs, or every active job when none is selected"""
+        selected = [int(iid) for iid in self.jobs_tree.selection()]
+        job_ids = selected or [job.id for job in self.job_queue.jobs() if not job.is_finished]
+        for job_id in job_ids:
+            if self.job_queue.cancel(job_id):
+                self.log_message(f"⚠️ [#{job_id}] Cancelling download...")
+        if job_ids:
             self.update_status("Cancelling...", "#ff6600")
+    
+    def on_concurrency_change(self):
+        value = self.concurrent_var.get()
+        if value.isdigit():
+            self.job_queue.set_max_concurrent(int(value))
+    
+    def on_rate_limit_change(self):
+        """Apply the global bandwidth cap; 0 or empty means unlimited"""
+        try:
+            limit = float(self.rate_limit_var.get() or 0)
+        except ValueError:
+            return
+        self.bandwidth.set_rate(limit * 1024 * 1024)
+    
+    def job_hooks(self, job: DownloadJob):
+        return [lambda d: self.progress_hook(job, d)] + job.hooks
+    
+    def clear_finished_jobs(self):
+        for job in self.job_queue.jobs():
+            if job.is_finished:
+                self._job_views.pop(job.id, None)
+                if self.jobs_tree.exists(str(job.id)):
+                    self.jobs_tree.delete(str(job.id))
+        self.job_queue.remove_finished()
             
     def log_message(self, message):
-        """Add message to progress text widget - thread-safe"""
-        def update():
-            self.progress_text.insert(tk.END, message + "\n")
-            self.progress_text.see(tk.END)
-        self.root.after(0, update)
+        """Queue a message for the progress text widget - thread-safe"""
+        self._pending_logs.append(message)
     
     def update_status(self, message, color="#aaaaaa"):
-        """Update status label - thread-safe"""
-        def update():
-            self.status_label.config(text=message, fg=color)
-        self.root.after(0, update)
+        """Queue a status label update - thread-safe"""
+        self._pending_status = (message, color)
     
-    def update_progress_bar(self, value):
-        """Update progress bar - thread-safe"""
-        def update():
-            self.progress_bar['value'] = value
-        self.root.after(0, update)
-        
-    def progress_hook(self, d):
-        """Hook for yt-dlp progress updates"""
+    def ui_tick(self):
+        """Render the latest job, status and log state at a fixed rate"""
+        try:
+            if not self._ready and self.warmup.is_done:
+                self.on_warmup_done()
+            self.render_jobs()
+            self.flush_logs()
+            status = self._pending_status
+            if status is not None:
+                self._pending_status = None
+                self.status_label.config(text=status[0], fg=status[1])
+        finally:
+            self.root.after(self.UI_TICK_MS, self.ui_tick)
+    
+    def on_warmup_done(self):
+        self._ready = True
+        self.download_btn.config(state="normal", text="⬇ START", bg=self.colors['button'])
+        if self.warmup.error:
+            self.log_message(f"❌ Failed to load yt-dlp: {self.warmup.error}")
+        elif not self.warmup.ffmpeg_path:
+            self.log_message("ℹ️ ffmpeg not found - audio is saved in its original format")
+        self.log_message(f"✅ Ready ({self.warmup.elapsed:.1f}s)")
+        self.root.after(0, self.resume_jobs)
+    
+    def resume_jobs(self):
+        """Offer to resume the downloads the last session left unfinished"""
+        unfinished = self.journal.unfinished('gui')
+        if not unfinished:
+            return
+        if not messagebox.askyesno("Resume downloads",
+                                   f"{len(unfinished)} download(s) from the last session did not finish.\n"
+                                   "Resume them?"):
+            for record in unfinished:
+                self.journal.update(record['key'], CANCELLED)
+            return
+        for record in unfinished:
+            options = record['options']
+            if options.get('target'):
+                options['target'] = FormatTarget.parse(options['target'])
+            job = DownloadJob(record['url'], record['type'], options)
+            job.journal_key = record['key']
+            job.title = record['title']
+            self.job_queue.submit(job)
+            self.log_message(f"♻️ [#{job.id}] Resuming: {record['title'] or record['url']}")
+    
+    def flush_logs(self):
+        lines = []
+        while self._pending_logs:
+            lines.append(self._pending_logs.popleft())
+        self.log_view.append(lines)
+    
+    def render_jobs(self):
+        jobs = self.job_queue.jobs()
+        for job in jobs:
+            view = self._job_views.setdefault(job.id, {'snapshot': None, 'values': None})
+            snapshot = job.snapshot
+            if snapshot is not view['snapshot']:
+                view['snapshot'] = snapshot
+                if not job.is_finished:
+                    self.render_progress(job, snapshot)
+            
+            iid = str(job.id)
+            rate = f"{self.bandwidth.job_rate(('gui', job.id)) / 1024 / 1024:.1f}" if job.state == RUNNING else ""
+            values = (job.id, job.download_type, job.title or job.url, job.status_text, rate, f"{job.progress:.0f}")
+            if values != view['values']:
+                view['values'] = values
+                if self.jobs_tree.exists(iid):
+                    self.jobs_tree.item(iid, values=values)
+                else:
+                    self.jobs_tree.insert('', 'end', iid=iid, values=values)
+        
+        # Overall progress is the mean over the jobs still in the queue
+        active = [j for j in jobs if not j.is_finished]
+        if active:
+            self.progress_bar['value'] = sum(j.progress for j in active) / len(active)
+            if not self._queue_active:
+                self.cancel_btn.pack(side="left", fill="x", expand=True, padx=(4, 0))
+        elif self._queue_active:
+            self.cancel_btn.pack_forget()
+            self.progress_bar['value'] = 100 if jobs and jobs[-1].state == DONE else 0
+            self._pending_status = ("✓ All downloads finished", self.colors['success'])
+        self._queue_active = bool(active)
+        
+    def progress_hook(self, job: DownloadJob, d):
+        """Hook for yt-dlp progress updates - only records the latest state"""
         # Check for cancellation
-        if self.cancel_download:
-            raise Exception("Download cancelled by user")
+        job.check_cancelled()
+        job.snapshot = (
+            d['status'],
+            d.get('downloaded_bytes') or 0,
+            d.get('total_bytes') or d.get('total_bytes_estimate') or 0,
+            d.get('speed') or 0,
+            d.get('eta') or 0,
+            d.get('error'),
+        )
+    
+    def render_progress(self, job: DownloadJob, snapshot):
+        """Format a job's latest progress snapshot - runs on the UI tick"""
+        if snapshot is None:
+            return
+        status, downloaded, total, speed, eta, error = snapshot
             
-        if d['status'] == 'downloading':
-            # Extract progress information
-            try:
-                # Get raw data
-                downloaded = d.get('downloaded_bytes', 0)
-                total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                speed = d.get('speed', 0)
-                eta = d.get('eta', 0)
+        if status == 'downloading':
+            # Calculate percentage
+            if total > 0:
+                percent = (downloaded / total) * 100
+                job.progress = percent
+                
+                # Format data
+                downloaded_mb = downloaded / (1024 * 1024)
+                total_mb = total / (1024 * 1024)
                 
-                # Calculate percentage
-                if total > 0:
-                    percent = (downloaded / total) * 100
-                    self.update_progress_bar(percent)
-                    
-                    # Format data
-                    downloaded_mb = downloaded / (1024 * 1024)
-                    total_mb = total / (1024 * 1024)
-                    
-                    if speed:
-                        speed_mb = speed / (1024 * 1024)
-                        speed_str = f"{speed_mb:.2f} MB/s"
-                    else:
-                        speed_str = "N/A"
-                    
-                    if eta:
-                        eta_min = eta // 60
-                        eta_sec = eta % 60
-                        eta_str = f"{int(eta_min)}m {int(eta_sec)}s"
-                    else:
-                        eta_str = "N/A"
-                    
-                    # Update status
-                    status_msg = f"📥 {percent:.1f}% | {downloaded_mb:.1f}/{total_mb:.1f} MB | ⚡ {speed_str} | ⏱ {eta_str}"
-                    self.update_status(status_msg, "#00ff00")
-                    
-                    # Log every 5%
-                    if not hasattr(self, '_last_log_percent'):
-                        self._last_log_percent = 0
-                    
-                    if percent - self._last_log_percent >= 5 or percent >= 99:
-                        self.log_message(status_msg)
-                        self._last_log_percent = percent
+                if speed:
+                    speed_mb = speed / (1024 * 1024)
+                    speed_str = f"{speed_mb:.2f} MB/s"
                 else:
-                    # Fallback for unknown size
-                    downloaded_mb = downloaded / (1024 * 1024)
-                    status_msg = f"📥 Downloaded: {downloaded_mb:.1f} MB"
-                    self.update_status(status_msg, "#00ff00")
-                    
-            except Exception as e:
-                # Fallback to basic display
-                percent_str = d.get('_percent_str', '0%').strip()
-                speed_str = d.get('_speed_str', 'N/A').strip()
-                eta_str = d.get('_eta_str', 'N/A').strip()
+                    speed_str = "N/A"
                 
-                try:
-                    percent = float(percent_str.replace('%', ''))
-                    self.update_progress_bar(percent)
-                except:
-                    pass
+                if eta:
+                    eta_min = eta // 60
+                    eta_sec = eta % 60
+                    eta_str = f"{int(eta_min)}m {int(eta_sec)}s"
+                else:
+                    eta_str = "N/A"
+                
+                # Update status
+                status_msg = f"📥 {percent:.1f}% | {downloaded_mb:.1f}/{total_mb:.1f} MB | ⚡ {speed_str} | ⏱ {eta_str}"
+                job.status_text = f"⚡ {speed_str} | ⏱ {eta_str}"
+                self.update_status(f"[#{job.id}] {status_msg}", "#00ff00")
                 
-                status_msg = f"📥 {percent_str} | Speed: {speed_str} | ETA: {eta_str}"
-                self.update_status(status_msg, "#00ff00")
+                # Log every 5%
+                if percent - job.last_log_percent >= 5 or percent >= 99:
+                    self.log_message(f"[#{job.id}] {status_msg}")
+                    job.last_log_percent = percent
+            else:
+                # Fallback for unknown size
+                downloaded_mb = downloaded / (1024 * 1024)
+                status_msg = f"📥 Downloaded: {downloaded_mb:.1f} MB"
+                job.status_text = status_msg
+                self.update_status(f"[#{job.id}] {status_msg}", "#00ff00")
             
-        elif d['status'] == 'finished':
-            self.update_progress_bar(100)
-            self.update_status("✓ Download finished, processing...", self.colors['success'])
-            self.log_message("✅ Download complete, processing file...")
-        
-        elif d['status'] == 'error':
-            self.update_status("✗ Download error", "#ff4444")
-            self.log_message(f"❌ Error: {d.get('error', 'Unknown error')}")
+        elif status == 'finished':
+            job.progress = 100
+            job.last_log_percent = 0
+            job.status_text = "Processing..."
+            self.update_status(f"[#{job.id}] ✓ Download finished, processing...", self.colors['success'])
+            self.log_message(f"✅ [#{job.id}] Download complete, processing file...")
+        
+        elif status == 'error':
+            job.status_text = "Error"
+            self.update_status(f"[#{job.id}] ✗ Download error", "#ff4444")
+            self.log_message(f"❌ [#{job.id}] Error: {error or 'Unknown error'}")
             
-    def download_video(self, url: str, quality: str) -> str:
+    @staticmethod
+    def job_store(job: DownloadJob) -> Optional[ContentStore]:
+        """Content store of the job's folder, or None when the job doesn't deduplicate"""
+        return get_store(job.options['download_path']) if job.options.get('dedupe', True) else None
+    
+    def download_video(self, job: DownloadJob) -> str:
+        # Skip known videos before any extraction or format resolution
+        archive = get_archive(job.options['download_path'])
+        video_id = extract_video_id(job.url)
+        if archive.contains(video_id, 'video'):
+            return f"Already downloaded: {video_id}"
+        
+        quality = job.options['quality']
         if quality == 'best':
             format_string = 'best[ext=mp4]/best'
         else:
             format_string = f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best[ext=mp4]/best'
         
         ydl_opts = {
-            'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
+            'outtmpl': os.path.join(job.options['download_path'], '%(title)s.%(ext)s'),
             'format': format_string,
             'noplaylist': True,
-            'progress_hooks': [self.progress_hook],
+            'progress_hooks': self.job_hooks(job),
             'quiet': True,
             'no_warnings': False,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            return f"Video saved: {os.path.basename(filename)}"
+        info = call_cancellable(job.cancel_event, extract_info, job.url, self.info_cache, self.sessions)
+        job.title = info.get('title')
+        if archive.is_downloaded(info.get('id'), job.title, 'video'):
+            return f"Already downloaded: {job.title}"
+        job.check_cancelled()
+        choice = None
+        target = job.options.get('target')
+        if target is not None:
+            choice = select_format(info, target)
+            info = choice.apply(info)
+            ydl_opts['format'] = SELECTED_FORMAT
+            self.log_message(f"🎯 [#{job.id}] Format {choice.describe()} for {target}")
+        connections = job.options['connections']
+        with self.sessions.session(ydl_opts) as ydl:
+            result = None
+            store = self.job_store(job)
+            if connections > 1:
+                result = download_info_segmented(ydl, info, connections,
+                                                 progress_hooks=self.job_hooks(job),
+                                                 cancel_event=job.cancel_event,
+                                                 http_pool=self.sessions.http,
+                                                 hash_content=store is not None)
+            if result is None:
+                info = call_cancellable(job.cancel_event, extract_info, job.url, self.info_cache,
+                                        self.sessions)
+                result = download_from_info(ydl, job.url, choice.apply(info) if choice else info)
+            filename = ydl.prepare_filename(result)
+        if store is not None:
+            store.ingest_info(result)
+        archive.add_info(result, 'video')
+        return f"Video saved: {os.path.basename(filename)}"
     
-    def download_audio(self, url: str, quality: str) -> str:
+    def download_audio(self, job: DownloadJob) -> str:
+        archive = get_archive(job.options['download_path'])
+        video_id = extract_video_id(job.url)
+        if archive.contains(video_id, 'audio'):
+            return f"Already downloaded: {video_id}"
+        
         ydl_opts = {
-            'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
+            'outtmpl': os.path.join(job.options['download_path'], '%(title)s.%(ext)s'),
             'format': 'bestaudio/best',
-            'progress_hooks': [self.progress_hook],
+            'progress_hooks': self.job_hooks(job),
             'quiet': True,
             'no_warnings': False,
         }
         
-        # Check if ffmpeg is available
-        try:
-            import shutil
-            if shutil.which('ffmpeg'):
-                ydl_opts['postprocessors'] = [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': quality,
-                }]
-        except Exception:
-            pass
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            if 'postprocessors' in ydl_opts:
-                filename = os.path.splitext(filename)[0] + '.mp3'
-            return f"Audio saved: {os.path.basename(filename)}"
+        info = call_cancellable(job.cancel_event, extract_info, job.url, self.info_cache, self.sessions)
+        job.title = info.get('title')
+        if archive.is_downloaded(info.get('id'), job.title, 'audio'):
+            return f"Already downloaded: {job.title}"
+        job.check_cancelled()
+        with self.sessions.session(ydl_opts) as ydl:
+            info = download_from_info(ydl, job.url, info)
+            filename = downloaded_path(info) or ydl.prepare_filename(info)
+        # ffmpeg availability was probed during warm-up
+        if self.warmup.ffmpeg_path:
+            job.check_cancelled()
+            self.log_message(f"🎼 [#{job.id}] Converting to mp3...")
+            filename = self.transcoder.submit(filename, job.options['audio_quality'],
+                                              job.cancel_event).result().target
+        # Recorded under the mp3's path once converted
+        saved = {'id': info.get('id'), 'title': info.get('title'), 'requested_downloads': [{'filepath': filename}]}
+        store = self.job_store(job)
+        if store is not None:
+            store.ingest_info(saved)
+        archive.add_info(saved, 'audio')
+        return f"Audio saved: {os.path.basename(filename)}"
     
-    def download_playlist(self, url: str, quality: str, dl_type: str) -> str:
-        if dl_type == 'audio':
-            return self.download_audio(url, quality)
-        
+    @property
+    def transcoder(self) -> TranscodePipeline:
+        """mp3 conversion stage shared by all audio jobs, sized to the cores"""
+        with self._transcoder_lock:
+            if self._transcoder is None:
+                self._transcoder = TranscodePipeline(self.warmup.ffmpeg_path)
+            return self._transcoder
+    
+    def download_playlist(self, job: DownloadJob) -> str:
+        quality = job.options['quality']
         if quality == 'best':
             format_string = 'best[ext=mp4]/best'
         else:
             format_string = f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best[ext=mp4]/best'
         
         ydl_opts = {
-            'outtmpl': os.path.join(self.download_path, '%(playlist_title)s/%(playlist_index)s - %(title)s.%(ext)s'),
+            'outtmpl': os.path.join(job.options['download_path'], '%(playlist_title)s/%(playlist_index)s - %(title)s.%(ext)s'),
             'format': format_string,
-            'progress_hooks': [self.progress_hook],
             'quiet': True,
             'no_warnings': False,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            playlist_title = info.get('title', 'playlist')
-            return f"Playlist saved: {playlist_title}"
+        self.log_message(f"🔍 [#{job.id}] Listing playlist entries...")
+        journal = self.journal.playlist(job.journal_key)
+        # Entries start downloading while later pages are still being listed; a
+        # playlist listed to the end before its job was interrupted isn't listed again
+        playlist = journal.playlist(lambda: call_cancellable(job.cancel_event, stream_playlist, job.url,
+                                                             self.sessions))
+        job.title = playlist['title']
+        max_workers = job.options['workers']
+        count = playlist['n_entries'] if playlist['n_entries'] is not None else "?"
+        if playlist.get('resumed'):
+            self.log_message(f"♻️ [#{job.id}] Resuming {count} entries, skipping finished ones, "
+                             f"{max_workers} at a time")
+        else:
+            self.log_message(f"📃 [#{job.id}] {count} entries, {max_workers} at a time")
+        
+        def report(entry):
+            if entry.linked:
+                self.log_message(f"🔗 [#{job.id}] [{entry.index}] {entry.title} (linked from an earlier download)")
+            elif entry.skipped:
+                self.log_message(f"⏭ [#{job.id}] [{entry.index}] {entry.title} (already downloaded)")
+            elif entry.success:
+                self.log_message(f"✅ [#{job.id}] [{entry.index}] {entry.title}")
+            else:
+                self.log_message(f"❌ [#{job.id}] [{entry.index}] {entry.title or entry.url}: {entry.error}")
+        
+        result = download_playlist_entries(playlist, ydl_opts, max_workers,
+                                           progress_hooks=self.job_hooks(job),
+                                           on_entry_done=report, info_cache=self.info_cache,
+                                           sessions=self.sessions, cancel_event=job.cancel_event,
+                                           archive=get_archive(job.options['download_path']),
+                                           target=job.options.get('target'), backoff=self.backoff,
+                                           store=self.job_store(job),
+                                           keep_entries=False, journal=journal)
+        job.check_cancelled()
+        return f"Playlist saved: {result.title} ({result.summary()})"
     
-    def download_thread(self):
+    def run_job(self, job: DownloadJob) -> str:
+        """Run a queued job on its worker thread"""
+        self.log_message("="*60)
+        self.log_message(f"🚀 [#{job.id}] Starting download...")
+        self.log_message(f"📎 URL: {job.url}")
+        self.log_message("="*60)
+        
         try:
-            url = self.url_entry.get().strip()
-            if not url:
-                messagebox.showerror("Error", "Please enter a YouTube URL")
-                return
-            
-            self.progress_text.delete(1.0, tk.END)
-            self.progress_bar['value'] = 0
-            self._last_log_percent = 0
-            
-            self.log_message("="*60)
-            self.log_message("🚀 Starting download...")
-            self.log_message(f"📎 URL: {url}")
-            self.log_message("="*60 + "\n")
-            
-            self.update_status("Preparing download...", self.colors['accent'])
-            
-            download_type = self.download_type.get()
-            quality = self.quality_var.get()
-            audio_quality = self.audio_quality_var.get()
-            
-            if download_type == "video":
-                self.log_message(f"📹 Download Type: Video ({quality}p)")
-                result = self.download_video(url, quality)
-            elif download_type == "audio":
-                self.log_message(f"🎵 Download Type: Audio (Quality: {audio_quality})")
-                result = self.download_audio(url, audio_quality)
-            elif download_type == "playlist":
-                self.log_message(f"📂 Download Type: Playlist ({quality}p)")
-                result = self.download_playlist(url, quality, "video")
-            
-            self.progress_bar['value'] = 100
-            self.log_message("\n" + "="*60)
-            self.log_message("✅ SUCCESS!")
-            self.log_message(f"📁 {result}")
-            self.log_message("="*60)
-            
-            self.update_status("✓ Download completed successfully!", self.colors['success'])
-            messagebox.showinfo("Success", "Download completed successfully!")
-            
+            with self.bandwidth.track(('gui', job.id), priority=PRIORITIES[job.options['priority']],
+                                      cancel_event=job.cancel_event) as throttle:
+                job.hooks = [throttle]
+                if job.download_type == "video":
+                    self.log_message(f"📹 [#{job.id}] Download Type: Video ({job.options['quality']}p)")
+                    result = self.download_video(job)
+                elif job.download_type == "audio":
+                    self.log_message(f"🎵 [#{job.id}] Download Type: Audio (Quality: {job.options['audio_quality']})")
+                    result = self.download_audio(job)
+                else:
+                    self.log_message(f"📂 [#{job.id}] Download Type: Playlist ({job.options['quality']}p)")
+                    result = self.download_playlist(job)
         except Exception as e:
-            error_msg = str(e)
-            if "cancelled by user" in error_msg.lower():
-                # Handle cancellation
-                self.log_message("\n" + "="*60)
-                self.log_message("⚠️ Download cancelled by user")
-                self.log_message("="*60)
-                self.update_status("✗ Download cancelled", "#ff6600")
-                self.progress_bar['value'] = 0
+            if job.cancelled or isinstance(e, DownloadCancelled):
+                # Everything has stopped by now; partial files follow the job's policy
+                latency = job.cancel_event.release()
+                stopped = f" (stopped in {latency * 1000:.0f} ms)" if latency is not None else ""
+                self.log_message(f"⚠️ [#{job.id}] Download cancelled by user{stopped}")
+                self.update_status(f"[#{job.id}] ✗ Download cancelled", "#ff6600")
             else:
-                # Handle other errors
-                self.log_message("\n" + "="*60)
-                self.log_message(f"❌ ERROR: {error_msg}")
-                self.log_message("="*60)
-                self.update_status("✗ Download failed", "#ff4444")
-                self.progress_bar['value'] = 0
-                messagebox.showerror("Error", f"Error: {error_msg}")
-        finally:
-            self.is_downloading = False
-            self.cancel_download = False
-            self.download_btn.config(
-                state="normal",
-                text="⬇ START",
-                bg=self.colors['button']
-            )
-            # Hide cancel button
-            self.cancel_btn.pack_forget()
+                error_msg = str(e)
+                self.log_message(f"❌ [#{job.id}] ERROR: {error_msg}")
+                self.update_status(f"[#{job.id}] ✗ Download failed", "#ff4444")
+                self.root.after(0, lambda: messagebox.showerror("Error", f"Error: {error_msg}"))
+            raise
+        
+        self.log_message(f"✅ [#{job.id}] SUCCESS! 📁 {result}")
+        self.update_status(f"[#{job.id}] ✓ Download completed successfully!", self.colors['success'])
+        return result
+    
+    def format_target(self) -> Optional[FormatTarget]:
+        """Size-aware target from the form, or None to keep the plain quality formats"""
+        quality = self.quality_var.get()
+        height = int(quality) if quality.isdigit() else None
+        try:
+            max_mb = float(self.max_size_var.get())
+        except ValueError:
+            max_mb = None
+        if self.pick_var.get() == PICK_SMALLEST:
+            return FormatTarget(min_height=height, prefer=PREFER_SMALLEST,
+                                max_bytes=int(max_mb * 1024 * 1024) if max_mb else None)
+        if max_mb:
+            return FormatTarget(max_height=height, max_bytes=int(max_mb * 1024 * 1024))
+        return None
     
     def start_download(self):
-        if self.is_downloading:
+        """Queue a job for the URL and settings currently in the form"""
+        if not self._ready:
+            return
+        url = self.url_entry.get().strip()
+        if not url:
+            messagebox.showerror("Error", "Please enter a YouTube URL")
             return
-            
-        self.is_downloading = True
-        self.cancel_download = False
         
-        self.download_btn.config(
-            state="disabled",
-            text="⏳ LOADING...",
-            bg="#555555"
-        )
+        workers = self.workers_var.get()
+        connections = self.connections_var.get()
+        job = DownloadJob(url, self.download_type.get(), {
+            'quality': self.quality_var.get(),
+            'audio_quality': self.audio_quality_var.get(),
+            'workers': int(workers) if workers.isdigit() else 4,
+            'connections': int(connections) if connections.isdigit() else 1,
+            'priority': self.priority_var.get(),
+            'download_path': self.download_path,
+            'target': self.format_target(),
+            'partial_policy': KEEP_PARTIAL if self.keep_partial_var.get() else DELETE_PARTIAL,
+            'dedupe': self.dedupe_var.get(),
+        })
         
-        # Show cancel button
-        self.cancel_btn.pack(side="left", fill="x", expand=True, padx=(4, 0))
+        self.url_entry.delete(0, tk.END)
+        self.on_concurrency_change()
+        self.job_queue.submit(job)
         
-        thread = threading.Thread(target=self.download_thread, daemon=True)
-        thread.start()
+        if job.state != RUNNING:
+            self.log_message(f"🕒 [#{job.id}] Queued: {url}")
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,148 @@
+import http.client
+import importlib.util
+import ssl
+import urllib.request
+import weakref
+from urllib.parse import urljoin
+
+from yt_dlp.networking.common import RequestHandler, Response, register_preference, register_rh
+from yt_dlp.networking.exceptions import (
+    CertificateVerifyError, HTTPError, IncompleteRead, SSLError, TransportError, UnsupportedRequest,
+)
+
+from http_pool import HTTPConnectionPool, PooledResponse
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 10
+
+# yt-dlp's requests handler keeps its own urllib3 connection pools; the shared pool is only
+# needed in its place, ahead of the urllib handler that connects per request
+ENABLED = not (importlib.util.find_spec('requests') and importlib.util.find_spec('urllib3'))
+
+# Cookie jar of each YoutubeDL instance -> the pool its requests go through
+_pools: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+
+def _redirect_method(method: str, status: int) -> str:
+    # As browsers do: 303 turns anything but HEAD into GET, and 301/302 turn POST into GET
+    if status == 303 and method != 'HEAD':
+        return 'GET'
+    if status in (301, 302) and method == 'POST':
+        return 'GET'
+    return method
+
+
+class PooledResponseAdapter(Response):
+    def __init__(self, response: PooledResponse):
+        super().__init__(fp=response, url=response.url, headers=response.headers,
+                         status=response.status, reason=response.reason)
+
+    def read(self, amt: int = None) -> bytes:
+        try:
+            return self.fp.read(amt)
+        except http.client.IncompleteRead as e:
+            raise IncompleteRead(partial=len(e.partial), expected=e.expected, cause=e) from e
+        except Exception as e:
+            raise TransportError(cause=e) from e
+
+
+class PooledRH(RequestHandler):
+    """yt-dlp request handler that sends plain HTTP(S) requests over a shared HTTPConnectionPool
+
+    Requests it can't serve (instances not given a pool by install(),
+    proxies, client certificates, legacy SSL, a fixed source address,
+    streamed bodies) are declined, and yt-dlp falls back to its own
+    handlers for them.
+    """
+
+    _SUPPORTED_URL_SCHEMES = ('http', 'https')
+    _SUPPORTED_PROXY_SCHEMES = ()
+    _SUPPORTED_FEATURES = ()
+
+    def __init__(self, *, client_cert=None, **kwargs):
+        super().__init__(client_cert=client_cert, **kwargs)
+        self.uses_client_cert = bool(client_cert)
+
+    @property
+    def pool(self):
+        return _pools.get(self.cookiejar)
+
+    def _check_extensions(self, extensions):
+        super()._check_extensions(extensions)
+        extensions.pop('cookiejar', None)
+        extensions.pop('timeout', None)
+        extensions.pop('keep_header_casing', None)
+        if not extensions.get('legacy_ssl'):
+            extensions.pop('legacy_ssl', None)
+
+    def _validate(self, request):
+        super()._validate(request)
+        if self.pool is None:
+            raise UnsupportedRequest('No shared connection pool was installed for this instance')
+        if self.legacy_ssl_support or self.source_address or self.uses_client_cert:
+            raise UnsupportedRequest('Connection options are not supported by the shared pool')
+        if request.data is not None and not isinstance(request.data, bytes):
+            raise UnsupportedRequest('Only bytes request bodies are supported')
+
+    def _prepare_headers(self, request, headers):
+        headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        headers.pop('Connection', None)
+
+    def _send(self, request):
+        cookiejar = self._get_cookiejar(request)
+        pool = self.pool
+        headers = self._get_headers(request)
+        method, url, data = request.method, request.url, request.data
+        for _ in range(_MAX_REDIRECTS + 1):
+            # Cookie handling goes through urllib's Request, which http.cookiejar understands
+            cookie_request = urllib.request.Request(url, method=method)
+            cookiejar.add_cookie_header(cookie_request)
+            sent = dict(headers)
+            if cookie_request.has_header('Cookie'):
+                sent['Cookie'] = cookie_request.get_header('Cookie')
+            try:
+                response = pool.request(method, url, headers=sent, body=data,
+                                             timeout=self._calculate_timeout(request), verify=self.verify)
+            except ssl.SSLCertVerificationError as e:
+                raise CertificateVerifyError(cause=e) from e
+            except ssl.SSLError as e:
+                raise SSLError(cause=e) from e
+            except (OSError, http.client.HTTPException) as e:
+                raise TransportError(cause=e) from e
+            cookiejar.extract_cookies(response, cookie_request)
+
+            location = response.getheader('Location')
+            if response.status not in _REDIRECT_CODES or not location:
+                break
+            response.close()
+            new_method = _redirect_method(method, response.status)
+            if new_method != method:
+                data = None
+                headers.pop('Content-Type', None)
+                headers.pop('Content-Length', None)
+            method, url = new_method, urljoin(url, location)
+        else:
+            raise HTTPError(PooledResponseAdapter(response), redirect_loop=True)
+
+        adapter = PooledResponseAdapter(response)
+        if not 200 <= adapter.status < 300:
+            raise HTTPError(adapter)
+        return adapter
+
+
+if ENABLED:
+    register_rh(PooledRH)
+
+    @register_preference(PooledRH)
+    def _prefer_pool(handler, request):
+        return 100
+
+
+def install(ydl, pool: HTTPConnectionPool):
+    """Route the requests of a YoutubeDL instance through pool, ahead of yt-dlp's urllib handler
+
+    Does nothing where yt-dlp's requests handler, which pools connections
+    itself, is available.
+    """
+    if ENABLED:
+        _pools[ydl.cookiejar] = pool
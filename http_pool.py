@@ -0,0 +1,259 @@
+import http.client
+import socket
+import ssl
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Errors a reused keep-alive connection raises when the server had already closed it
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError,
+                 ConnectionResetError, ConnectionAbortedError)
+
+
+class PoolTimeout(OSError):
+    """No connection to the host became free in time"""
+
+
+def _ssl_context(verify: bool) -> ssl.SSLContext:
+    try:
+        import certifi
+        context = ssl.create_default_context(cafile=certifi.where())
+    except ImportError:
+        context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class _Host:
+    def __init__(self, limit: int):
+        self.slots = threading.BoundedSemaphore(limit)
+        self.idle: List[Tuple[http.client.HTTPConnection, float]] = []
+
+
+class PooledResponse:
+    """Response whose connection goes back to the pool once the body has been read
+
+    Decodes gzip/deflate bodies. Closing it early, or a failed read, discards
+    the connection instead, since it is left in an unknown state.
+    """
+
+    def __init__(self, pool: 'HTTPConnectionPool', key: tuple, connection: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse, url: str):
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+        self.response = response
+        self._pool = pool
+        self._key = key
+        self._connection: Optional[http.client.HTTPConnection] = connection
+        # A cancel may close the response from another thread while it is read
+        self._lock = threading.Lock()
+        encoding = (response.getheader('Content-Encoding') or '').strip().lower()
+        self._decoder = (zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == 'gzip'
+                         else zlib.decompressobj() if encoding == 'deflate' else None)
+
+    @property
+    def fp(self):
+        # The socket file, so a blocked read can be aborted (see cancellation.abort_response)
+        return self.response.fp
+
+    @property
+    def closed(self) -> bool:
+        return self._connection is None
+
+    def info(self):
+        return self.headers
+
+    def getheader(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.response.getheader(name, default)
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        while True:
+            try:
+                data = self.response.read(amt)
+            except BaseException:
+                self._discard()
+                raise
+            if self.response.isclosed():
+                self._release()
+            if self._decoder is None:
+                return data
+            if not data:
+                return self._decoder.flush()
+            # A chunk can decode to nothing (e.g. the gzip header); b'' would read as the end
+            decoded = self._decoder.decompress(data)
+            if decoded:
+                return decoded
+
+    def readable(self) -> bool:
+        return True
+
+    def _take(self) -> Optional[http.client.HTTPConnection]:
+        with self._lock:
+            connection, self._connection = self._connection, None
+            return connection
+
+    def _release(self):
+        connection = self._take()
+        if connection is not None:
+            self._pool._put(self._key, connection, reusable=not self.response.will_close)
+
+    def _discard(self):
+        connection = self._take()
+        if connection is not None:
+            self._pool._put(self._key, connection, reusable=False)
+
+    def close(self):
+        if self._connection is not None and not self.response.isclosed():
+            self.response.close()
+            self._discard()
+        else:
+            self._release()
+
+    def __enter__(self) -> 'PooledResponse':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HTTPConnectionPool:
+    """Keep-alive HTTP(S) connections shared by every request of a download session
+
+    Connections are kept per (scheme, host, port), at most max_per_host of
+    them in use at once; further requests to that host wait for one to be
+    returned. Idle connections older than idle_timeout are dropped, since
+    servers close them on their side anyway.
+    """
+
+    def __init__(self, max_per_host: int = 16, idle_timeout: float = 60.0, timeout: float = 30.0):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+        self.stale = 0
+        self.connect_seconds = 0.0
+        self._hosts: Dict[tuple, _Host] = {}
+        self._contexts: Dict[bool, ssl.SSLContext] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, key: tuple) -> _Host:
+        with self._lock:
+            host = self._hosts.get(key)
+            if host is None:
+                host = self._hosts[key] = _Host(self.max_per_host)
+            return host
+
+    def _context(self, verify: bool) -> ssl.SSLContext:
+        with self._lock:
+            if verify not in self._contexts:
+                self._contexts[verify] = _ssl_context(verify)
+            return self._contexts[verify]
+
+    def _get(self, key: tuple, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """A free connection for key and whether it was reused"""
+        host = self._host(key)
+        if not host.slots.acquire(timeout=max(timeout, 1.0)):
+            raise PoolTimeout(f"No free connection to {key[1]}:{key[2]} within {timeout:g}s")
+        now = time.monotonic()
+        with self._lock:
+            while host.idle:
+                connection, since = host.idle.pop()
+                if now - since < self.idle_timeout:
+                    self.reused += 1
+                    connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+            self.opened += 1
+        scheme, hostname, port, verify = key
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(hostname, port, timeout=timeout,
+                                                     context=self._context(verify))
+        else:
+            connection = http.client.HTTPConnection(hostname, port, timeout=timeout)
+        start = time.perf_counter()
+        try:
+            connection.connect()
+            # Small requests on a kept-alive connection would otherwise wait on delayed ACKs
+            connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except BaseException:
+            connection.close()
+            host.slots.release()
+            raise
+        with self._lock:
+            self.connect_seconds += time.perf_counter() - start
+        return connection, False
+
+    def _put(self, key: tuple, connection: http.client.HTTPConnection, reusable: bool):
+        host = self._host(key)
+        if reusable and connection.sock is not None:
+            with self._lock:
+                host.idle.append((connection, time.monotonic()))
+        else:
+            connection.close()
+        host.slots.release()
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                body: Optional[bytes] = None, timeout: Optional[float] = None,
+                verify: bool = True) -> PooledResponse:
+        """Send a request over a pooled connection; close or fully read the response"""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme: {scheme}")
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80),
+               verify if scheme == 'https' else True)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        timeout = timeout or self.timeout
+        with self._lock:
+            self.requests += 1
+        while True:
+            connection, reused = self._get(key, timeout)
+            try:
+                connection.request(method, target, body=body, headers=headers or {})
+                response = connection.getresponse()
+            except _STALE_ERRORS:
+                self._put(key, connection, reusable=False)
+                if not reused:
+                    raise
+                # The server dropped the idle connection; try again on a new one
+                with self._lock:
+                    self.stale += 1
+                continue
+            except BaseException:
+                self._put(key, connection, reusable=False)
+                raise
+            return PooledResponse(self, key, connection, response, url)
+
+    def stats(self) -> Dict:
+        """Connection reuse counters; saved_seconds estimates handshakes avoided"""
+        with self._lock:
+            idle = sum(len(host.idle) for host in self._hosts.values())
+            average_connect = self.connect_seconds / self.opened if self.opened else 0.0
+            return {
+                'requests': self.requests,
+                'connections_opened': self.opened,
+                'connections_reused': self.reused,
+                'stale_retries': self.stale,
+                'reuse_ratio': round(self.reused / self.requests, 3) if self.requests else 0.0,
+                'connect_seconds': round(self.connect_seconds, 6),
+                'saved_seconds': round(self.reused * average_connect, 6),
+                'idle': idle,
+            }
+
+    def close(self):
+        with self._lock:
+            hosts = list(self._hosts.values())
+            for host in hosts:
+                for connection, _ in host.idle:
+                    connection.close()
+                host.idle.clear()
@@ -0,0 +1,136 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from session_pool import YoutubeDLPool, get_default_pool
+
+# Options of the session used to probe videos; warm-up pre-creates it
+PROBE_OPTIONS = {'quiet': True, 'noplaylist': True}
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nm-tube", "info_cache.sqlite")
+
+_YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)'
+    r'([0-9A-Za-z_-]{11})'
+)
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Get the YouTube video ID from a URL without touching the network"""
+    match = _YOUTUBE_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def cache_key(url: str) -> str:
+    return extract_video_id(url) or url.strip()
+
+
+class InfoCache:
+    """SQLite-backed cache of extracted video info with a TTL and LRU size cap"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 3600,
+                 max_bytes: int = 64 * 1024 * 1024):
+        # Stream URLs in the info expire, so entries must not outlive the TTL
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS info ("
+            " key TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS info_accessed ON info (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return cached info for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT data, created FROM info WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM info WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE info SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, info: Dict):
+        """Store info under key and evict least recently used entries over the size cap"""
+        data = json.dumps(info)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO info (key, data, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM info WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM info ORDER BY accessed").fetchall():
+            self._conn.execute("DELETE FROM info WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM info WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM info")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def extract_info(url: str, cache: Optional[InfoCache] = None,
+                 sessions: Optional[YoutubeDLPool] = None) -> Dict:
+    """Extract unprocessed info for a single video, reusing the cache when possible"""
+    key = cache_key(url)
+    if cache is not None:
+        info = cache.get(key)
+        if info is not None:
+            return info
+
+    sessions = sessions or get_default_pool()
+    with sessions.session(PROBE_OPTIONS) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Playlists hold lazy entries and are never cached
+        if info.get('_type', 'video') != 'video':
+            return info
+        info = ydl.sanitize_info(info)
+
+    if cache is not None:
+        cache.put(key, info)
+    return info
+
+
+def download_from_info(ydl, url: str, info: Dict, extra_info: Optional[Dict] = None) -> Dict:
+    """Run format selection and download on previously extracted info"""
+    if info.get('_type', 'video') == 'video':
+        return ydl.process_ie_result(info, download=True, extra_info=extra_info)
+    return ydl.extract_info(url, download=True, extra_info=extra_info)
@@ -0,0 +1,210 @@
+import itertools
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from cancellation import CancelToken, DownloadCancelled, KEEP_PARTIAL
+
+if TYPE_CHECKING:
+    from journal import JobJournal
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class DownloadJob:
+    """A single queued download with its own state, progress and cancel token"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url: str, download_type: str = 'video', options: Optional[Dict] = None):
+        self.id = next(self._ids)
+        self.url = url
+        self.download_type = download_type
+        self.options = options or {}
+        self.state = QUEUED
+        self.title: Optional[str] = None
+        self.progress = 0.0
+        # Latest raw progress tuple, replaced wholesale by the download thread
+        self.snapshot: Optional[tuple] = None
+        self.status_text = "Queued"
+        self.last_log_percent = 0.0
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        # options['partial_policy'] decides whether a cancelled job keeps its .part files
+        self.cancel_event = CancelToken(self.options.get('partial_policy', KEEP_PARTIAL))
+        # Extra progress hooks attached by the runner while the job is active
+        self.hooks: List[Callable] = []
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        # Set once the job is journaled, or before submitting a resumed one
+        self.journal_key: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def cancel_latency(self) -> Optional[float]:
+        """Seconds between cancel() and the job having stopped"""
+        return self.cancel_event.latency
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        """Raise DownloadCancelled if the job was cancelled"""
+        self.cancel_event.check()
+
+
+class JobQueue:
+    """Runs queued jobs with at most max_concurrent of them in flight
+
+    With a journal, each job and its state changes are recorded under
+    journal_source, so jobs left unfinished by a crash can be resubmitted.
+    """
+
+    def __init__(self, runner: Callable[[DownloadJob], str], max_concurrent: int = 2,
+                 on_change: Optional[Callable[[DownloadJob], None]] = None,
+                 journal: Optional['JobJournal'] = None, journal_source: str = 'queue'):
+        self.runner = runner
+        self.max_concurrent = max(1, max_concurrent)
+        self.on_change = on_change
+        self.journal = journal
+        self.journal_source = journal_source
+        self._stopping = False
+        self._jobs: Dict[int, DownloadJob] = {}
+        self._pending: deque = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, job: DownloadJob) -> DownloadJob:
+        if self.journal is not None:
+            job.journal_key = self.journal.add(job.url, job.download_type, job.options, self.journal_source,
+                                               job.journal_key)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def set_max_concurrent(self, max_concurrent: int):
+        with self._lock:
+            self.max_concurrent = max(1, max_concurrent)
+        self._dispatch()
+
+    def cancel(self, job_id: int) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_finished:
+                return False
+            job.cancel()
+            if job.state == QUEUED:
+                self._pending.remove(job)
+                self._finish(job, CANCELLED)
+        self._notify(job)
+        return True
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job.id)
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """Cancel every job and wait for them to stop
+
+        Unlike cancel_all, the journal keeps them unfinished, so they are
+        resumed the next time it is read.
+        """
+        with self._lock:
+            self._stopping = True
+        self.cancel_all()
+        return self.wait(timeout)
+
+    def get(self, job_id: int) -> Optional[DownloadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[DownloadJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def remove_finished(self, keep: int = 0):
+        """Forget finished jobs, except the keep most recently finished"""
+        with self._lock:
+            finished = sorted((j for j in self._jobs.values() if j.is_finished), key=lambda j: j.finished)
+            for job in finished[:max(0, len(finished) - keep)]:
+                del self._jobs[job.id]
+
+    @property
+    def active_count(self) -> int:
+        with self._lock:
+            return self._running + len(self._pending)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until no job is queued or running"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._running and not self._pending, timeout)
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            while self._pending and self._running < self.max_concurrent:
+                job = self._pending.popleft()
+                job.state = RUNNING
+                job.started = time.time()
+                job.status_text = "Starting..."
+                self._running += 1
+                started.append(job)
+        for job in started:
+            if self.journal is not None:
+                self.journal.update(job.journal_key, RUNNING)
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+            self._notify(job)
+
+    def _run(self, job: DownloadJob):
+        try:
+            job.check_cancelled()
+            job.result = self.runner(job)
+            state = DONE
+        except Exception as e:
+            if job.cancelled or isinstance(e, DownloadCancelled):
+                state = CANCELLED
+            else:
+                job.error = str(e)
+                state = FAILED
+        with self._lock:
+            self._running -= 1
+            self._finish(job, state)
+        self._notify(job)
+        self._dispatch()
+
+    def _finish(self, job: DownloadJob, state: str):
+        # Caller holds self._lock
+        if state == CANCELLED:
+            job.cancel_event.release()
+        job.state = state
+        job.finished = time.time()
+        job.status_text = {DONE: "Completed", FAILED: "Failed", CANCELLED: "Cancelled"}[state]
+        if state == DONE:
+            job.progress = 100.0
+        # Jobs cancelled by shutdown() stay unfinished in the journal; ones that ended anyway are recorded
+        if self.journal is not None and not (self._stopping and state == CANCELLED):
+            self.journal.update(job.journal_key, state, job.title, job.result, job.error)
+        self._idle.notify_all()
+
+    def _notify(self, job: DownloadJob):
+        if self.on_change:
+            self.on_change(job)
@@ -0,0 +1,270 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from download_archive import folder_state_path
+from job_queue import DONE, FAILED, FINISHED_STATES, QUEUED
+
+JOURNAL_FILENAME = ".nm_tube_journal.sqlite"
+# The GUI's jobs go to any folder, so it keeps one journal per user
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nm-tube", "journal.sqlite")
+
+# States of a playlist entry besides done and failed; only done ones are skipped on resume
+PENDING = 'pending'
+DOWNLOADING = 'downloading'
+
+# Finished jobs are kept this long, for status listings
+HISTORY_SECONDS = 7 * 24 * 3600
+# Entries read back per query when a listing is resumed
+_PAGE = 500
+
+
+class JobJournal:
+    """Write-ahead record of jobs and playlist entries, to resume them after a crash
+
+    Every job is journaled with its options and state transitions, and each
+    playlist entry as it is listed, then as it downloads (with its .part
+    file) and finishes. Writes are queued and committed by a background
+    thread in batches, every flush_interval seconds or max_batch changes,
+    with repeated changes to one job or entry collapsed into one. A crash
+    loses at most the last batch: an entry that finished in it is retried,
+    and then skipped by the download archive, which commits on its own.
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, flush_interval: float = 0.25, max_batch: int = 512):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.last_error: Optional[str] = None
+        # (table, primary key) -> columns to set, merged until the next batch
+        self._pending: Dict[Tuple[str, tuple], Dict] = {}
+        self._urgent = False
+        self._writing = False
+        self._closed = False
+        self._changes = threading.Condition()
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL survives the process dying mid-write; NORMAL skips an fsync per commit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT, type TEXT, source TEXT, options TEXT, state TEXT,"
+            " title TEXT, result TEXT, error TEXT,"
+            " playlist_id TEXT, playlist_title TEXT, n_entries INTEGER,"
+            " n_listed INTEGER,"  # set once the whole playlist has been listed
+            " created REAL, updated REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " job TEXT NOT NULL, idx INTEGER NOT NULL,"
+            " url TEXT, video_id TEXT, title TEXT,"
+            f" state TEXT NOT NULL DEFAULT '{PENDING}',"
+            " partial TEXT, error TEXT, updated REAL,"
+            " PRIMARY KEY (job, idx))"
+        )
+        self._conn.execute("DELETE FROM jobs WHERE state IN (?, ?, ?) AND updated < ?",
+                           (*FINISHED_STATES, time.time() - HISTORY_SECONDS))
+        self._conn.commit()
+
+        threading.Thread(target=self._writer, daemon=True, name='nm-tube-journal').start()
+        # Daemon threads die with the interpreter; write what they queued first
+        atexit.register(self.close)
+
+    # Jobs
+
+    def add(self, url: str, download_type: str, options: Dict, source: str, key: Optional[str] = None) -> str:
+        """Journal a queued job and return its key; a resumed job passes its old key"""
+        key = key or uuid.uuid4().hex
+        now = time.time()
+        self._write('jobs', (key,), urgent=True, url=url, type=download_type, source=source,
+                    options=json.dumps(options, default=str), state=QUEUED, error=None, created=now, updated=now)
+        return key
+
+    def update(self, key: str, state: str, title: Optional[str] = None, result: Optional[str] = None,
+               error: Optional[str] = None):
+        """Record a job's new state; a finished job's entries are dropped"""
+        columns = {'state': state, 'updated': time.time()}
+        columns.update((name, value) for name, value in
+                       (('title', title), ('result', result), ('error', error)) if value is not None)
+        finished = state in FINISHED_STATES
+        self._write('jobs', (key,), urgent=finished, **columns)
+        if finished:
+            # The download archive remembers what was saved; the journal only needs unfinished work
+            self._write('-entries', (key,))
+
+    def unfinished(self, source: str) -> List[Dict]:
+        """Jobs of source that were queued or running, oldest first, with their options decoded"""
+        self.flush()
+        placeholders = ', '.join('?' * len(FINISHED_STATES))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT key, url, type, options, state, title FROM jobs"
+                f" WHERE source = ? AND state NOT IN ({placeholders}) ORDER BY created", (source, *FINISHED_STATES))
+            rows = cursor.fetchall()
+        return [{'key': key, 'url': url, 'type': download_type, 'options': json.loads(options or '{}'),
+                 'state': state, 'title': title} for key, url, download_type, options, state, title in rows]
+
+    def playlist(self, key: str) -> 'PlaylistJournal':
+        return PlaylistJournal(self, key)
+
+    # Writing
+
+    def _write(self, table: str, key: tuple, urgent: bool = False, **columns):
+        with self._changes:
+            if self._closed:
+                return
+            self._pending.setdefault((table, key), {}).update(columns)
+            self._urgent = self._urgent or urgent
+            # The writer wakes for the first change of a batch, then only when it can't wait
+            if urgent or len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._changes.notify_all()
+
+    def _writer(self):
+        while True:
+            with self._changes:
+                self._changes.wait_for(lambda: self._pending or self._closed)
+                # Let more changes gather, unless one can't wait or the batch is full
+                self._changes.wait_for(lambda: self._urgent or self._closed or len(self._pending) >= self.max_batch,
+                                       self.flush_interval)
+                batch, self._pending, self._urgent = self._pending, {}, False
+                self._writing = bool(batch)
+                closed = self._closed
+            try:
+                if batch:
+                    self._commit(batch)
+            finally:
+                with self._changes:
+                    self._writing = False
+                    self._changes.notify_all()
+            if closed and not batch:
+                return
+
+    def _commit(self, batch: Dict[Tuple[str, tuple], Dict]):
+        # Jobs before their entries, and dropped entries last so they stay dropped
+        order = {'jobs': 0, 'entries': 1, '-entries': 2}
+        try:
+            with self._lock:
+                for (table, key), columns in sorted(batch.items(), key=lambda item: order[item[0][0]]):
+                    if table == '-entries':
+                        self._conn.execute("DELETE FROM entries WHERE job = ?", key)
+                        continue
+                    keys = ('key',) if table == 'jobs' else ('job', 'idx')
+                    names = list(columns)
+                    self._conn.execute(
+                        f"INSERT INTO {table} ({', '.join(keys + tuple(names))})"
+                        f" VALUES ({', '.join('?' * (len(keys) + len(names)))})"
+                        f" ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                        + ', '.join(f"{name} = excluded.{name}" for name in names),
+                        (*key, *(columns[name] for name in names)))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            # Losing journal entries only costs repeated work after a crash; downloads go on
+            self.last_error = str(e)
+
+    def flush(self):
+        """Block until every change queued so far is committed"""
+        with self._changes:
+            if self._pending:
+                self._urgent = True
+                self._changes.notify_all()
+            self._changes.wait_for(lambda: (not self._pending and not self._writing) or self._closed)
+
+    def close(self):
+        self.flush()
+        with self._changes:
+            self._closed = True
+            self._changes.notify_all()
+        with self._lock:
+            self._conn.close()
+        atexit.unregister(self.close)
+
+
+class PlaylistJournal:
+    """One playlist job's listing and entries in a JobJournal"""
+
+    def __init__(self, journal: JobJournal, key: str):
+        self.journal = journal
+        self.key = key
+
+    def playlist(self, resolve: Callable[[], Dict]) -> Dict:
+        """The playlist as listed by an earlier run, or else resolve()'s, journaled as it is listed
+
+        A playlist listed to the end before is not listed again: its
+        entries are read back from the journal, leaving out the ones that
+        finished, and resumed is set. Otherwise every entry is recorded
+        as it is pulled from resolve()'s entries.
+        """
+        self.journal.flush()
+        with self.journal._lock:
+            row = self.journal._conn.execute(
+                "SELECT playlist_id, playlist_title, n_entries, n_listed FROM jobs WHERE key = ?",
+                (self.key,)).fetchone()
+        if row is not None and row[3] is not None:
+            return {'id': row[0], 'title': row[1] or 'playlist', 'n_entries': row[2] or row[3],
+                    'entries': self._remaining(), 'resumed': True}
+
+        playlist = resolve()
+        self.journal._write('jobs', (self.key,), playlist_id=playlist['id'], playlist_title=playlist['title'],
+                            n_entries=playlist['n_entries'])
+        return dict(playlist, entries=self._record(playlist['entries']))
+
+    def _record(self, listed) -> Iterator[Dict]:
+        count = 0
+        try:
+            for entry in listed:
+                # state isn't set, so a rerun of an interrupted listing keeps what finished
+                self.journal._write('entries', (self.key, entry['index']), url=entry['url'],
+                                    video_id=entry.get('id'), title=entry.get('title'))
+                count += 1
+                yield entry
+            self.journal._write('jobs', (self.key,), n_listed=count)
+        finally:
+            # Closing early stops the listing, as it would without the journal
+            if hasattr(listed, 'close'):
+                listed.close()
+
+    def _remaining(self) -> Iterator[Dict]:
+        # Read a page at a time, so a long playlist isn't loaded at once
+        last = 0
+        while True:
+            with self.journal._lock:
+                rows = self.journal._conn.execute(
+                    "SELECT idx, url, video_id, title, partial FROM entries"
+                    " WHERE job = ? AND state != ? AND idx > ? ORDER BY idx LIMIT ?",
+                    (self.key, DONE, last, _PAGE)).fetchall()
+            for index, url, video_id, title, partial in rows:
+                yield {'index': index, 'id': video_id, 'url': url, 'title': title, 'partial': partial}
+            if len(rows) < _PAGE:
+                return
+            last = rows[-1][0]
+
+    def downloading(self, index: int, partial: str):
+        self.journal._write('entries', (self.key, index), state=DOWNLOADING, partial=partial, updated=time.time())
+
+    def finished(self, index: int, success: bool, error: Optional[str] = None):
+        self.journal._write('entries', (self.key, index), state=DONE if success else FAILED, error=error,
+                            updated=time.time())
+
+
+_journals: Dict[str, JobJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(download_path: Optional[str] = None) -> JobJournal:
+    """Shared journal of a download folder (see folder_state_path), or the GUI's when download_path is None"""
+    path = folder_state_path(download_path, JOURNAL_FILENAME) if download_path else DEFAULT_JOURNAL_PATH
+    key = os.path.abspath(path)
+    with _journals_lock:
+        if key not in _journals:
+            _journals[key] = JobJournal(path)
+        return _journals[key]
@@ -1,113 +1,714 @@
-import yt_dlp
+import argparse
+import functools
+import itertools
+import json
 import os
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+from playlist import resolve_playlist, stream_playlist, download_playlist_entries
+from info_cache import InfoCache, extract_info, download_from_info, extract_video_id
+from session_pool import YoutubeDLPool, get_default_pool
+from download_archive import get_archive
+from content_store import get_store
+from journal import PlaylistJournal, get_journal
+from segmented import download_info_segmented
+from bandwidth import get_scheduler
+from warmup import Warmup
+from cancellation import DownloadCancelled, call_cancellable, cancellation_hook
+from metrics import DownloadMetrics, MetricsRegistry, DONE, FAILED, RUNNING, SKIPPED
+from format_selector import FormatIndex, FormatTarget, SELECTED_FORMAT, ffmpeg_available, format_size, select_format
+from transcode import TranscodePipeline, downloaded_path
+from adaptive import AdaptiveConcurrency, Backoff, retry_call
+from probe import ProbeRecord, probe_many
+from daemon import DEFAULT_PORT, DaemonClient, DaemonError, DownloadDaemon
+
+# Bandwidth scheduler keys are ('downloader', n), apart from the GUI's ('gui', job.id)
+_job_ids = itertools.count(1)
 
 class YouTubeDownloader:
-    def __init__(self, download_path: str = "./downloads"):
+    def __init__(self, download_path: str = "./downloads", max_workers: int = 4,
+                 info_cache: Optional[InfoCache] = None, sessions: Optional[YoutubeDLPool] = None,
+                 connections: int = 4, rate_limit: Optional[float] = None, quiet: bool = False,
+                 adaptive: bool = True, max_parallel: Optional[int] = None, retries: int = 5,
+                 dedupe: bool = True):
         self.download_path = download_path
+        self.quiet = quiet
+        self.max_workers = max_workers
+        self.connections = connections
+        # Transient errors (429, 5xx, dropped connections) are retried with jittered backoff
+        self.backoff = Backoff(retries)
+        # Shared by every download of this downloader: transfers beyond its
+        # limit wait, and the limit follows throughput and throttling
+        self.concurrency = (AdaptiveConcurrency(initial=max_workers, maximum=max_parallel or max_workers * 2)
+                            if adaptive else None)
+        # Shared with every other downloader in the process; rate_limit is bytes/s
+        self.bandwidth = get_scheduler()
+        if rate_limit:
+            self.bandwidth.set_rate(rate_limit)
+        self.info_cache = info_cache if info_cache is not None else InfoCache()
+        self.sessions = sessions or get_default_pool()
+        self.archive = get_archive(download_path)
+        # Finished files are hashed, and repeated content is hard-linked
+        self.store = get_store(download_path) if dedupe else None
+        self.metrics = MetricsRegistry(http_pool=self.sessions.http, concurrency=self.concurrency,
+                                       store=self.store)
+        self._transcoder: Optional[TranscodePipeline] = None
+        self._transcoder_lock = threading.Lock()
         os.makedirs(download_path, exist_ok=True)
         
-    def get_available_formats(self, url: str) -> Dict:
-        """Get all available formats for a video"""
-        ydl_opts = {'quiet': True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
-            return {
-                'title': info_dict.get('title'),
-                'duration': info_dict.get('duration'),
-                'formats': info_dict.get('formats', [])
-            }
-    
-    def download_video(self, url: str, quality: str = 'best', format_id: Optional[str] = None) -> str:
-        """Download video only"""
-        # Use format selection that avoids merging when ffmpeg is not available
-        if format_id:
-            format_string = format_id
-        elif quality == 'best':
-            format_string = 'best[ext=mp4]/best'
-        else:
-            # Only select pre-merged formats to avoid needing ffmpeg
-            format_string = f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best[ext=mp4]/best'
+    def extract_info(self, url: str) -> Dict:
+        """Get video info, served from the info cache when it was probed recently"""
+        return extract_info(url, self.info_cache, self.sessions)
         
-        ydl_opts = {
-            'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
-            'format': format_string,
-            'noplaylist': True,  # Ensure single video download
-            'ignoreerrors': False,  # Don't abort on errors, just report them
+    def get_available_formats(self, url: str) -> Dict:
+        """Title, duration and formats of a video, trimmed to what listing and selection use"""
+        record = ProbeRecord.from_info(url, self.extract_info(url))
+        return {
+            'title': record.title,
+            'duration': record.duration,
+            'formats': record.formats.as_dicts()
         }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+    
+    def probe(self, urls: Iterable[str], max_workers: int = 8,
+              cancel_event: Optional[threading.Event] = None) -> Iterator[ProbeRecord]:
+        """Compact records (ID, title, duration, format table) for many URLs, in input order"""
+        return probe_many(urls, max_workers, self.info_cache, self.sessions, cancel_event)
+    
+    def download_video(self, url: str, quality: str = 'best', format_id: Optional[str] = None,
+                       connections: Optional[int] = None, priority: int = 0, weight: float = 1.0,
+                       metrics: Optional[DownloadMetrics] = None, target: Optional[FormatTarget] = None,
+                       progress_hooks: Optional[List[Callable]] = None,
+                       cancel_event: Optional[threading.Event] = None) -> str:
+        """Download video only, over several connections when the format allows it
+
+        With a target, the format with the lowest transfer cost that meets it
+        is picked instead of using quality. Phase timings and transfer
+        statistics go to metrics (or a new DownloadMetrics) and are recorded
+        in self.metrics. Setting cancel_event aborts the download with
+        DownloadCancelled at the next chunk.
+        """
+        with self.metrics.track(url, 'video', metrics) as metrics:
+            self._check_cancelled(cancel_event)
+            # Skip known videos before any extraction or format resolution
+            video_id = extract_video_id(url)
+            if self.archive.contains(video_id, 'video'):
+                metrics.status = SKIPPED
+                return f"Already downloaded: {video_id}"
+            
+            # Use format selection that avoids merging when ffmpeg is not available
+            if format_id:
+                format_string = format_id
+            elif quality == 'best':
+                format_string = 'best[ext=mp4]/best'
+            else:
+                # Only select pre-merged formats to avoid needing ffmpeg
+                format_string = f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best[ext=mp4]/best'
+            
+            ydl_opts = {
+                'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
+                'format': format_string,
+                'noplaylist': True,  # Ensure single video download
+                'ignoreerrors': False,  # Raise, so transient errors are retried below
+                'quiet': self.quiet,
+                'noprogress': self.quiet,
+                'postprocessor_hooks': [metrics.postprocessor_hook],
+                **self.backoff.ydl_options(),
+            }
+            
+            with metrics.phase('extraction'):
+                info = self._retrying(lambda: call_cancellable(cancel_event, self.extract_info, url),
+                                      metrics, cancel_event)
+            metrics.title = info.get('title')
+            if self.archive.is_downloaded(info.get('id'), info.get('title'), 'video'):
+                metrics.status = SKIPPED
+                return f"Already downloaded: {info.get('title')}"
+            choice = None
+            if target is not None and not format_id:
+                with metrics.phase('format_selection'):
+                    choice = select_format(info, target)
+                    info = choice.apply(info)
+                ydl_opts['format'] = SELECTED_FORMAT
+                if not self.quiet:
+                    print(f"Selected format {choice.describe()} for {target}")
+            connections = connections or self.connections
+            
+            def transfer(info=info):
+                self._check_cancelled(cancel_event)
+                with self._slot(cancel_event), \
+                        self.bandwidth.track(('downloader', next(_job_ids)), weight, priority, cancel_event) as throttle:
+                    hooks = self._hooks(throttle, metrics, progress_hooks, cancel_event)
+                    ydl_opts['progress_hooks'] = hooks
+                    with self.sessions.session(ydl_opts) as ydl:
+                        result = None
+                        if connections > 1:
+                            result = download_info_segmented(ydl, info, connections, progress_hooks=hooks,
+                                                             cancel_event=cancel_event, metrics=metrics,
+                                                             http_pool=self.sessions.http,
+                                                             backoff=self.backoff, on_retry=self._record_error,
+                                                             hash_content=self.store is not None)
+                        if result is None:
+                            # Not a single ranged HTTP file - let yt-dlp download it
+                            with metrics.phase('extraction'):
+                                info = call_cancellable(cancel_event, self.extract_info, url)
+                            if choice is not None:
+                                info = choice.apply(info)
+                            metrics.start_transfer()
+                            result = download_from_info(ydl, url, info)
+                return result
+            
+            result = self._retrying(transfer, metrics, cancel_event)
+            self._record_success()
+            self._store(result, metrics)
+            self.archive.add_info(result, 'video')
             return f"Video downloaded to {self.download_path}"
     
-    def download_audio(self, url: str, quality: str = 'best') -> str:
-        """Download audio only"""
-        ydl_opts = {
+    @staticmethod
+    def _check_cancelled(cancel_event: Optional[threading.Event]):
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled()
+    
+    def _hooks(self, throttle: Callable, metrics: DownloadMetrics, progress_hooks: Optional[List[Callable]],
+               cancel_event: Optional[threading.Event], count_bytes: bool = True) -> List[Callable]:
+        """Progress hooks for one download: throttling, metrics, the caller's and cancellation"""
+        hooks = [throttle, metrics.progress_hook] + list(progress_hooks or [])
+        # Playlist entries feed the controller themselves
+        if self.concurrency is not None and count_bytes:
+            hooks.append(self.concurrency.byte_counter())
+        if cancel_event is not None:
+            hooks.append(cancellation_hook(cancel_event))
+        return hooks
+    
+    def _slot(self, cancel_event: Optional[threading.Event]):
+        """Wait for the concurrency controller to let one more transfer run"""
+        return self.concurrency.slot(cancel_event) if self.concurrency is not None else nullcontext()
+    
+    def _record_error(self, error: BaseException):
+        if self.concurrency is not None:
+            self.concurrency.record_error(error)
+    
+    def _record_success(self):
+        if self.concurrency is not None:
+            self.concurrency.record_success()
+    
+    def _retrying(self, function: Callable, metrics: DownloadMetrics,
+                  cancel_event: Optional[threading.Event]):
+        """Run function, retrying 429s, 5xx and dropped connections with jittered backoff"""
+        def on_retry(error, attempt, delay):
+            metrics.retries += 1
+            self._record_error(error)
+            if not self.quiet:
+                print(f"Retrying in {delay:.1f}s ({attempt + 1}/{self.backoff.retries}): {error}")
+        return retry_call(function, self.backoff, cancel_event, on_retry)
+    
+    def _store(self, info: Dict, metrics: DownloadMetrics):
+        """Record a finished file in the content store, linking it to an identical one"""
+        if self.store is not None:
+            with metrics.phase('dedupe'):
+                self.store.ingest_info(info)
+    
+    @property
+    def transcoder(self) -> Optional[TranscodePipeline]:
+        """Shared mp3 conversion stage, or None when ffmpeg is not installed"""
+        with self._transcoder_lock:
+            if self._transcoder is None and ffmpeg_available():
+                self._transcoder = TranscodePipeline()
+            return self._transcoder
+    
+    def _audio_opts(self, quality: str) -> Dict:
+        # mp3 conversion runs in self.transcoder after the download, not as a
+        # yt-dlp postprocessor, so the worker is free for the next download
+        return {
             'outtmpl': os.path.join(self.download_path, '%(title)s.%(ext)s'),
             'format': 'bestaudio/best',
-            'quiet': False,
+            'quiet': self.quiet,
+            'noprogress': self.quiet,
+            **self.backoff.ydl_options(),
         }
-        
-        # Only add audio conversion if ffmpeg is available
-        try:
-            import shutil
-            if shutil.which('ffmpeg'):
-                ydl_opts['postprocessors'] = [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': quality,
-                }]
-        except Exception:
-            pass
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+    
+    def download_audio(self, url: str, quality: str = 'best', priority: int = 0, weight: float = 1.0,
+                       metrics: Optional[DownloadMetrics] = None,
+                       progress_hooks: Optional[List[Callable]] = None,
+                       cancel_event: Optional[threading.Event] = None) -> str:
+        """Download audio only"""
+        with self.metrics.track(url, 'audio', metrics) as metrics:
+            self._check_cancelled(cancel_event)
+            video_id = extract_video_id(url)
+            if self.archive.contains(video_id, 'audio'):
+                metrics.status = SKIPPED
+                return f"Already downloaded: {video_id}"
+            
+            ydl_opts = self._audio_opts(quality)
+            ydl_opts['postprocessor_hooks'] = [metrics.postprocessor_hook]
+            
+            with metrics.phase('extraction'):
+                info = self._retrying(lambda: call_cancellable(cancel_event, self.extract_info, url),
+                                      metrics, cancel_event)
+            metrics.title = info.get('title')
+            if self.archive.is_downloaded(info.get('id'), info.get('title'), 'audio'):
+                metrics.status = SKIPPED
+                return f"Already downloaded: {info.get('title')}"
+            
+            def transfer():
+                self._check_cancelled(cancel_event)
+                with self._slot(cancel_event), \
+                        self.bandwidth.track(('downloader', next(_job_ids)), weight, priority, cancel_event) as throttle:
+                    ydl_opts['progress_hooks'] = self._hooks(throttle, metrics, progress_hooks, cancel_event)
+                    with self.sessions.session(ydl_opts) as ydl:
+                        metrics.start_transfer()
+                        return download_from_info(ydl, url, info)
+            
+            info = self._retrying(transfer, metrics, cancel_event)
+            self._record_success()
+            transcoder = self.transcoder
+            if transcoder is not None:
+                self._check_cancelled(cancel_event)
+                converted = transcoder.submit(downloaded_path(info), quality, cancel_event).result()
+                metrics.add_phase('postprocess', converted.elapsed)
+                # The archive and the store point at the mp3, not the download it replaced
+                info = {'id': info.get('id'), 'title': info.get('title'),
+                        'requested_downloads': [{'filepath': converted.target}]}
+            self._store(info, metrics)
+            self.archive.add_info(info, 'audio')
             return f"Audio downloaded to {self.download_path}"
     
-    def download_playlist(self, playlist_url: str, download_type: str = 'video', quality: str = 'best') -> str:
-        """Download entire playlist"""
+    def download_playlist(self, playlist_url: str, download_type: str = 'video', quality: str = 'best',
+                          max_workers: Optional[int] = None, priority: int = 0, weight: float = 1.0,
+                          metrics: Optional[DownloadMetrics] = None, target: Optional[FormatTarget] = None,
+                          progress_hooks: Optional[List[Callable]] = None,
+                          cancel_event: Optional[threading.Event] = None, stream: bool = True,
+                          journal: Optional[PlaylistJournal] = None) -> str:
+        """Download entire playlist, several entries at a time
+
+        By default entries are listed page by page while the first ones
+        download; stream=False lists the whole playlist first. A target picks
+        each video entry's format by transfer cost instead of quality. With
+        a journal, a playlist an earlier run listed to the end is not listed
+        again, and only its unfinished entries are downloaded.
+        """
+        transcode = None
         if download_type == 'audio':
-            return self.download_audio(playlist_url, quality)
-        
-        # Use format selection that avoids merging when ffmpeg is not available
-        if quality == 'best':
-            format_string = 'best[ext=mp4]/best'
+            ydl_opts = self._audio_opts(quality)
+            if self.transcoder is not None:
+                transcode = functools.partial(self.transcoder.submit, quality=quality,
+                                              cancel_event=cancel_event)
         else:
-            format_string = f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best[ext=mp4]/best'
-        
-        ydl_opts = {
-            'outtmpl': os.path.join(self.download_path, '%(playlist_title)s/%(playlist_index)s - %(title)s.%(ext)s'),
-            'format': format_string,
-            'ignoreerrors': False,
-        }
+            # Use format selection that avoids merging when ffmpeg is not available
+            if quality == 'best':
+                format_string = 'best[ext=mp4]/best'
+            else:
+                format_string = f'best[height<={quality}][ext=mp4]/best[height<={quality}]/best[ext=mp4]/best'
+            
+            ydl_opts = {
+                'outtmpl': os.path.join(self.download_path, '%(playlist_title)s/%(playlist_index)s - %(title)s.%(ext)s'),
+                'format': format_string,
+                'ignoreerrors': False,  # entries fail (and are retried) one by one
+                'quiet': self.quiet,
+                'noprogress': self.quiet,
+                **self.backoff.ydl_options(),
+            }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([playlist_url])
-            return f"Playlist downloaded to {self.download_path}"
+        with self.metrics.track(playlist_url, 'playlist', metrics) as metrics:
+            ydl_opts['postprocessor_hooks'] = [metrics.postprocessor_hook]
+            with metrics.phase('extraction'):
+                resolve = stream_playlist if stream else resolve_playlist
+
+                def listing():
+                    return self._retrying(lambda: call_cancellable(cancel_event, resolve, playlist_url,
+                                                                   self.sessions), metrics, cancel_event)
+
+                playlist = journal.playlist(listing) if journal is not None else listing()
+            metrics.title = playlist['title']
+            if not self.quiet:
+                count = playlist['n_entries'] if playlist['n_entries'] is not None else "unknown number of"
+                if playlist.get('resumed'):
+                    print(f"Resuming '{playlist['title']}' ({count} entries) where the last run stopped")
+                else:
+                    print(f"{'Streaming' if stream else 'Resolved'} {count} entries in '{playlist['title']}'")
+            
+            def report(entry):
+                if self.quiet:
+                    return
+                status = "OK" if entry.success else f"FAILED: {entry.error}"
+                print(f"[{entry.index}] {entry.title or entry.url} - {status}")
+            
+            with self.bandwidth.track(('downloader', next(_job_ids)), weight, priority, cancel_event) as throttle:
+                metrics.start_transfer()
+                result = download_playlist_entries(playlist, ydl_opts, max_workers or self.max_workers,
+                                                   progress_hooks=self._hooks(throttle, metrics, progress_hooks,
+                                                                              cancel_event, count_bytes=False),
+                                                   on_entry_done=report, info_cache=self.info_cache,
+                                                   sessions=self.sessions, cancel_event=cancel_event,
+                                                   archive=self.archive,
+                                                   kind='audio' if download_type == 'audio' else 'video',
+                                                   target=target if download_type != 'audio' else None,
+                                                   transcode=transcode, concurrency=self.concurrency,
+                                                   backoff=self.backoff, store=self.store,
+                                                   keep_entries=False, journal=journal)
+            self._check_cancelled(cancel_event)
+            metrics.retries += result.retries
+            if result.n_failed:
+                metrics.status = FAILED
+                metrics.error = f"{result.n_failed} of {result.total} entries failed"
+            return f"Playlist downloaded to {self.download_path}: {result.summary()}"
+    
+    def get_metrics(self) -> Dict:
+        """Totals, in-flight and recent download metrics as plain data"""
+        return self.metrics.snapshot()
+    
+    def metrics_text(self) -> str:
+        """Download metrics in the Prometheus text format"""
+        return self.metrics.to_prometheus()
+    
+    def write_metrics(self, path: str):
+        """Write Prometheus text to path, e.g. for node_exporter's textfile collector"""
+        self.metrics.write_prometheus(path)
+    
+    def serve_metrics(self, port: int, host: str = '127.0.0.1'):
+        """Expose /metrics and /metrics.json over HTTP from a background thread"""
+        return self.metrics.serve(port, host)
     
     def select_quality_interactive(self, url: str) -> str:
-        """Interactive quality selection"""
-        formats = self.get_available_formats(url)
-        print(f"\nAvailable formats for: {formats['title']}")
-        print("ID\tResolution\tExtension\tFPS\tSize")
-        print("-" * 50)
+        """Interactive quality selection by format ID or size target"""
+        index = FormatIndex(self.extract_info(url))
+        print(f"\nAvailable formats for: {index.title}")
+        print("ID\tResolution\tExtension\tCodec\tFPS\tSize")
+        print("-" * 60)
         
         video_formats = []
-        for fmt in formats['formats']:
-            if fmt.get('vcodec') != 'none' and fmt.get('height'):
-                size = fmt.get('filesize_approx', 0)
-                size_str = f"{size/1024/1024:.1f}MB" if size else "Unknown"
-                print(f"{fmt['format_id']}\t{fmt['height']}p\t{fmt['ext']}\t{fmt.get('fps', 'N/A')}\t{size_str}")
-                video_formats.append(fmt['format_id'])
+        for fmt in index.video_formats():
+            if not fmt.height:
+                continue
+            audio = "" if fmt.has_audio else " (video only)"
+            print(f"{fmt.format_id}\t{fmt.height}p\t\t{fmt.ext}\t\t{fmt.vcodec or '?'}\t{fmt.fps or 'N/A'}\t"
+                  f"{format_size(fmt.size, fmt.size_exact)}{audio}")
+            video_formats.append(fmt.format_id)
         
         while True:
-            choice = input("\nEnter format ID (or 'best' for highest quality): ").strip()
+            choice = input("\nEnter format ID, 'best', or a target like '720+,smallest' or 'best,<100MB': ").strip()
             if choice.lower() == 'best' or choice in video_formats:
                 return choice
-            print("Invalid format ID. Try again.")
+            try:
+                selected = index.select(FormatTarget.parse(choice))
+            except ValueError as e:
+                print(f"{e}. Try again.")
+                continue
+            if selected is None:
+                print("No format matches that target. Try again.")
+                continue
+            print(f"Selected {selected.describe()}")
+            return selected.format_spec
+
+def read_urls(stream: TextIO) -> Iterator[str]:
+    """Yield URLs line by line as they arrive, skipping blanks and comments"""
+    for line in stream:
+        url = line.strip()
+        if url and not url.startswith('#'):
+            yield url
+
+def new_cli_downloader(args) -> YouTubeDownloader:
+    """Quiet downloader for batch and daemon mode, logging concurrency changes to stderr"""
+    downloader = YouTubeDownloader(args.output, max_workers=args.playlist_workers,
+                                   connections=args.connections,
+                                   rate_limit=args.rate_limit * 1024 * 1024 if args.rate_limit else None,
+                                   quiet=True, adaptive=not args.fixed_workers,
+                                   max_parallel=args.max_parallel, retries=args.retries,
+                                   dedupe=not args.no_dedupe)
+    if downloader.concurrency is not None:
+        downloader.concurrency.on_decision = lambda d: print(
+            f"[concurrency] {d['from']} -> {d['to']}: {d['reason']} "
+            f"({d['throughput'] / 1024 / 1024:.2f} MB/s)", file=sys.stderr)
+    return downloader
+
+def run_batch(args) -> int:
+    """Download every URL from a file or stdin through a worker pool
+
+    Each URL is journaled in the download folder as it is queued, so
+    --resume can finish what a killed run left, playlists included.
+    """
+    journal = get_journal(args.output) if not args.no_journal else None
+    if args.resume and journal is None:
+        print("Error: --resume needs the journal (drop --no-journal)", file=sys.stderr)
+        return 2
+    downloader = new_cli_downloader(args)
+    
+    if args.metrics_port:
+        downloader.serve_metrics(args.metrics_port)
+    metrics_lock = threading.Lock()
+    # Kept with each journaled URL, so a resumed one is downloaded the same way
+    options = {'quality': args.quality, 'audio_quality': args.audio_quality, 'format_id': args.format_id,
+               'target': str(args.target) if args.target else None, 'playlist_type': args.playlist_type,
+               'stream': not args.resolve_first}
+    
+    def download(url: str, download_type: str, options: Dict, key: Optional[str]) -> Dict:
+        record = {'url': url, 'type': download_type}
+        metrics = DownloadMetrics(url, download_type)
+        target = FormatTarget.parse(options['target']) if options['target'] else None
+        start = time.monotonic()
+        if journal is not None:
+            journal.update(key, RUNNING)
+        try:
+            if download_type == 'video':
+                record['result'] = downloader.download_video(url, options['quality'], options['format_id'],
+                                                             metrics=metrics, target=target)
+            elif download_type == 'audio':
+                record['result'] = downloader.download_audio(url, options['audio_quality'], metrics=metrics)
+            else:
+                quality = options['audio_quality'] if options['playlist_type'] == 'audio' else options['quality']
+                record['result'] = downloader.download_playlist(
+                    url, options['playlist_type'], quality, metrics=metrics, target=target,
+                    stream=options['stream'], journal=journal.playlist(key) if journal is not None else None)
+            record['status'] = 'ok'
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+        if journal is not None:
+            journal.update(key, DONE if record['status'] == 'ok' else FAILED, result=record.get('result'),
+                           error=record.get('error'))
+        record['elapsed'] = round(time.monotonic() - start, 3)
+        record['metrics'] = metrics.to_dict()
+        if args.metrics_file:
+            with metrics_lock:
+                downloader.write_metrics(args.metrics_file)
+        print(f"[{record['status']}] {url}", file=sys.stderr)
+        return record
+    
+    resumed = journal.unfinished('batch') if args.resume else []
+    if resumed:
+        print(f"Resuming {len(resumed)} unfinished URLs from the last run", file=sys.stderr)
+    # With --resume, URLs are only read when an input is named
+    source = args.input or (None if args.resume else '-')
+    stream = None if source is None else sys.stdin if source == '-' else open(source, encoding='utf-8')
+    
+    def queued() -> Iterator[tuple]:
+        for job in resumed:
+            yield job['url'], job['type'], job['options'], job['key']
+        for url in read_urls(stream) if stream is not None else ():
+            key = journal.add(url, args.type, options, 'batch') if journal is not None else None
+            yield url, args.type, options, key
+    
+    # Bound the URLs read ahead of the workers so huge inputs stream through
+    # The concurrency controller may let more transfers run than --workers
+    workers = max(args.workers, downloader.concurrency.maximum if downloader.concurrency else 0)
+    slots = threading.BoundedSemaphore(workers * 2)
+    futures = []
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for job in queued():
+                slots.acquire()
+                future = pool.submit(download, *job)
+                future.add_done_callback(lambda f: slots.release())
+                futures.append(future)
+    finally:
+        if stream is not None and stream is not sys.stdin:
+            stream.close()
+    
+    records = [f.result() for f in futures]
+    failed = sum(1 for r in records if r['status'] != 'ok')
+    summary = {
+        'total': len(records),
+        'succeeded': len(records) - failed,
+        'failed': failed,
+        'elapsed': round(time.monotonic() - start, 3),
+        'metrics': downloader.get_metrics()['totals'],
+        'results': records,
+    }
+    if args.summary == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if failed else 0
+
+def run_probe(args) -> int:
+    """Print one JSON record per URL as the probes finish, in input order"""
+    stream = None
+    if args.urls:
+        urls = iter(args.urls)
+    else:
+        stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+        urls = read_urls(stream)
+    failed = 0
+    try:
+        # The shared info cache lets a later download skip extraction
+        for record in probe_many(urls, args.workers, InfoCache()):
+            failed += record.error is not None
+            print(json.dumps(record.to_dict()), flush=True)
+    finally:
+        if stream is not None and stream is not sys.stdin:
+            stream.close()
+    return 1 if failed else 0
+
+def run_verify(args) -> int:
+    """Check every file recorded in the content store, printing the ones that fail"""
+    store = get_store(args.output)
+    counts = {'ok': 0, 'corrupt': 0, 'missing': 0}
+    for path, status in store.verify():
+        counts[status] += 1
+        if status != 'ok':
+            print(f"[{status}] {path}")
+    if args.forget_missing:
+        store.forget_missing()
+    stats = store.stats()
+    print(f"{counts['ok']} ok, {counts['corrupt']} corrupt, {counts['missing']} missing; "
+          f"{stats['logical_bytes'] / 1024 / 1024:.1f} MB in {stats['stored_bytes'] / 1024 / 1024:.1f} MB on disk",
+          file=sys.stderr)
+    return 1 if counts['corrupt'] else 0
+
+def run_daemon(args) -> int:
+    """Keep a warm downloader serving the local job API until interrupted"""
+    downloader = new_cli_downloader(args)
+    journal = get_journal(args.output) if not args.no_journal else None
+    daemon = DownloadDaemon(downloader, max_concurrent=args.workers, journal=journal)
+    resumed = daemon.resume()
+    if resumed:
+        print(f"Resumed {len(resumed)} unfinished jobs from the journal", file=sys.stderr)
+    daemon.serve(args.port, args.host)
+    print(f"Serving downloads to {args.output} on http://{args.host}:{args.port} (Ctrl+C to stop)",
+          file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Stopping, cancelling running jobs...", file=sys.stderr)
+    daemon.shutdown()
+    downloader.sessions.close()
+    return 0
+
+def run_client(args) -> int:
+    """submit/status/cancel against a running daemon, printing JSON"""
+    client = DaemonClient(args.port, args.host)
+    try:
+        if args.command == 'submit':
+            options = {'quality': args.quality, 'audio_quality': args.audio_quality,
+                       'playlist_type': args.playlist_type, 'priority': args.priority}
+            if args.format_id:
+                options['format_id'] = args.format_id
+            if args.target:
+                options['target'] = args.target
+            if args.connections:
+                options['connections'] = args.connections
+            records = [client.submit(url, args.type, **options) for url in args.urls]
+            if args.wait:
+                records = [client.wait(record['id']) for record in records]
+        elif args.command == 'status':
+            records = client.jobs() if args.job_id is None else [client.status(args.job_id, args.wait)]
+        else:
+            records = [client.cancel(args.job_id)]
+    except DaemonError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        client.close()
+    json.dump(records, sys.stdout, indent=2)
+    print()
+    return 1 if any(r['state'] == 'failed' for r in records) else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="YouTube Downloader - runs the interactive menu when no command is given")
+    commands = parser.add_subparsers(dest='command')
+    
+    batch = commands.add_parser('batch', help="download URLs read line by line from a file or stdin")
+    batch.add_argument('input', nargs='?',
+                       help="file with one URL per line, or - for stdin (default, unless --resume is given)")
+    batch.add_argument('-t', '--type', choices=['video', 'audio', 'playlist'], default='video')
+    batch.add_argument('-q', '--quality', default='best', help="max video resolution (720, 1080, ...) or 'best'")
+    batch.add_argument('-f', '--format-id', help="exact format ID for video downloads")
+    batch.add_argument('--target', type=FormatTarget.parse,
+                       help="pick video formats by cost, e.g. '720+,smallest' or 'best,<100MB'")
+    batch.add_argument('-a', '--audio-quality', default='5', help="audio quality 0-9 (default 5)")
+    batch.add_argument('--playlist-type', choices=['video', 'audio'], default='video',
+                       help="what to download from each playlist")
+    batch.add_argument('-w', '--workers', type=int, default=4, help="URLs downloaded at once")
+    batch.add_argument('--playlist-workers', type=int, default=4, help="entries downloaded at once per playlist")
+    batch.add_argument('--resolve-first', action='store_true',
+                       help="list whole playlists before downloading instead of streaming entries")
+    batch.add_argument('-c', '--connections', type=int, default=4, help="connections per video")
+    batch.add_argument('--rate-limit', type=float, help="global bandwidth cap in MB/s")
+    batch.add_argument('-o', '--output', default="./downloads", help="download folder")
+    batch.add_argument('-s', '--summary', default='-', help="write the JSON summary here (default stdout)")
+    batch.add_argument('--metrics-file', help="keep Prometheus text metrics updated in this file")
+    batch.add_argument('--metrics-port', type=int, help="serve /metrics and /metrics.json on this local port")
+    batch.add_argument('--resume', action='store_true',
+                       help="first finish the URLs an interrupted batch run into --output left unfinished")
+    
+    daemon = commands.add_parser('daemon', help="keep yt-dlp warm and run jobs submitted over a local HTTP API")
+    daemon.add_argument('--port', type=int, default=DEFAULT_PORT)
+    daemon.add_argument('--host', default='127.0.0.1')
+    daemon.add_argument('-w', '--workers', type=int, default=2, help="jobs downloaded at once")
+    daemon.add_argument('--playlist-workers', type=int, default=4, help="entries downloaded at once per playlist")
+    daemon.add_argument('-c', '--connections', type=int, default=4, help="connections per video")
+    daemon.add_argument('--rate-limit', type=float, help="global bandwidth cap in MB/s")
+    daemon.add_argument('-o', '--output', default="./downloads", help="download folder")
+    
+    for command in (batch, daemon):
+        command.add_argument('--fixed-workers', action='store_true',
+                             help="don't adapt the number of parallel transfers to throughput and throttling")
+        command.add_argument('--max-parallel', type=int,
+                             help="most transfers the adaptive controller may run (default 2 x --playlist-workers)")
+        command.add_argument('--retries', type=int, default=5,
+                             help="retries with jittered backoff after a 429, 5xx or dropped connection")
+        command.add_argument('--no-dedupe', action='store_true',
+                             help="keep a separate copy of identical files instead of hard-linking them")
+        command.add_argument('--no-journal', action='store_true',
+                             help="don't journal jobs in the download folder for resuming after a crash")
+    
+    probe = commands.add_parser('probe', help="print ID, title, duration and formats of many URLs as JSON lines")
+    probe.add_argument('urls', nargs='*', help="URLs to probe; read from --input when none are given")
+    probe.add_argument('-i', '--input', default='-', help="file with one URL per line, or - for stdin (default)")
+    probe.add_argument('-w', '--workers', type=int, default=8, help="URLs probed at once")
+    
+    verify = commands.add_parser('verify', help="re-hash downloaded files against the content store")
+    verify.add_argument('-o', '--output', default="./downloads", help="download folder")
+    verify.add_argument('--forget-missing', action='store_true', help="drop records of deleted files")
+    
+    submit = commands.add_parser('submit', help="queue URLs on a running daemon")
+    submit.add_argument('urls', nargs='+')
+    submit.add_argument('-t', '--type', choices=['video', 'audio', 'playlist'], default='video')
+    submit.add_argument('-q', '--quality', default='best', help="max video resolution (720, 1080, ...) or 'best'")
+    submit.add_argument('-f', '--format-id', help="exact format ID for video downloads")
+    submit.add_argument('--target', help="pick video formats by cost, e.g. '720+,smallest'")
+    submit.add_argument('-a', '--audio-quality', default='5', help="audio quality 0-9 (default 5)")
+    submit.add_argument('--playlist-type', choices=['video', 'audio'], default='video')
+    submit.add_argument('-c', '--connections', type=int, help="connections per video (daemon default)")
+    submit.add_argument('--priority', type=int, default=0, help="bandwidth priority, higher goes first")
+    submit.add_argument('--wait', action='store_true', help="block until the jobs finish")
+    
+    status = commands.add_parser('status', help="show one job, or every job, of a running daemon")
+    status.add_argument('job_id', type=int, nargs='?')
+    status.add_argument('--wait', type=float, help="wait up to this many seconds for the job to finish")
+    
+    cancel = commands.add_parser('cancel', help="cancel a job on a running daemon")
+    cancel.add_argument('job_id', type=int)
+    
+    for command in (submit, status, cancel):
+        command.add_argument('--port', type=int, default=DEFAULT_PORT)
+        command.add_argument('--host', default='127.0.0.1')
+    return parser
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'batch':
+        sys.exit(run_batch(args))
+    if args.command == 'daemon':
+        sys.exit(run_daemon(args))
+    if args.command == 'verify':
+        sys.exit(run_verify(args))
+    if args.command == 'probe':
+        sys.exit(run_probe(args))
+    if args.command in ('submit', 'status', 'cancel'):
+        sys.exit(run_client(args))
+    interactive_menu()
 
-def main():
+def interactive_menu():
     downloader = YouTubeDownloader()
+    # Load yt-dlp while the user is still reading the menu
+    Warmup(downloader.sessions).start()
     
     print("=== YouTube Downloader ===")
     print("1. Download video")
@@ -128,10 +729,13 @@ def main():
             url = input("Enter URL: ").strip()
             
             if choice == '1':
-                quality_choice = input("Auto quality (a) or select manually (m)? ").strip().lower()
+                quality_choice = input("Auto quality (a), size target (s) or select manually (m)? ").strip().lower()
                 if quality_choice == 'm':
                     format_id = downloader.select_quality_interactive(url)
                     result = downloader.download_video(url, format_id=format_id)
+                elif quality_choice == 's':
+                    spec = input("Target (e.g. 720+,smallest or best,<100MB): ").strip()
+                    result = downloader.download_video(url, target=FormatTarget.parse(spec or 'best'))
                 else:
                     quality = input("Enter max resolution (720, 1080, 1440, etc.) or 'best': ").strip()
                     result = downloader.download_video(url, quality)
@@ -143,7 +747,9 @@ def main():
             elif choice == '3':
                 download_type = input("Download type (video/audio): ").strip().lower()
                 quality = input("Enter max resolution for video (720, 1080, etc.) or 'best': ").strip()
-                result = downloader.download_playlist(url, download_type, quality)
+                workers = input(f"Parallel downloads (default {downloader.max_workers}): ").strip()
+                result = downloader.download_playlist(url, download_type, quality,
+                                                      int(workers) if workers.isdigit() else None)
             
             print(f"\n{result}")
         else:
@@ -0,0 +1,331 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from job_queue import DownloadCancelled
+
+# In the order they happen during a download
+PHASES = ('extraction', 'format_selection', 'ttfb', 'transfer', 'postprocess', 'move', 'dedupe')
+
+RUNNING = 'running'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class DownloadMetrics:
+    """Phase timings and transfer statistics of a single download
+
+    Timed phases are filled in with phase() blocks; ttfb and transfer come
+    from progress_hook() and postprocess/move from postprocessor_hook().
+    ttfb runs from start_transfer() to the first received byte, so when
+    yt-dlp selects the format while downloading it is included there.
+    """
+
+    def __init__(self, url: str, kind: str = 'video'):
+        self.url = url
+        self.kind = kind
+        self.title: Optional[str] = None
+        self.status = RUNNING
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.bytes = 0
+        self.peak_speed = 0.0
+        self.retries = 0
+        self._transfer_start: Optional[float] = None
+        self._first_byte: Optional[float] = None
+        self._last_byte: Optional[float] = None
+        self._received: Dict[str, int] = {}
+        self._pp_started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the duration of the block to phase name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def start_transfer(self):
+        """Mark the moment the media request is about to be made"""
+        with self._lock:
+            if self._first_byte is None:
+                self._transfer_start = time.perf_counter()
+
+    def progress_hook(self, d):
+        now = time.perf_counter()
+        status = d.get('status')
+        with self._lock:
+            if status == 'downloading':
+                # Keyed by the final name, which the finished report carries too
+                filename = d.get('filename') or ''
+                downloaded = d.get('downloaded_bytes') or 0
+                delta = downloaded - self._received.get(filename, 0)
+                # Parallel segments can report out of order; only count growth
+                if delta > 0:
+                    self._received[filename] = downloaded
+                    self.bytes += delta
+                if self._first_byte is None and downloaded:
+                    self._first_byte = now
+                self._last_byte = now
+                self.peak_speed = max(self.peak_speed, d.get('speed') or 0.0)
+            elif status == 'finished':
+                # A playlist job reports many files; don't keep a count per finished one
+                self._received.pop(d.get('filename') or '', None)
+                if self._first_byte is not None:
+                    self._last_byte = now
+
+    def postprocessor_hook(self, d):
+        now = time.perf_counter()
+        name = d.get('postprocessor') or ''
+        if d.get('status') == 'started':
+            with self._lock:
+                self._pp_started[name] = now
+        elif d.get('status') == 'finished':
+            with self._lock:
+                started = self._pp_started.pop(name, None)
+            if started is not None:
+                self.add_phase('move' if name == 'MoveFiles' else 'postprocess', now - started)
+
+    def finish(self, status: str = DONE, error: Optional[str] = None):
+        with self._lock:
+            if self._first_byte is not None:
+                if self._transfer_start is not None:
+                    self.phases['ttfb'] = max(0.0, self._first_byte - self._transfer_start)
+                self.phases['transfer'] = self._last_byte - self._first_byte
+            # A status set during the download (e.g. skipped) wins over the default
+            if self.status == RUNNING or status != DONE:
+                self.status = status
+            self.error = error
+            self.finished = time.time()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def average_speed(self) -> float:
+        transfer = self.phases.get('transfer')
+        return self.bytes / transfer if transfer else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'url': self.url,
+            'kind': self.kind,
+            'title': self.title,
+            'status': self.status,
+            'error': self.error,
+            'started': self.started,
+            'finished': self.finished,
+            'elapsed': round(self.elapsed, 6),
+            'phases': {name: round(self.phases[name], 6) for name in PHASES if name in self.phases},
+            'bytes': self.bytes,
+            'average_speed': round(self.average_speed, 1),
+            'peak_speed': round(self.peak_speed, 1),
+            'retries': self.retries,
+        }
+
+
+class MetricsRegistry:
+    """Recent download metrics plus running totals, exportable as JSON or Prometheus text
+
+    With http_pool, its connection reuse counters are exported alongside,
+    with concurrency the adaptive limit and its recent decisions, and with
+    store the space the content store saves.
+    """
+
+    def __init__(self, history: int = 200, http_pool=None, concurrency=None, store=None):
+        self.http_pool = http_pool
+        self.concurrency = concurrency
+        self.store = store
+        self._recent: deque = deque(maxlen=history)
+        self._active: List[DownloadMetrics] = []
+        self._counts: Dict[tuple, int] = {}
+        self._bytes: Dict[str, int] = {}
+        self._phase_sum: Dict[str, float] = {}
+        self._phase_count: Dict[str, int] = {}
+        self._retries = 0
+        self._peak_speed = 0.0
+        self._transfer_bytes = 0
+        self._transfer_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, url: str, kind: str = 'video', metrics: Optional[DownloadMetrics] = None):
+        """Yield the metrics of a download and record them when the block ends"""
+        metrics = metrics or DownloadMetrics(url, kind)
+        metrics.url, metrics.kind = url, kind
+        with self._lock:
+            self._active.append(metrics)
+        try:
+            yield metrics
+        except DownloadCancelled as e:
+            metrics.finish(CANCELLED, str(e))
+            raise
+        except Exception as e:
+            metrics.finish(FAILED, str(e))
+            raise
+        else:
+            metrics.finish(DONE, metrics.error)
+        finally:
+            self._record(metrics)
+
+    def _record(self, metrics: DownloadMetrics):
+        with self._lock:
+            if metrics in self._active:
+                self._active.remove(metrics)
+            self._recent.append(metrics)
+            key = (metrics.kind, metrics.status)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._bytes[metrics.kind] = self._bytes.get(metrics.kind, 0) + metrics.bytes
+            self._retries += metrics.retries
+            self._peak_speed = max(self._peak_speed, metrics.peak_speed)
+            for name, seconds in metrics.phases.items():
+                self._phase_sum[name] = self._phase_sum.get(name, 0.0) + seconds
+                self._phase_count[name] = self._phase_count.get(name, 0) + 1
+            if metrics.phases.get('transfer'):
+                self._transfer_bytes += metrics.bytes
+                self._transfer_seconds += metrics.phases['transfer']
+
+    def snapshot(self) -> Dict:
+        """Totals, in-flight and recent downloads as plain data"""
+        with self._lock:
+            return {
+                'totals': {
+                    'downloads': [{'kind': k, 'status': s, 'count': n} for (k, s), n in sorted(self._counts.items())],
+                    'bytes': dict(self._bytes),
+                    'retries': self._retries,
+                    'peak_speed': self._peak_speed,
+                    'average_speed': (self._transfer_bytes / self._transfer_seconds
+                                      if self._transfer_seconds else 0.0),
+                    'phases': {name: {'sum': self._phase_sum[name], 'count': self._phase_count[name]}
+                               for name in PHASES if name in self._phase_sum},
+                },
+                'active': [m.to_dict() for m in self._active],
+                'recent': [m.to_dict() for m in self._recent],
+                'connections': self.http_pool.stats() if self.http_pool is not None else None,
+                'concurrency': self.concurrency.snapshot() if self.concurrency is not None else None,
+                'storage': self.store.stats() if self.store is not None else None,
+            }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        """Totals in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            metric('nm_tube_downloads_total', 'counter', "Finished downloads by kind and outcome",
+                   [((('kind', k), ('status', s)), n) for (k, s), n in sorted(self._counts.items())])
+            metric('nm_tube_downloads_active', 'gauge', "Downloads in progress",
+                   [((), len(self._active))])
+            metric('nm_tube_download_bytes_total', 'counter', "Bytes received by kind",
+                   [((('kind', k),), n) for k, n in sorted(self._bytes.items())])
+            metric('nm_tube_download_retries_total', 'counter', "Segment and download retries",
+                   [((), self._retries)])
+            # Summaries expose _sum and _count series under one family name
+            lines.append("# HELP nm_tube_download_phase_seconds Time spent per download phase")
+            lines.append("# TYPE nm_tube_download_phase_seconds summary")
+            for suffix, values, fmt in (('sum', self._phase_sum, '{:.6f}'), ('count', self._phase_count, '{}')):
+                lines.extend(f'nm_tube_download_phase_seconds_{suffix}{{phase="{p}"}} {fmt.format(values[p])}'
+                             for p in PHASES if p in values)
+            metric('nm_tube_download_speed_bytes_per_second', 'gauge',
+                   "Average transfer speed over finished downloads",
+                   [((), f"{self._transfer_bytes / self._transfer_seconds if self._transfer_seconds else 0:.1f}")])
+            metric('nm_tube_download_peak_speed_bytes_per_second', 'gauge',
+                   "Highest speed reported by any download", [((), f"{self._peak_speed:.1f}")])
+        if self.http_pool is not None:
+            http = self.http_pool.stats()
+            metric('nm_tube_http_requests_total', 'counter', "HTTP requests sent over the shared pool",
+                   [((), http['requests'])])
+            metric('nm_tube_http_connections_total', 'counter', "Pooled connections opened or reused",
+                   [((('outcome', 'opened'),), http['connections_opened']),
+                    ((('outcome', 'reused'),), http['connections_reused'])])
+            metric('nm_tube_http_connect_seconds_total', 'counter', "Time spent opening connections",
+                   [((), f"{http['connect_seconds']:.6f}")])
+            metric('nm_tube_http_connections_idle', 'gauge', "Keep-alive connections waiting for reuse",
+                   [((), http['idle'])])
+        if self.concurrency is not None:
+            state = self.concurrency.snapshot()
+            metric('nm_tube_concurrency_limit', 'gauge', "Transfers the adaptive controller allows at once",
+                   [((), state['limit'])])
+            metric('nm_tube_concurrency_active', 'gauge', "Transfers holding a concurrency slot",
+                   [((), state['active'])])
+            metric('nm_tube_concurrency_throughput_bytes_per_second', 'gauge',
+                   "Aggregate throughput over the controller's last window", [((), state['throughput'])])
+            metric('nm_tube_concurrency_decisions_total', 'counter', "Limit changes by direction",
+                   [((('direction', 'increase'),), state['totals']['increases']),
+                    ((('direction', 'decrease'),), state['totals']['decreases'])])
+            metric('nm_tube_attempt_errors_total', 'counter', "Failed download attempts seen by the controller",
+                   [((('kind', 'throttle'),), state['totals']['throttles']),
+                    ((('kind', 'error'),), state['totals']['errors'])])
+        if self.store is not None:
+            storage = self.store.stats()
+            metric('nm_tube_store_files', 'gauge', "Files recorded in the content store",
+                   [((), storage['files'])])
+            metric('nm_tube_store_bytes', 'gauge', "Size of recorded files, counting shared data once or per file",
+                   [((('view', 'stored'),), storage['stored_bytes']),
+                    ((('view', 'logical'),), storage['logical_bytes'])])
+            metric('nm_tube_store_hashed_bytes_total', 'counter', "Bytes hashed while written or read back",
+                   [((('source', 'stream'),), storage['streamed_bytes']),
+                    ((('source', 'read'),), storage['read_bytes'])])
+            metric('nm_tube_store_links_total', 'counter', "Duplicate files replaced by links",
+                   [((('kind', 'hard'),), storage['linked']),
+                    ((('kind', 'reflink'),), storage['reflinked'])])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        """Write the Prometheus text atomically, e.g. for node_exporter's textfile collector"""
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serve /metrics (Prometheus) and /metrics.json from a background thread"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = registry.to_json(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
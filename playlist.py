@@ -0,0 +1,389 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional
+
+from info_cache import InfoCache, extract_info, download_from_info
+from session_pool import YoutubeDLPool, get_default_pool
+from download_archive import DownloadArchive
+from content_store import ContentStore
+from journal import PlaylistJournal
+from format_selector import FormatTarget, SELECTED_FORMAT, select_format
+from transcode import downloaded_path
+from cancellation import DownloadCancelled, call_cancellable, iterate_cancellable
+from adaptive import AdaptiveConcurrency, Backoff, retry_call
+
+
+class PlaylistEntryResult:
+    """Outcome of downloading a single playlist entry"""
+
+    __slots__ = ('index', 'url', 'title', 'success', 'skipped', 'error', 'bytes', 'elapsed', 'retries',
+                 'linked', 'transcode')
+
+    def __init__(self, index: int, url: str, title: Optional[str] = None):
+        self.index = index
+        self.url = url
+        self.title = title
+        self.success = False
+        self.skipped = False
+        self.error: Optional[str] = None
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.retries = 0
+        # Already archived elsewhere, and linked into this playlist's folder
+        self.linked = False
+        # Pending conversion of the downloaded file, when a transcoder is used
+        self.transcode: Optional[Future] = None
+
+
+class PlaylistResult:
+    """Aggregated outcome of a concurrent playlist download
+
+    Counts, bytes and retries are totalled as entries are added. Every
+    entry's record is kept in entries as well, unless keep_entries is
+    False: then only failed ones are, so memory doesn't grow with the
+    length of a channel dump.
+    """
+
+    def __init__(self, title: str, entries: Optional[List[PlaylistEntryResult]] = None, elapsed: float = 0.0,
+                 keep_entries: bool = True):
+        self.title = title
+        self.elapsed = elapsed
+        self.keep_entries = keep_entries
+        self.entries: List[PlaylistEntryResult] = []
+        self.total = 0
+        self.n_succeeded = 0
+        self.n_skipped = 0
+        self.n_linked = 0
+        self.total_bytes = 0
+        self.retries = 0
+        for entry in entries or []:
+            self.add(entry)
+
+    def add(self, entry: PlaylistEntryResult):
+        self.total += 1
+        self.n_succeeded += entry.success
+        self.n_skipped += entry.skipped
+        self.n_linked += entry.linked
+        self.total_bytes += entry.bytes
+        self.retries += entry.retries
+        if self.keep_entries or not entry.success:
+            self.entries.append(entry)
+
+    @property
+    def n_failed(self) -> int:
+        return self.total - self.n_succeeded
+
+    @property
+    def succeeded(self) -> List[PlaylistEntryResult]:
+        return [e for e in self.entries if e.success]
+
+    @property
+    def failed(self) -> List[PlaylistEntryResult]:
+        return [e for e in self.entries if not e.success]
+
+    @property
+    def skipped(self) -> List[PlaylistEntryResult]:
+        return [e for e in self.entries if e.skipped]
+
+    @property
+    def linked(self) -> List[PlaylistEntryResult]:
+        return [e for e in self.entries if e.linked]
+
+    @property
+    def throughput(self) -> float:
+        """Average bytes per second across the whole run"""
+        return self.total_bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.n_succeeded - self.n_skipped}/{self.total} downloaded, "
+                f"{self.n_skipped} already archived{f' ({self.n_linked} linked)' if self.n_linked else ''}, "
+                f"{self.n_failed} failed, {self.total_bytes / 1024 / 1024:.1f} MB "
+                f"in {self.elapsed:.1f}s ({self.throughput / 1024 / 1024:.2f} MB/s)")
+
+
+# Flat extraction keeps entries as bare URLs instead of extracting every video
+RESOLVE_OPTIONS = {'quiet': True, 'extract_flat': 'in_playlist'}
+
+
+def _entry_record(index: int, entry: Dict) -> Dict:
+    return {
+        'index': index,
+        'id': entry.get('id'),
+        'url': entry.get('url') or entry.get('webpage_url') or entry.get('id'),
+        'title': entry.get('title'),
+    }
+
+
+def resolve_playlist(url: str, sessions: Optional[YoutubeDLPool] = None) -> Dict:
+    """Resolve playlist entries without extracting each video"""
+    sessions = sessions or get_default_pool()
+    with sessions.session(RESOLVE_OPTIONS) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    entries = [_entry_record(index, entry)
+               for index, entry in enumerate(info.get('entries') or [], start=1) if entry]
+    return {
+        'id': info.get('id'),
+        'title': info.get('title') or 'playlist',
+        'n_entries': len(entries),
+        'entries': entries,
+    }
+
+
+def stream_playlist(url: str, sessions: Optional[YoutubeDLPool] = None) -> Dict:
+    """Like resolve_playlist, but entries is a generator that fetches pages as it is consumed
+
+    Only the first page is requested up front, so the first entry can start
+    downloading while the rest of a long channel or playlist is still being
+    listed. n_entries is None when the site doesn't report the length.
+    The generator holds a pooled session until it is exhausted or closed.
+    """
+    sessions = sessions or get_default_pool()
+    with ExitStack() as stack:
+        ydl = stack.enter_context(sessions.session(RESOLVE_OPTIONS))
+        # process=False leaves the entries as the extractor's lazy pager
+        info = ydl.extract_info(url, download=False, process=False)
+        while info.get('_type') in ('url', 'url_transparent'):
+            info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'), process=False)
+        # Hand the borrowed session to the generator, which returns it when done
+        session = stack.pop_all()
+
+    def entries() -> Iterator[Dict]:
+        with session:
+            for index, entry in enumerate(info.get('entries') or [], start=1):
+                if entry:
+                    yield _entry_record(index, entry)
+
+    return {
+        'id': info.get('id'),
+        'title': info.get('title') or 'playlist',
+        'n_entries': info.get('playlist_count'),
+        'entries': entries(),
+    }
+
+
+def _playlist_fields(playlist: Dict, entry: Dict) -> Dict:
+    # Entries are extracted one by one, so the playlist fields used by
+    # the output template have to be supplied by hand
+    extra_info = {
+        'playlist': playlist['title'],
+        'playlist_title': playlist['title'],
+        'playlist_id': playlist['id'],
+        'playlist_index': entry['index'],
+    }
+    if playlist.get('n_entries'):
+        extra_info['n_entries'] = playlist['n_entries']
+    return extra_info
+
+
+def _link_archived(entry: Dict, extra_info: Dict, ydl_opts: Dict, sessions: YoutubeDLPool,
+                   archive: DownloadArchive, store: ContentStore, kind: str) -> bool:
+    """Link the archived file of an entry into this playlist's folder, if the store knows it"""
+    source = archive.filepath(entry.get('id'), kind)
+    if not source or not entry.get('title') or store.recorded_hash(source) is None:
+        return False
+    fields = {'id': entry['id'], 'title': entry['title'], 'ext': os.path.splitext(source)[1][1:], **extra_info}
+    with sessions.session(ydl_opts) as ydl:
+        path = ydl.prepare_filename(fields)
+    try:
+        return store.place(source, path) is not None
+    except OSError:
+        return False
+
+
+def _download_entry(playlist: Dict, entry: Dict, ydl_opts: Dict, progress_hooks: List[Callable],
+                    info_cache: Optional[InfoCache], sessions: YoutubeDLPool,
+                    cancel_event: Optional[threading.Event], archive: Optional[DownloadArchive],
+                    kind: str, target: Optional[FormatTarget],
+                    transcode: Optional[Callable[[str], Future]],
+                    concurrency: Optional[AdaptiveConcurrency],
+                    backoff: Optional[Backoff],
+                    store: Optional[ContentStore],
+                    journal: Optional[PlaylistJournal]) -> PlaylistEntryResult:
+    result = PlaylistEntryResult(entry['index'], entry['url'], entry.get('title'))
+    if cancel_event is not None and cancel_event.is_set():
+        result.error = "Cancelled"
+        return result
+    extra_info = _playlist_fields(playlist, entry)
+    # Flat entries already carry the ID and title, so this costs no request
+    if archive is not None and archive.is_downloaded(entry.get('id'), entry.get('title'), kind):
+        result.success = result.skipped = True
+        if store is not None:
+            # Mirrored playlists get the copy that is already on disk, not a gap
+            result.linked = _link_archived(entry, extra_info, ydl_opts, sessions, archive, store, kind)
+        return result
+
+    received: Dict[str, int] = {}
+
+    def count_bytes(d):
+        filename = d.get('filename') or ''
+        if d['status'] == 'finished':
+            received[filename] = d.get('total_bytes') or d.get('downloaded_bytes') or received.get(filename, 0)
+        elif d['status'] == 'downloading':
+            if journal is not None and filename not in received:
+                journal.downloading(entry['index'], d.get('tmpfilename') or filename)
+            received[filename] = d.get('downloaded_bytes') or 0
+
+    opts = dict(ydl_opts)
+    opts['progress_hooks'] = list(progress_hooks) + [count_bytes]
+    if concurrency is not None:
+        opts['progress_hooks'].append(concurrency.byte_counter())
+    def attempt():
+        info = call_cancellable(cancel_event, extract_info, entry['url'], info_cache, sessions)
+        if target is not None:
+            info = select_format(info, target).apply(info)
+            opts['format'] = SELECTED_FORMAT
+        slot = concurrency.slot(cancel_event) if concurrency is not None else nullcontext()
+        with slot, sessions.session(opts) as ydl:
+            return download_from_info(ydl, entry['url'], info, extra_info)
+
+    def on_retry(error, attempt_number, delay):
+        result.retries += 1
+        if concurrency is not None:
+            concurrency.record_error(error)
+
+    start = time.monotonic()
+    try:
+        # A throttled or dropped entry is retried on its own instead of failing
+        info = retry_call(attempt, backoff, cancel_event, on_retry) if backoff is not None else attempt()
+        if info:
+            result.title = info.get('title', result.title)
+        if concurrency is not None:
+            concurrency.record_success()
+        if transcode is not None:
+            # Blocks while the converter is saturated; the next download starts once queued
+            result.transcode = transcode(downloaded_path(info))
+            # The callback holds what the archive needs, not the whole info
+            video_id, title = info.get('id'), info.get('title')
+
+            def converted(f: Future):
+                if f.cancelled() or f.exception() is not None:
+                    return
+                # Recorded under the converted file's path, not the download it replaced
+                saved = {'id': video_id, 'title': title, 'requested_downloads': [{'filepath': f.result().target}]}
+                if store is not None:
+                    store.ingest_info(saved)
+                if archive is not None:
+                    archive.add_info(saved, kind)
+            result.transcode.add_done_callback(converted)
+        else:
+            if store is not None:
+                store.ingest_info(info)
+            if archive is not None:
+                archive.add_info(info, kind)
+        result.success = True
+    except Exception as e:
+        result.error = str(e)
+        if concurrency is not None and not isinstance(e, DownloadCancelled):
+            concurrency.record_error(e)
+    result.elapsed = time.monotonic() - start
+    result.bytes = sum(received.values())
+    return result
+
+
+def download_playlist_entries(playlist: Dict, ydl_opts: Dict, max_workers: int = 4,
+                              progress_hooks: Optional[List[Callable]] = None,
+                              on_entry_done: Optional[Callable[[PlaylistEntryResult], None]] = None,
+                              info_cache: Optional[InfoCache] = None,
+                              sessions: Optional[YoutubeDLPool] = None,
+                              cancel_event: Optional[threading.Event] = None,
+                              archive: Optional[DownloadArchive] = None,
+                              kind: str = 'video',
+                              target: Optional[FormatTarget] = None,
+                              transcode: Optional[Callable[[str], Future]] = None,
+                              concurrency: Optional[AdaptiveConcurrency] = None,
+                              backoff: Optional[Backoff] = None,
+                              store: Optional[ContentStore] = None,
+                              keep_entries: bool = True,
+                              journal: Optional[PlaylistJournal] = None) -> PlaylistResult:
+    """Download resolved playlist entries through a bounded worker pool
+
+    With a target, each entry's format is picked by transfer cost. transcode
+    (e.g. TranscodePipeline.submit) receives each downloaded file and
+    returns a Future; an entry is reported once its conversion finishes,
+    while the worker has already moved on to the next download. With a
+    concurrency controller, up to its maximum workers run but only its
+    current limit transfer at once; backoff retries transient entry errors.
+    With a content store, each finished entry is hashed and deduplicated
+    against the folder, and archived entries are linked in
+    from where they were first saved instead of being left out.
+
+    Each entry's info is dropped once the entry is done; with keep_entries
+    False its result record is too (see PlaylistResult), so memory stays
+    flat however long the playlist is.
+
+    With a journal, each entry's .part file and outcome are recorded, for
+    resuming the playlist after a crash (see PlaylistJournal.playlist).
+    """
+    hooks = progress_hooks or []
+    sessions = sessions or get_default_pool()
+    results = PlaylistResult(playlist['title'], keep_entries=keep_entries)
+    results_lock = threading.Lock()
+    workers = max(1, max_workers, concurrency.maximum if concurrency is not None else 0)
+    # Entries are pulled only a little ahead of the workers, so a streamed
+    # playlist is listed page by page while earlier entries download
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    # Entries whose file is still being converted; they are reported once it is
+    converting = 0
+    conversions_done = threading.Condition()
+
+    def complete(entry_result: PlaylistEntryResult):
+        if journal is not None:
+            journal.finished(entry_result.index, entry_result.success, entry_result.error)
+        with results_lock:
+            results.add(entry_result)
+        if on_entry_done:
+            on_entry_done(entry_result)
+
+    def converted(entry_result: PlaylistEntryResult, conversion: Future):
+        nonlocal converting
+        # Don't keep the finished conversion (and its callbacks) alive through the record
+        entry_result.transcode = None
+        if conversion.exception() is not None:
+            entry_result.success = False
+            entry_result.error = f"Transcoding failed: {conversion.exception()}"
+        try:
+            complete(entry_result)
+        finally:
+            with conversions_done:
+                converting -= 1
+                conversions_done.notify_all()
+
+    def finished(future):
+        nonlocal converting
+        entry_result = future.result()
+        slots.release()
+        if entry_result.transcode is None:
+            complete(entry_result)
+        else:
+            with conversions_done:
+                converting += 1
+            entry_result.transcode.add_done_callback(lambda f: converted(entry_result, f))
+
+    start = time.monotonic()
+    # A cancel shouldn't have to wait for the next page of a streamed playlist
+    entries = iterate_cancellable(playlist['entries'], cancel_event)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for entry in entries:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                slots.acquire()
+                pool.submit(_download_entry, playlist, entry, ydl_opts, hooks, info_cache, sessions,
+                            cancel_event, archive, kind, target, transcode,
+                            concurrency, backoff, store, journal).add_done_callback(finished)
+        except DownloadCancelled:
+            pass  # the caller reports it, as for a cancel between entries
+        finally:
+            # Stop listing a streamed playlist we won't finish
+            entries.close()
+
+    with conversions_done:
+        conversions_done.wait_for(lambda: converting == 0)
+    results.entries.sort(key=lambda r: r.index)
+    results.elapsed = time.monotonic() - start
+    return results
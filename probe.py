@@ -0,0 +1,174 @@
+import sys
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from info_cache import InfoCache, extract_info
+from session_pool import YoutubeDLPool, get_default_pool
+from format_selector import estimate_size
+from cancellation import DownloadCancelled, call_cancellable
+
+# Bits of a format's flags column
+HAS_VIDEO = 1
+HAS_AUDIO = 2
+SIZE_EXACT = 4
+
+_STRINGS = 4  # format_id, ext, vcodec, acodec
+_NUMBERS = 5  # height, fps, tbr (bit/s), size (-1 if unknown), flags
+
+
+class FormatRow(NamedTuple):
+    format_id: str
+    ext: Optional[str]
+    vcodec: Optional[str]
+    acodec: Optional[str]
+    height: int
+    fps: int
+    tbr: float
+    size: Optional[int]
+    size_exact: bool
+    has_video: bool
+    has_audio: bool
+
+
+def _intern(value) -> Optional[str]:
+    # Containers and codecs repeat across every video, so one copy of each is shared
+    return sys.intern(str(value)) if value is not None else None
+
+
+class FormatTable:
+    """Trimmed format list of one video, stored column-wise
+
+    Only what listing and format selection need is kept: no URLs, HTTP
+    headers or fragment lists. The strings of all formats share one tuple
+    (interned, so each distinct codec or container is stored once per
+    process) and the numbers one array of machine integers, instead of a
+    dict per format. Rows are built on access.
+    """
+
+    __slots__ = ('_strings', '_numbers')
+
+    def __init__(self, formats: Iterable[Dict], duration: Optional[float] = None):
+        strings: List[Optional[str]] = []
+        numbers: List[int] = []
+        for fmt in formats:
+            if not fmt.get('format_id') or fmt.get('ext') == 'mhtml':  # skip storyboards
+                continue
+            vcodec, acodec = fmt.get('vcodec'), fmt.get('acodec')
+            height = fmt.get('height') or 0
+            size = estimate_size(fmt, duration)
+            # Same rules as format_selector.FormatRecord
+            has_video = vcodec != 'none' and (vcodec is not None or bool(height) or acodec is None)
+            flags = ((HAS_VIDEO if has_video else 0) | (HAS_AUDIO if acodec != 'none' else 0)
+                     | (SIZE_EXACT if fmt.get('filesize') else 0))
+            strings += [_intern(fmt['format_id']), _intern(fmt.get('ext')), _intern(vcodec), _intern(acodec)]
+            numbers += [int(height), int(round(fmt.get('fps') or 0)), int((fmt.get('tbr') or 0) * 1000),
+                        -1 if size is None else size, flags]
+        self._strings = tuple(strings)
+        # Built from a list so the array is allocated at its exact size
+        self._numbers = array('q', numbers)
+
+    def __len__(self) -> int:
+        return len(self._numbers) // _NUMBERS
+
+    def __getitem__(self, index: int) -> FormatRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        s = self._strings[index * _STRINGS:(index + 1) * _STRINGS]
+        height, fps, tbr, size, flags = self._numbers[index * _NUMBERS:(index + 1) * _NUMBERS]
+        return FormatRow(s[0], s[1], s[2], s[3], height, fps, tbr / 1000, None if size < 0 else size,
+                         bool(flags & SIZE_EXACT), bool(flags & HAS_VIDEO), bool(flags & HAS_AUDIO))
+
+    def __iter__(self) -> Iterator[FormatRow]:
+        return (self[i] for i in range(len(self)))
+
+    def as_dicts(self) -> List[Dict]:
+        """yt-dlp style format dicts with only the trimmed fields, e.g. for select_format"""
+        formats = []
+        for row in self:
+            fmt = {'format_id': row.format_id, 'ext': row.ext, 'vcodec': row.vcodec, 'acodec': row.acodec,
+                   'height': row.height or None, 'fps': row.fps or None, 'tbr': row.tbr or None}
+            if row.size is not None:
+                fmt['filesize' if row.size_exact else 'filesize_approx'] = row.size
+            formats.append(fmt)
+        return formats
+
+
+class ProbeRecord:
+    """What a probe keeps of one URL: ID, title, duration and a FormatTable
+
+    error is set instead when the URL couldn't be probed.
+    """
+
+    __slots__ = ('url', 'id', 'title', 'duration', 'formats', 'error')
+
+    def __init__(self, url: str, id: Optional[str] = None, title: Optional[str] = None,
+                 duration: Optional[float] = None, formats: Optional[FormatTable] = None,
+                 error: Optional[str] = None):
+        self.url = url
+        self.id = id
+        self.title = title
+        self.duration = duration
+        self.formats = formats if formats is not None else FormatTable(())
+        self.error = error
+
+    @classmethod
+    def from_info(cls, url: str, info: Dict) -> 'ProbeRecord':
+        if info.get('_type', 'video') != 'video':
+            return cls(url, info.get('id'), info.get('title'), error=f"Not a single video ({info['_type']})")
+        duration = info.get('duration')
+        return cls(url, info.get('id'), info.get('title'), duration,
+                   FormatTable(info.get('formats') or [], duration))
+
+    def to_info(self) -> Dict:
+        """Minimal info dict for format_selector (FormatIndex, select_format)"""
+        return {'id': self.id, 'title': self.title, 'duration': self.duration, 'formats': self.formats.as_dicts()}
+
+    def to_dict(self) -> Dict:
+        return {'url': self.url, 'id': self.id, 'title': self.title, 'duration': self.duration,
+                'formats': self.formats.as_dicts(), 'error': self.error}
+
+
+def probe_url(url: str, info_cache: Optional[InfoCache] = None, sessions: Optional[YoutubeDLPool] = None,
+              cancel_event: Optional[threading.Event] = None) -> ProbeRecord:
+    """Extract url and keep only its ProbeRecord; extraction errors end up in record.error"""
+    try:
+        info = call_cancellable(cancel_event, extract_info, url, info_cache, sessions)
+    except DownloadCancelled:
+        raise
+    except Exception as e:
+        return ProbeRecord(url, error=str(e))
+    return ProbeRecord.from_info(url, info)
+
+
+def probe_many(urls: Iterable[str], max_workers: int = 8, info_cache: Optional[InfoCache] = None,
+               sessions: Optional[YoutubeDLPool] = None,
+               cancel_event: Optional[threading.Event] = None) -> Iterator[ProbeRecord]:
+    """Probe urls concurrently, yielding their records in input order
+
+    Only a couple of URLs per worker are read ahead, and each full info
+    dict is dropped as soon as its record is built, so memory stays
+    proportional to the records the caller keeps. A cancel stops reading
+    URLs and raises DownloadCancelled.
+    """
+    sessions = sessions or get_default_pool()
+    max_workers = max(1, max_workers)
+    pending: deque = deque()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nm-tube-probe') as pool:
+        try:
+            for url in urls:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise DownloadCancelled()
+                pending.append(pool.submit(probe_url, url, info_cache, sessions, cancel_event))
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # A caller that stops early doesn't wait for URLs it won't see
+            for future in pending:
+                future.cancel()
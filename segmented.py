@@ -0,0 +1,351 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+from adaptive import Backoff
+from cancellation import CancelToken, DownloadCancelled, abort_response
+from content_store import ContentHasher
+from http_pool import HTTPConnectionPool
+from metrics import DownloadMetrics
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSupported(Exception):
+    """The server ignored the Range header, so the file can't be split"""
+
+
+class SizeMismatch(RangeNotSupported):
+    """The server reports a different size than expected, so the segment plan can't be trusted"""
+
+
+def _content_range_total(response) -> Optional[int]:
+    content_range = response.headers.get('Content-Range', '')
+    total = content_range.rsplit('/', 1)[1] if '/' in content_range else ''
+    return int(total) if total.isdigit() else None
+
+
+class SegmentedDownload:
+    """Download a file over several ranged connections with resume
+
+    The size is always the total the server reports in Content-Range.
+    expected_size (e.g. the extractor's filesize) is only checked against
+    it: when they differ, SizeMismatch is raised before anything is written.
+
+    With hash_content, the content hash (see content_store) is computed from
+    the bytes as they are written and left in content_hash, so the finished
+    file never has to be read back.
+    """
+
+    def __init__(self, url: str, filename: str, expected_size: Optional[int] = None,
+                 connections: int = 4, segment_size: int = 4 * 1024 * 1024,
+                 headers: Optional[Dict[str, str]] = None,
+                 progress_hooks: Optional[List[Callable]] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 retries: int = 3, timeout: float = 30,
+                 http_pool: Optional[HTTPConnectionPool] = None,
+                 backoff: Optional[Backoff] = None,
+                 on_retry: Optional[Callable[[BaseException], None]] = None,
+                 hash_content: bool = False):
+        self.url = url
+        self.filename = filename
+        self.expected_size = expected_size
+        self.total_size: Optional[int] = None
+        self.connections = max(1, connections)
+        self.segment_size = segment_size
+        self.headers = headers or {}
+        self.progress_hooks = progress_hooks or []
+        self.cancel_event = cancel_event
+        self.retries = retries
+        self.timeout = timeout
+        self.http_pool = http_pool
+        # Jittered so throttled segments don't all come back at once
+        self.backoff = backoff or Backoff(retries)
+        self.on_retry = on_retry
+        self.hash_content = hash_content
+        self.content_hash: Optional[str] = None
+
+        self.part_filename = filename + '.part'
+        self.sidecar_filename = filename + '.part.segments'
+        self.downloaded_bytes = 0
+        self.retried = 0
+        self._resumed_bytes = 0
+        self._done: set = set()
+        self._in_flight: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._hasher: Optional[ContentHasher] = None
+        self._start = 0.0
+
+    def _request(self, headers: Dict[str, str]):
+        if self.http_pool is not None:
+            # Keep-alive: each worker's next segment reuses the connection of its last one
+            response = self.http_pool.request('GET', self.url, headers={**self.headers, **headers},
+                                              timeout=self.timeout)
+            if response.status >= 400:
+                response.close()
+                raise urllib.error.HTTPError(self.url, response.status, response.reason, response.headers, None)
+            return response
+        request = urllib.request.Request(self.url, headers={**self.headers, **headers})
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def probe_size(self) -> int:
+        """Ask for the first byte to learn the size and check range support"""
+        with self._request({'Range': 'bytes=0-0'}) as response:
+            total = _content_range_total(response)
+            if response.status != 206 or total is None:
+                raise RangeNotSupported(f"Server returned {response.status} for a ranged request")
+            return total
+
+    def segments(self) -> List[tuple]:
+        count = (self.total_size + self.segment_size - 1) // self.segment_size
+        return [(i, i * self.segment_size, min((i + 1) * self.segment_size, self.total_size) - 1)
+                for i in range(count)]
+
+    def _load_sidecar(self):
+        """Restore completed segments from an interrupted run of the same file"""
+        self._done = set()
+        if not (os.path.exists(self.sidecar_filename) and os.path.exists(self.part_filename)):
+            return
+        try:
+            with open(self.sidecar_filename, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (state.get('size') == self.total_size and state.get('segment_size') == self.segment_size
+                and os.path.getsize(self.part_filename) == self.total_size):
+            self._done = set(state.get('done', []))
+            # Sidecars from before hashing have no blocks; the file is hashed on disk then
+            if self._hasher is not None and not self._hasher.restore(state.get('blocks') or {}):
+                self._hasher = None
+
+    def _save_sidecar(self):
+        # Caller holds self._lock
+        tmp = self.sidecar_filename + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            state = {'url': self.url, 'size': self.total_size,
+                     'segment_size': self.segment_size, 'done': sorted(self._done)}
+            if self._hasher is not None:
+                state['blocks'] = self._hasher.block_digests()
+            json.dump(state, f)
+        os.replace(tmp, self.sidecar_filename)
+
+    def _preallocate(self):
+        mode = 'r+b' if os.path.exists(self.part_filename) else 'wb'
+        with open(self.part_filename, mode) as f:
+            f.truncate(self.total_size)
+
+    def _report(self, status: str = 'downloading'):
+        elapsed = time.monotonic() - self._start
+        speed = self.downloaded_bytes / elapsed if elapsed > 0 else None
+        remaining = self.total_size - self._resumed_bytes - self.downloaded_bytes
+        progress = {
+            'status': status,
+            'filename': self.filename,
+            'tmpfilename': self.part_filename,
+            'downloaded_bytes': self._resumed_bytes + self.downloaded_bytes,
+            'total_bytes': self.total_size,
+            'elapsed': elapsed,
+            'speed': speed,
+            'eta': remaining / speed if speed else None,
+        }
+        for hook in self.progress_hooks:
+            hook(progress)
+
+    def _cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _interruptible(self, response):
+        # Cancelling closes the connection, so a stalled read ends at once
+        if isinstance(self.cancel_event, CancelToken):
+            return self.cancel_event.interrupting(lambda: abort_response(response))
+        return nullcontext()
+
+    def _fetch_segment(self, f, index: int, start: int, end: int):
+        if self._cancelled():
+            raise DownloadCancelled()
+        with self._request({'Range': f'bytes={start}-{end}'}) as response, self._interruptible(response):
+            if response.status != 206:
+                raise RangeNotSupported(f"Server returned {response.status} for a ranged request")
+            total = _content_range_total(response)
+            if total != self.total_size:
+                # The file changed under us (or the server lies); the plan and the .part are wrong
+                raise SizeMismatch(f"Server reports {total} bytes in segment {start}-{end}, "
+                                   f"expected {self.total_size}")
+            f.seek(start)
+            position = start
+            while position <= end:
+                if self._cancelled():
+                    raise DownloadCancelled()
+                chunk = response.read(min(CHUNK_SIZE, end + 1 - position))
+                if not chunk:
+                    raise IOError(f"Connection closed at byte {position} of segment {start}-{end}")
+                f.write(chunk)
+                if self._hasher is not None:
+                    self._hasher.update(position, chunk)
+                position += len(chunk)
+                with self._lock:
+                    self.downloaded_bytes += len(chunk)
+                    self._in_flight[index] += len(chunk)
+                self._report()
+
+    def _worker(self, pending: List[tuple]):
+        with open(self.part_filename, 'r+b') as f:
+            while self._error is None:
+                with self._lock:
+                    if not pending:
+                        return
+                    index, start, end = pending.pop(0)
+                for attempt in range(self.retries + 1):
+                    self._in_flight[index] = 0
+                    try:
+                        self._fetch_segment(f, index, start, end)
+                        break
+                    except (DownloadCancelled, RangeNotSupported) as e:
+                        self._error = e
+                        return
+                    except Exception as e:
+                        if self._cancelled():
+                            # The read failed because cancelling closed the connection
+                            self._error = DownloadCancelled()
+                            return
+                        # Retry the whole segment; its partial bytes will be rewritten
+                        with self._lock:
+                            self.downloaded_bytes -= self._in_flight[index]
+                        if attempt == self.retries:
+                            self._error = e
+                            return
+                        with self._lock:
+                            self.retried += 1
+                        if self.on_retry is not None:
+                            self.on_retry(e)
+                        delay = self.backoff.delay(attempt, e)
+                        if self.cancel_event is not None:
+                            self.cancel_event.wait(delay)
+                        else:
+                            time.sleep(delay)
+                f.flush()
+                with self._lock:
+                    self._done.add(index)
+                    self._save_sidecar()
+
+    def run(self) -> str:
+        """Download the file and return its final path"""
+        self.total_size = self.probe_size()
+        if self.expected_size is not None and self.expected_size != self.total_size:
+            raise SizeMismatch(f"Server reports {self.total_size} bytes, metadata said {self.expected_size}")
+
+        if self.hash_content:
+            self._hasher = ContentHasher(self.total_size)
+        self._load_sidecar()
+        if isinstance(self.cancel_event, CancelToken):
+            self.cancel_event.add_partial(self.part_filename)
+        self._preallocate()
+        segments = self.segments()
+        pending = [s for s in segments if s[0] not in self._done]
+        self._resumed_bytes = sum(end - start + 1 for i, start, end in segments if i in self._done)
+        self._start = time.monotonic()
+
+        threads = [threading.Thread(target=self._worker, args=(pending,), daemon=True)
+                   for _ in range(min(self.connections, len(pending)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            # Completed segments stay recorded in the sidecar for resume
+            raise self._error
+
+        actual_size = os.path.getsize(self.part_filename)
+        if len(self._done) != len(segments) or actual_size != self.total_size:
+            raise IOError(f"Incomplete download: {actual_size} of {self.total_size} bytes")
+
+        if self._hasher is not None:
+            self.content_hash = self._hasher.hexdigest()
+        os.replace(self.part_filename, self.filename)
+        if os.path.exists(self.sidecar_filename):
+            os.remove(self.sidecar_filename)
+        self._report('finished')
+        return self.filename
+
+    def discard(self):
+        """Remove the .part file and sidecar, before another downloader takes over the file
+
+        The .part is preallocated to full length, so yt-dlp would take it for
+        a finished download and "resume" from its end.
+        """
+        for path in (self.part_filename, self.sidecar_filename, self.sidecar_filename + '.tmp'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def segmentable_format(info: Dict) -> bool:
+    """Whether processed info selected a single plain HTTP(S) file"""
+    return (not info.get('requested_formats') and bool(info.get('url'))
+            and info.get('protocol') in ('http', 'https'))
+
+
+def download_info_segmented(ydl, info: Dict, connections: int,
+                            progress_hooks: Optional[List[Callable]] = None,
+                            cancel_event: Optional[threading.Event] = None,
+                            metrics: Optional[DownloadMetrics] = None,
+                            http_pool: Optional[HTTPConnectionPool] = None,
+                            backoff: Optional[Backoff] = None,
+                            on_retry: Optional[Callable[[BaseException], None]] = None,
+                            extra_info: Optional[Dict] = None,
+                            hash_content: bool = False) -> Optional[Dict]:
+    """Select a format for info and fetch it in segments
+
+    Returns the processed info, or None when the selected format can't be
+    downloaded this way and the caller should use yt-dlp's downloader.
+    With hash_content, the file's content hash ends up in
+    requested_downloads[0]['content_hash'] (None if it had to be resumed
+    without one).
+    """
+    start = time.perf_counter()
+    processed = ydl.process_ie_result(info, download=False, extra_info=extra_info)
+    if metrics is not None:
+        metrics.add_phase('format_selection', time.perf_counter() - start)
+    if not processed or not segmentable_format(processed):
+        return None
+
+    filename = ydl.prepare_filename(processed)
+    processed['requested_downloads'] = [{'filepath': filename}]
+    processed['filepath'] = filename
+    if os.path.exists(filename):
+        return processed
+
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    download = SegmentedDownload(
+        processed['url'], filename,
+        expected_size=processed.get('filesize'),
+        connections=connections,
+        headers=processed.get('http_headers'),
+        progress_hooks=progress_hooks,
+        cancel_event=cancel_event,
+        http_pool=http_pool,
+        backoff=backoff,
+        on_retry=on_retry,
+        hash_content=hash_content,
+    )
+    if metrics is not None:
+        metrics.start_transfer()
+    try:
+        download.run()
+    except RangeNotSupported:
+        # Includes SizeMismatch; yt-dlp's downloader gets a clean start
+        download.discard()
+        return None
+    finally:
+        if metrics is not None:
+            metrics.retries += download.retried
+    processed['requested_downloads'][0]['content_hash'] = download.content_hash
+    return processed
@@ -0,0 +1,124 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from http_pool import HTTPConnectionPool
+
+# Hooks are bound per borrow so they don't split the pool by caller
+_PER_CALL_OPTIONS = ('progress_hooks', 'postprocessor_hooks')
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def new_youtube_dl(params: Dict):
+    # yt_dlp is imported on first use so importing this module stays cheap
+    import yt_dlp
+    return yt_dlp.YoutubeDL(params)
+
+
+def share_connections(ydl, http: HTTPConnectionPool):
+    """Send the instance's HTTP requests through the pool's shared connections"""
+    if hasattr(ydl, 'cookiejar'):
+        import http_handler
+        http_handler.install(ydl, http)
+
+
+def options_key(ydl_opts: Dict):
+    """Hashable key for an option set, ignoring per-call hooks"""
+    return _freeze({k: v for k, v in ydl_opts.items() if k not in _PER_CALL_OPTIONS})
+
+
+class YoutubeDLPool:
+    """Thread-safe pool of warm YoutubeDL instances keyed by their option set
+
+    All instances, and the segmented downloader, send their requests over
+    one keep-alive connection pool (self.http), so metadata and media
+    requests to the same hosts skip repeated TCP/TLS handshakes.
+    """
+
+    def __init__(self, factory: Optional[Callable[[Dict], object]] = None,
+                 max_idle_per_key: int = 8, http: Optional[HTTPConnectionPool] = None):
+        self.factory = factory or new_youtube_dl
+        self.max_idle_per_key = max_idle_per_key
+        self.http = http or HTTPConnectionPool()
+        self.created = 0
+        self.reused = 0
+        self._idle: Dict[object, List[object]] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self, ydl_opts: Dict):
+        key = options_key(ydl_opts)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return key, idle.pop()
+            self.created += 1
+
+        params = {k: v for k, v in ydl_opts.items() if k not in _PER_CALL_OPTIONS}
+        ydl = self.factory(params)
+        share_connections(ydl, self.http)
+        return key, ydl
+
+    def _release(self, key, ydl):
+        ydl._progress_hooks.clear()
+        ydl._postprocessor_hooks.clear()
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if not self._closed and len(idle) < self.max_idle_per_key:
+                idle.append(ydl)
+                return
+        ydl.close()
+
+    @contextmanager
+    def session(self, ydl_opts: Dict):
+        """Borrow a YoutubeDL configured with ydl_opts for the duration of the block"""
+        key, ydl = self._acquire(ydl_opts)
+        for hook in ydl_opts.get('progress_hooks') or []:
+            ydl.add_progress_hook(hook)
+        for hook in ydl_opts.get('postprocessor_hooks') or []:
+            ydl.add_postprocessor_hook(hook)
+        try:
+            yield ydl
+        except BaseException:
+            # An instance that failed mid-call may hold half-finished state
+            ydl._progress_hooks.clear()
+            ydl._postprocessor_hooks.clear()
+            ydl.close()
+            raise
+        else:
+            self._release(key, ydl)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            idle = sum(len(v) for v in self._idle.values())
+        return {'created': self.created, 'reused': self.reused, 'idle': idle}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+        for ydl in instances:
+            ydl.close()
+        self.http.close()
+
+
+_default_pool: Optional[YoutubeDLPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> YoutubeDLPool:
+    """Process-wide pool shared by the CLI and GUI"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = YoutubeDLPool()
+        return _default_pool
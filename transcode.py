@@ -0,0 +1,141 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+from cancellation import CancelToken, DownloadCancelled
+
+
+class TranscodeError(Exception):
+    """ffmpeg failed to convert a downloaded file"""
+
+
+class TranscodeResult:
+    def __init__(self, source: str, target: str, elapsed: float):
+        self.source = source
+        self.target = target
+        self.elapsed = elapsed
+
+
+def downloaded_path(info: Dict) -> Optional[str]:
+    """Path of the file yt-dlp (or the segmented downloader) wrote for processed info"""
+    downloads = info.get('requested_downloads') or [{}]
+    return downloads[-1].get('filepath') or info.get('filepath')
+
+
+def mp3_arguments(quality: str) -> list:
+    """ffmpeg arguments matching FFmpegExtractAudio's preferredquality for mp3"""
+    if quality == 'best':
+        return ['-codec:a', 'libmp3lame', '-q:a', '0']
+    value = float(quality)
+    if value < 10:
+        # 0-9 is a VBR quality level, lower is better
+        return ['-codec:a', 'libmp3lame', '-q:a', str(quality)]
+    return ['-codec:a', 'libmp3lame', '-b:a', f'{int(value)}k']
+
+
+def transcode_to_mp3(ffmpeg: str, source: str, quality: str = '5', keep_source: bool = False,
+                     cancel_event: Optional[threading.Event] = None) -> TranscodeResult:
+    """Convert source to an .mp3 next to it, replacing the source unless keep_source
+
+    Cancelling a CancelToken kills the ffmpeg process straight away.
+    """
+    start = time.monotonic()
+    target = os.path.splitext(source)[0] + '.mp3'
+    if source == target:
+        return TranscodeResult(source, target, 0.0)
+    if cancel_event is not None and cancel_event.is_set():
+        raise DownloadCancelled()
+    tmp = target + '.part'
+    command = [ffmpeg, '-y', '-nostdin', '-loglevel', 'error', '-i', source, '-vn',
+               *mp3_arguments(quality), '-f', 'mp3', tmp]
+    # stderr goes to a file rather than a pipe so a killed process is reaped at once
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr)
+        interrupt = (cancel_event.interrupting(process.kill) if isinstance(cancel_event, CancelToken)
+                     else nullcontext())
+        with interrupt:
+            process.wait()
+        stderr.seek(0)
+        output = stderr.read()
+    if process.returncode != 0:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled()
+        message = output.decode('utf-8', 'replace').strip().splitlines()
+        raise TranscodeError(message[-1] if message else f"ffmpeg exited with {process.returncode}")
+    os.replace(tmp, target)
+    if not keep_source:
+        os.remove(source)
+    return TranscodeResult(source, target, time.monotonic() - start)
+
+
+class TranscodePipeline:
+    """Second stage that converts finished downloads while the next ones download
+
+    Every conversion is its own ffmpeg process and at most max_workers (one
+    per core by default) run at once. submit() blocks while max_pending
+    files are already waiting or converting, so downloads slow down instead
+    of piling up unconverted files when the CPU is the bottleneck.
+    """
+
+    def __init__(self, ffmpeg: Optional[str] = None, max_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, keep_source: bool = False):
+        self.ffmpeg = ffmpeg or shutil.which('ffmpeg')
+        if not self.ffmpeg:
+            raise TranscodeError("ffmpeg was not found")
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+        self.keep_source = keep_source
+        self.converted = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='nm-tube-transcode')
+
+    def submit(self, source: str, quality: str = '5', cancel_event: Optional[threading.Event] = None) -> Future:
+        """Queue source for conversion; the Future resolves to a TranscodeResult
+
+        Setting cancel_event stops the wait for a slot or kills the running ffmpeg.
+        """
+        start = time.monotonic()
+        while not self._slots.acquire(timeout=0.1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+        waited = time.monotonic() - start
+        with self._lock:
+            self.blocked_seconds += waited
+        try:
+            future = self._executor.submit(transcode_to_mp3, self.ffmpeg, source, quality, self.keep_source,
+                                           cancel_event)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: Future):
+        self._slots.release()
+        with self._lock:
+            if future.exception() is None:
+                self.converted += 1
+                self.busy_seconds += future.result().elapsed
+            elif not isinstance(future.exception(), DownloadCancelled):
+                self.failed += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'converted': self.converted, 'failed': self.failed,
+                    'busy_seconds': round(self.busy_seconds, 3),
+                    'blocked_seconds': round(self.blocked_seconds, 3)}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,61 @@
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, Optional
+
+from info_cache import PROBE_OPTIONS
+from session_pool import YoutubeDLPool, get_default_pool
+
+
+def probe_ffmpeg() -> Optional[str]:
+    """Return the first line of `ffmpeg -version`, or None if ffmpeg is unusable"""
+    path = shutil.which('ffmpeg')
+    if not path:
+        return None
+    try:
+        output = subprocess.run([path, '-version'], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.splitlines()[0] if output else path
+
+
+class Warmup:
+    """Loads yt-dlp and probes ffmpeg on a background thread"""
+
+    def __init__(self, sessions: Optional[YoutubeDLPool] = None):
+        self.sessions = sessions or get_default_pool()
+        self.ffmpeg_path: Optional[str] = None
+        self.ffmpeg_version: Optional[str] = None
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def start(self, on_done: Optional[Callable[['Warmup'], None]] = None) -> 'Warmup':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(on_done,), daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _run(self, on_done):
+        start = time.monotonic()
+        try:
+            # Leave a warm probe session in the pool with the YouTube extractor loaded
+            with self.sessions.session(PROBE_OPTIONS) as ydl:
+                ydl.get_info_extractor('Youtube')
+            self.ffmpeg_path = shutil.which('ffmpeg')
+            self.ffmpeg_version = probe_ffmpeg()
+        except Exception as e:
+            self.error = str(e)
+        self.elapsed = time.monotonic() - start
+        self._done.set()
+        if on_done:
+            on_done(self)